@@ -0,0 +1,24 @@
+import math
+from typing import Tuple
+
+
+def wilson_interval(hits: int, total: int, z: float = 1.96) -> Tuple[float, float]:
+    """计算准确率的 Wilson 置信区间
+
+    Args:
+        hits (int): 命中数量
+        total (int): 已评测数量
+        z (float, optional): 正态分布分位数，1.96 对应 95% 置信度. Defaults to 1.96.
+
+    Returns:
+        Tuple[float, float]: 置信区间的下界与上界
+    """
+    if total <= 0:
+        return 0.0, 1.0
+
+    p = hits / total
+    denominator = 1 + z**2 / total
+    center = (p + z**2 / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z**2 / (4 * total**2)) / denominator
+
+    return max(0.0, center - margin), min(1.0, center + margin)
@@ -0,0 +1,130 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+
+from .failure_sampler import approx_token_count
+
+
+class FailureCaseCompressor:
+    """在渲染梯度与改写 prompt 之前，用 SelectiveContext 压缩 failure case 中的用户输入
+
+    只压缩测试数据的 input 字段，期望结果与模型输出保持原样，不影响梯度对错误的判断。
+    少于 min_tokens 的输入不做压缩（短句删掉几个词就可能改变含义），
+    压缩结果按原文缓存，同一条数据在之后的 epoch 中再次出错时不会重复计算。
+    pop_stats 返回并清空自上次调用以来的输入 token 数与压缩耗时，用于按 epoch 汇报。
+    """
+
+    def __init__(
+        self,
+        selective_context,
+        reduce_ratio: float = 0.35,
+        reduce_level: str = "phrase",
+        min_tokens: int = 32,
+        token_counter: Callable[[str], int] = approx_token_count,
+        cache_size: int = 4096,
+    ):
+        """
+        :param selective_context: SelectiveContext 或其他提供 compress_batch(contexts, reduce_ratio,
+                                  reduce_level) 方法的压缩器
+        :param reduce_ratio:      float    删除的比例
+        :param reduce_level:      str      删除的粒度，phrase、sentence 或 token
+        :param min_tokens:        int      输入的 token 数少于该值时不压缩
+        :param token_counter:     Callable 计算 token 数量的函数，默认按字符数估计
+        :param cache_size:        int      缓存的压缩结果数量
+        """
+        if reduce_level not in ["phrase", "sentence", "token"]:
+            raise ValueError(
+                f"reduce_level should be one of ['sentence', 'phrase', 'token'], got {reduce_level}"
+            )
+
+        self.selective_context = selective_context
+        self.reduce_ratio = reduce_ratio
+        self.reduce_level = reduce_level
+        self.min_tokens = min_tokens
+        self.token_counter = token_counter
+        self.cache_size = cache_size
+
+        self.__lock = threading.Lock()
+        self.__cache: "OrderedDict[str, str]" = OrderedDict()
+        self.__stats = self.__empty_stats()
+
+    def compress(self, texts: List[str]) -> List[str]:
+        """
+        压缩一组输入，未命中缓存的输入一起调用一次 compress_batch
+        :param texts: List[str] 输入文本
+        :return List[str] 与 texts 顺序一致的压缩结果，压缩结果为空时保留原文
+        """
+        start = time.perf_counter()
+        results: List[str] = list(texts)
+        pending: "OrderedDict[str, List[int]]" = OrderedDict()
+        cache_hits = 0
+
+        with self.__lock:
+            for pos, text in enumerate(texts):
+                if self.token_counter(text) < self.min_tokens:
+                    continue
+                if text in self.__cache:
+                    self.__cache.move_to_end(text)
+                    results[pos] = self.__cache[text]
+                    cache_hits += 1
+                else:
+                    pending.setdefault(text, []).append(pos)
+
+        if pending:
+            compressed = self.selective_context.compress_batch(
+                list(pending), reduce_ratio=self.reduce_ratio, reduce_level=self.reduce_level
+            )
+            with self.__lock:
+                for (text, positions), (_, masked) in zip(pending.items(), compressed):
+                    masked = masked.strip() or text
+                    for pos in positions:
+                        results[pos] = masked
+                    self.__cache[text] = masked
+                    self.__cache.move_to_end(text)
+                while len(self.__cache) > self.cache_size:
+                    self.__cache.popitem(last=False)
+
+        raw_tokens = sum(self.token_counter(text) for text in texts)
+        compressed_tokens = sum(self.token_counter(text) for text in results)
+        with self.__lock:
+            self.__stats["n_inputs"] += len(texts)
+            self.__stats["n_compressed"] += sum(
+                result != text for text, result in zip(texts, results)
+            )
+            self.__stats["cache_hits"] += cache_hits
+            self.__stats["raw_tokens"] += raw_tokens
+            self.__stats["compressed_tokens"] += compressed_tokens
+            self.__stats["seconds"] += time.perf_counter() - start
+
+        return results
+
+    def pop_stats(self) -> dict:
+        """
+        返回并清空累计的统计
+        :return dict n_inputs、n_compressed、cache_hits、raw_tokens、compressed_tokens、
+                     saved_tokens、saved_ratio 与 seconds（压缩耗时）
+        """
+        with self.__lock:
+            stats, self.__stats = self.__stats, self.__empty_stats()
+
+        stats["saved_tokens"] = stats["raw_tokens"] - stats["compressed_tokens"]
+        stats["saved_ratio"] = (
+            stats["saved_tokens"] / stats["raw_tokens"] if stats["raw_tokens"] else 0.0
+        )
+        return stats
+
+    """
+    工具函数区域
+    """
+
+    @staticmethod
+    def __empty_stats() -> dict:
+        return {
+            "n_inputs": 0,
+            "n_compressed": 0,
+            "cache_hits": 0,
+            "raw_tokens": 0,
+            "compressed_tokens": 0,
+            "seconds": 0.0,
+        }
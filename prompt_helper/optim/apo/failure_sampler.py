@@ -0,0 +1,114 @@
+import math
+import random
+from typing import Callable, Dict, List, Optional
+
+
+def approx_token_count(text: str) -> int:
+    """粗略估计文本的 token 数量（约 4 个字符对应 1 个 token）
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        int: 估计的 token 数量
+    """
+    return math.ceil(len(text) / 4)
+
+
+class FailureCaseSampler:
+    """按 token 预算打包 failure case 的采样器
+
+    按 failure 的 reason 分层（no_hit 与解析错误等其他原因），各层轮流取样，
+    直到放不下为止，保证梯度 prompt 的长度与数据集大小无关。
+    """
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        max_cases: Optional[int] = None,
+        token_counter: Callable[[str], int] = approx_token_count,
+        seed: Optional[int] = None,
+    ):
+        """
+        :param token_budget:  int      每个 minibatch 的 token 预算，为 None 时不限制
+        :param max_cases:     int      每个 minibatch 的最大 case 数量，为 None 时不限制
+        :param token_counter: Callable 计算 token 数量的函数，默认按字符数估计
+        :param seed:          int      随机种子
+        """
+        self.token_budget = token_budget
+        self.max_cases = max_cases
+        self.token_counter = token_counter
+        self.rng = random.Random(seed)
+
+    def sample(
+        self, test_dataset: List[dict], failure_cases: List[dict], n_batches: int = 1
+    ) -> List[List[dict]]:
+        """采样 n_batches 个 minibatch
+
+        Args:
+            test_dataset (List[dict]): 测试数据集
+            failure_cases (List[dict]): failure case 列表
+            n_batches (int, optional): minibatch 数量. Defaults to 1.
+
+        Returns:
+            List[List[dict]]: minibatch 列表，单个 case 超出预算时该 minibatch 只包含最短的 case
+        """
+        strata: Dict[str, List[dict]] = {}
+        for case in failure_cases:
+            strata.setdefault(self.__stratum(case), []).append(case)
+
+        costs: Dict[int, int] = {
+            id(case): self.token_counter(
+                format_failure_case(test_dataset, case, len(failure_cases))
+            )
+            for case in failure_cases
+        }
+
+        return [self.__sample_batch(strata, costs) for _ in range(n_batches)]
+
+    """
+    工具函数区域
+    """
+
+    @staticmethod
+    def __stratum(case: dict) -> str:
+        return "no_hit" if case.get("reason") == "no_hit" else "error"
+
+    def __sample_batch(self, strata: Dict[str, List[dict]], costs: Dict[int, int]) -> List[dict]:
+        queues: List[List[dict]] = []
+        for name in sorted(strata):
+            queue = list(strata[name])
+            self.rng.shuffle(queue)
+            queues.append(queue)
+
+        batch: List[dict] = []
+        used_tokens = 0
+
+        # 各层轮流取样，放不下的 case 直接跳过，继续尝试更短的 case
+        while any(queues):
+            for queue in queues:
+                if not queue:
+                    continue
+                if self.max_cases is not None and len(batch) >= self.max_cases:
+                    return batch
+
+                case = queue.pop()
+                cost = costs[id(case)]
+                if self.token_budget is None or used_tokens + cost <= self.token_budget:
+                    batch.append(case)
+                    used_tokens += cost
+
+        if not batch and costs:
+            batch.append(
+                min(
+                    (case for cases in strata.values() for case in cases),
+                    key=lambda case: costs[id(case)],
+                )
+            )
+
+        return batch
+
+
+def format_failure_case(test_dataset: List[dict], case: dict, number: int) -> str:
+    """按 APOPromptOptimizer 的 failure case 格式渲染单个 case，用于估计其 token 数量"""
+    return f"case {number}: user: {test_dataset[case['idx']]}\n{case['result']}\n"
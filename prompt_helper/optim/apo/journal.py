@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Any, List
+
+
+class RunJournal:
+    """追加写入的运行日志（JSONL），用于断点续跑
+
+    每条记录包含 step 与 phase 两个字段，其余字段由调用方决定。
+    每次写入后立即 flush 并 fsync，进程崩溃时最多丢失正在写入的一行。
+    第一条记录是 phase 为 header 的运行输入指纹，见 check_fingerprint。
+    """
+
+    file_name: str = "journal.jsonl"
+
+    def __init__(self, run_dir: str):
+        """
+        :param run_dir: str 运行目录，日志写入 run_dir/journal.jsonl
+        """
+        os.makedirs(run_dir, exist_ok=True)
+        self.path: str = os.path.join(run_dir, self.file_name)
+        self.__lock = threading.Lock()
+
+    def append(self, record: dict):
+        """
+        追加一条记录
+        :param record: dict 需要写入的记录，必须可以被 JSON 序列化
+        """
+        line = json.dumps(record, ensure_ascii=False)
+
+        with self.__lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def fingerprint(**inputs: Any) -> str:
+        """
+        计算运行输入的指纹
+        :param inputs: 运行输入，必须可以被 JSON 序列化
+        :return str 指纹
+        """
+        payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def check_fingerprint(self, fingerprint: str):
+        """
+        新的日志写入指纹作为 header；已有日志的指纹不一致时拒绝续跑
+        :param fingerprint: str 本次运行输入的指纹，见 fingerprint
+        :raise ValueError 日志由输入不同的运行写入
+        """
+        records: List[dict] = self.load()
+        if not records:
+            self.append({"step": 0, "phase": "header", "fingerprint": fingerprint})
+            return
+
+        header: dict = records[0]
+        if header["phase"] == "header" and header["fingerprint"] != fingerprint:
+            raise ValueError(
+                f"{self.path} was written by a run with a different prompt, test_dataset or "
+                "model, use another run_dir"
+            )
+
+    def load(self) -> List[dict]:
+        """
+        读取全部记录，崩溃时写了一半的最后一行会被忽略
+        :return List[dict] 按写入顺序排列的记录
+        """
+        if not os.path.exists(self.path):
+            return []
+
+        records: List[dict] = []
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+
+        return records
@@ -1,19 +1,73 @@
+import os
 import json
-from typing import List
+import math
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 import tqdm
 from loguru import logger
 
-from .meta_prompt import apo_meta_prompt, apo_refine_meta_prompt
+from .adaptive_eval import wilson_interval
+from .failure_compressor import FailureCaseCompressor
+from .failure_sampler import FailureCaseSampler
+from .journal import RunJournal
+from .meta_prompt import apo_meta_prompt, apo_refine_meta_prompt, packed_eval_meta_prompt
 from ..abs_optimizer import ABSPromptOptimizer
+from ..stop_criterion import AccuracyStopCriterion
 from ..stop_criterion.abs_stop_criterion import ABSStopCriterion
 from prompt_helper.utils.common import Consoler
-from prompt_helper.utils.llms.server import ABSLLMServer
+from prompt_helper.utils.llms.server import ABSLLMServer, LLMResponse, LLMServerError
+from prompt_helper.utils.metrics import REGISTRY, MetricsRegistry
 
 
 class APOPromptOptimizer(ABSPromptOptimizer):
-    def __init__(self, llm_server: ABSLLMServer = None):
+    def __init__(
+        self,
+        llm_server: ABSLLMServer = None,
+        metrics: Optional[MetricsRegistry] = None,
+        executor=None,
+        compressor: Optional[FailureCaseCompressor] = None,
+    ):
+        """
+        :param llm_server: ABSLLMServer    LLM 服务
+        :param metrics:    MetricsRegistry 指标注册表，为 None 时使用全局的 REGISTRY；
+                                           记录各阶段耗时 apo_phase_seconds{phase}、
+                                           完成的 epoch 数 apo_epochs_total 与评测行数 apo_eval_rows_total
+        :param executor:   评测执行器，需要提供 eval_rows(prompt, test_dataset, indices) 方法，
+                           例如 RayEvalExecutor；设置后 eval、eval_adaptive 与 run 的评测都交给它完成，
+                           max_workers 参数不再生效；为 None 时在本进程内评测
+        :param compressor: FailureCaseCompressor 设置后 failure case 中的用户输入先压缩再放入
+                                                 梯度与改写 prompt 的请求，每个 epoch 的输入 token
+                                                 节省与耗时见 compression_reports
+        """
         self.__llm_server = llm_server
+        self.__executor = executor
+        self.__compressor = compressor
+        self.__compression_reports: List[dict] = []
+        # beam 模式下所有扩展共享的评测线程池与并发请求数限制，其他时候为 None
+        self.__shared_pool: Optional[ThreadPoolExecutor] = None
+        self.__call_slots: Optional[threading.BoundedSemaphore] = None
+
+        metrics = metrics if metrics is not None else REGISTRY
+        self.__phase_seconds = metrics.histogram("apo_phase_seconds", "APO phase latency")
+        self.__epochs = metrics.counter("apo_epochs_total", "APO completed epochs")
+        self.__eval_rows_total = metrics.counter("apo_eval_rows_total", "APO evaluated rows")
+        self.__packed_fallbacks = metrics.counter(
+            "apo_packed_fallbacks_total", "APO packed eval items re-evaluated one by one"
+        )
+        self.__failure_tokens = metrics.counter(
+            "apo_failure_input_tokens_total",
+            "APO failure case input tokens before / after compression",
+        )
+
+    def __generate(self, **kwargs):
+        """调用 LLM 服务，beam 模式下同时进行的请求数不超过 max_workers"""
+        if self.__call_slots is None:
+            return self.__llm_server.generate(**kwargs)
+        with self.__call_slots:
+            return self.__llm_server.generate(**kwargs)
 
     def __generate_gradient(
         self, prompt: str, failure_case: str, n_reasons: int = 2, model: str = ""
@@ -27,7 +81,7 @@ class APOPromptOptimizer(ABSPromptOptimizer):
             model (str, optional): 调用的模型. Defaults to "".
 
         Raises:
-            Exception: _description_
+            LLMServerError: LLM 调用失败
 
         Returns:
             str: _description_
@@ -39,7 +93,7 @@ class APOPromptOptimizer(ABSPromptOptimizer):
             .replace("{{n_reasons}}", str(n_reasons))
         )
         # logger.info(apo_prompt_replaced)
-        resp = self.__llm_server.generate(
+        resp = self.__generate(
             prompt=apo_prompt_replaced,
             stream=False,
             temperature=0.0,
@@ -47,13 +101,7 @@ class APOPromptOptimizer(ABSPromptOptimizer):
             model=model,
         )
 
-        if resp["code"] == 0:
-            raise Exception(resp)
-
-        resp_dict: dict = json.loads(resp["data"])
-        gradient: str = resp_dict["data"]["choices"][0]["message"]["content"]
-
-        return gradient
+        return self.__get_content(resp)
 
     def __generate_new_prompt(
         self,
@@ -70,6 +118,7 @@ class APOPromptOptimizer(ABSPromptOptimizer):
         :param gradient:     str
         :param max_tokens:   int
         :param model:        str
+        :raise LLMServerError LLM 调用失败
         """
         apo_refine_prompt_replaced = (
             apo_refine_meta_prompt.replace("{{prompt}}", prompt)
@@ -78,7 +127,7 @@ class APOPromptOptimizer(ABSPromptOptimizer):
             .replace("{{gradient}}", gradient)
         )
         # logger.info(apo_refine_prompt_replaced)
-        resp = self.__llm_server.generate(
+        resp = self.__generate(
             prompt=apo_refine_prompt_replaced,
             stream=False,
             temperature=0.0,
@@ -86,10 +135,29 @@ class APOPromptOptimizer(ABSPromptOptimizer):
             model=model,
         )
 
-        resp_dict: dict = json.loads(resp["data"])
-        new_prompt: str = resp_dict["data"]["choices"][0]["message"]["content"]
+        return self.__get_content(resp)
+
+    @staticmethod
+    def __get_content(resp: LLMResponse) -> str:
+        """
+        从 LLM 服务的返回值中取出生成的文本
+        :param resp: LLMResponse generate 的返回值，兼容旧的 {"code", "msg", "data"} 字典
+        :raise LLMServerError 调用失败（code 为 0）或返回值无法解析
+        :return str 生成的文本
+        """
+        try:
+            resp = LLMResponse.coerce(resp)
+        except (ValueError, KeyError, IndexError, TypeError) as error:
+            raise LLMServerError(f"invalid response: {error}", retryable=False) from error
 
-        return new_prompt
+        if not resp.ok:
+            raise LLMServerError(
+                resp.msg,
+                status_code=resp.status,
+                retryable=resp.retryable,
+                retry_after=resp.retry_after,
+            )
+        return resp.content
 
     def __make_failure_case_str(self, test_dataset: List[dict], failure_cases: List[dict]) -> str:
         """
@@ -99,14 +167,50 @@ class APOPromptOptimizer(ABSPromptOptimizer):
         :return str 返回 failure case 字符串格式
         """
         failure_case_str = ""
+        rows: List[dict] = [test_dataset[case["idx"]] for case in failure_cases]
+        if self.__compressor is not None and rows:
+            with self.__phase_seconds.time(phase="compress"):
+                inputs: List[str] = self.__compressor.compress([row["input"] for row in rows])
+            rows = [{**row, "input": text} for row, text in zip(rows, inputs)]
 
-        for idx, case in enumerate(failure_cases):
-            failure_case_str += (
-                f"case {idx + 1}: user: {test_dataset[case['idx']]}\n{case['result']}\n"
-            )
+        for idx, (case, row) in enumerate(zip(failure_cases, rows)):
+            failure_case_str += f"case {idx + 1}: user: {row}\n{case['result']}\n"
 
         return failure_case_str
 
+    def compression_reports(self) -> List[dict]:
+        """
+        最近一次 run 中每个 epoch 的 failure case 压缩报告，没有设置 compressor 时为空
+        :return List[dict] 每项包含 step、FailureCaseCompressor.pop_stats 的统计（输入 token 数、
+                           节省比例、压缩耗时 seconds），以及 gradient_seconds 与 new_prompt_seconds
+                           （该 epoch 生成梯度与新 prompt 的总耗时，生成梯度的耗时包含压缩）
+        """
+        return list(self.__compression_reports)
+
+    def __report_compression(
+        self, step: int, gradient_seconds: float, new_prompt_seconds: float
+    ) -> Optional[dict]:
+        """汇总一个 epoch 的压缩统计，记录指标与日志"""
+        if self.__compressor is None:
+            return None
+
+        report: dict = {
+            "step": step,
+            **self.__compressor.pop_stats(),
+            "gradient_seconds": gradient_seconds,
+            "new_prompt_seconds": new_prompt_seconds,
+        }
+        self.__compression_reports.append(report)
+        self.__failure_tokens.inc(report["raw_tokens"], kind="raw")
+        self.__failure_tokens.inc(report["compressed_tokens"], kind="compressed")
+        logger.info(
+            f"epoch-{step} | failure input tokens: {report['raw_tokens']} -> "
+            f"{report['compressed_tokens']} (-{report['saved_ratio']:.1%}) | "
+            f"compress: {report['seconds']:.3f}s | gradient: {gradient_seconds:.3f}s | "
+            f"new prompt: {new_prompt_seconds:.3f}s"
+        )
+        return report
+
     def run(
         self,
         model: str,
@@ -116,49 +220,191 @@ class APOPromptOptimizer(ABSPromptOptimizer):
         n_reasons: int = 5,
         max_tokens: int = 1500,
         is_debug: bool = False,
+        max_workers: int = 1,
+        beam_width: int = 1,
+        n_expansions: int = 4,
+        minibatch_size: int = 4,
+        seed: Optional[int] = None,
+        eval_mode: str = "full",
+        failure_token_budget: Optional[int] = None,
+        n_gradient_batches: int = 1,
+        run_dir: Optional[str] = None,
+        pack_size: int = 1,
     ):
         """
-        :param is_debug:     bool       是否打开 debug，默认为 False
+        :param is_debug:       bool       是否打开 debug，默认为 False
+        :param max_workers:    int        评测时的并发请求数，默认为 1（串行执行）
+        :param beam_width:     int        beam 宽度，大于 1 时使用 beam search 模式
+        :param n_expansions:   int        beam 模式下每个 prompt 扩展出的候选数
+        :param minibatch_size: int        beam 模式下每次扩展采样的 failure case 数量
+        :param seed:           int        随机种子，用于 beam 模式采样 failure case 与自适应评测采样
+        :param eval_mode:      str        评测模式，full 为全量评测，adaptive 为自适应采样评测
+        :param failure_token_budget: int  每个梯度请求中 failure case 的 token 预算，为 None 时
+                                          使用全部 failure case（beam 模式下仍受 minibatch_size 限制）
+        :param n_gradient_batches:   int  设置 token 预算时，并发生成梯度的 minibatch 数量
+        :param run_dir:              str  运行目录，设置后每个 epoch 的结果会追加写入
+                                          run_dir/journal.jsonl，再次运行时从最后完成的阶段继续；
+                                          model、prompt 与 test_dataset 与写入日志的运行不同时
+                                          抛出 ValueError。beam 模式只在 epoch 结束时记录，
+                                          epoch 中途中断时该 epoch 的扩展会全部重新生成
+        :param pack_size:            int  评测时每个请求打包的数据量，见 eval
         """
+        if eval_mode not in ["full", "adaptive"]:
+            raise ValueError(f"eval_mode should be one of ['full', 'adaptive'], got {eval_mode}")
+        if n_gradient_batches < 1:
+            raise ValueError(f"n_gradient_batches should be positive, got {n_gradient_batches}")
+
+        target_accuracy: Optional[float] = self.__get_target_accuracy(stop_criterions)
+        self.__compression_reports = []
+        journal: Optional[RunJournal] = RunJournal(run_dir) if run_dir else None
+        if journal is not None:
+            journal.check_fingerprint(
+                RunJournal.fingerprint(model=model, prompt=prompt, test_dataset=test_dataset)
+            )
+        failure_sampler = FailureCaseSampler(token_budget=failure_token_budget, seed=seed)
+
+        if beam_width > 1:
+            return self.__run_beam(
+                model=model,
+                prompt=prompt,
+                test_dataset=test_dataset,
+                stop_criterions=stop_criterions,
+                n_reasons=n_reasons,
+                max_tokens=max_tokens,
+                max_workers=max_workers,
+                beam_width=beam_width,
+                n_expansions=n_expansions,
+                minibatch_size=minibatch_size,
+                seed=seed,
+                eval_mode=eval_mode,
+                failure_sampler=FailureCaseSampler(
+                    token_budget=failure_token_budget, max_cases=minibatch_size, seed=seed
+                ),
+                journal=journal,
+                pack_size=pack_size,
+            )
 
         is_stop_flag: bool = False
         stop_reason: str = ""
         step: int = 0
+        incumbent_accuracy: Optional[float] = None
         failure_cases = [
             {"idx": idx, "result": data["output"], "reason": ""}
             for idx, data in enumerate(test_dataset)
         ]
 
+        # 从运行日志恢复最后一个完成的 epoch，以及下一个 epoch 中已经完成的阶段
+        finished_phases: Dict[str, dict] = {}
+        if journal is not None:
+            records: List[dict] = journal.load()
+            completed = [record for record in records if record["phase"] == "eval"]
+            if completed:
+                last: dict = completed[-1]
+                step = last["step"]
+                prompt = last["prompt"]
+                failure_cases = last["failure_cases"]
+                incumbent_accuracy = last["incumbent_accuracy"]
+                self.__load_stop_criterions(stop_criterions, last["stop_criterions"])
+                logger.info(f"resume from epoch-{step} | run_dir: {run_dir}")
+
+                if last["stop_reason"]:
+                    return {"prompt": prompt, "step": step, "stop_reason": last["stop_reason"]}
+
+            finished_phases = {
+                record["phase"]: record for record in records if record["step"] == step + 1
+            }
+
         while True:
             step += 1
+            gradient_seconds: float = 0.0
+            new_prompt_seconds: float = 0.0
 
             Consoler.print_in_panel(f"epoch-{step}: 生成梯度", title="APO 自动 prompt")
-            failure_case_str: str = self.__make_failure_case_str(test_dataset, failure_cases)
-            gradient: str = self.__generate_gradient(
-                prompt=apo_meta_prompt,
-                failure_case=failure_case_str,
-                n_reasons=n_reasons,
-                model=model,
-            )
+            if "gradient" in finished_phases:
+                record: dict = finished_phases["gradient"]
+                gradient: str = record["gradient"]
+                if "example_cases" in record:
+                    # 与首次运行一样经过压缩器，压缩报告中不会缺少这个 epoch
+                    with self.__phase_seconds.time(phase="gradient") as timer:
+                        failure_case_str: str = self.__make_failure_case_str(
+                            test_dataset, record["example_cases"]
+                        )
+                    gradient_seconds = timer.elapsed
+                else:
+                    failure_case_str = record["failure_case_str"]
+            else:
+                with self.__phase_seconds.time(phase="gradient") as timer:
+                    example_cases, failure_case_str, gradient = self.__generate_gradients(
+                        prompt=prompt,
+                        test_dataset=test_dataset,
+                        failure_cases=failure_cases,
+                        failure_sampler=(
+                            failure_sampler if failure_token_budget is not None else None
+                        ),
+                        n_batches=n_gradient_batches,
+                        n_reasons=n_reasons,
+                        model=model,
+                    )
+                gradient_seconds = timer.elapsed
+                if journal is not None:
+                    journal.append(
+                        {
+                            "step": step,
+                            "phase": "gradient",
+                            "example_cases": example_cases,
+                            "failure_case_str": failure_case_str,
+                            "gradient": gradient,
+                        }
+                    )
             logger.info(f"epoch-{step} | gradient:\n{gradient}")
             # pdb.set_trace()
 
             Consoler.print_in_panel(f"epoch-{step}: 生成新 prompt", title="APO 自动 prompt")
-            new_prompt = self.__generate_new_prompt(
-                prompt=prompt,
-                failure_case=failure_case_str,
-                gradient=gradient,
-                max_tokens=max_tokens,
-                model=model,
-            )
+            if "new_prompt" in finished_phases:
+                new_prompt: str = finished_phases["new_prompt"]["new_prompt"]
+            else:
+                with self.__phase_seconds.time(phase="new_prompt") as timer:
+                    new_prompt = self.__generate_new_prompt(
+                        prompt=prompt,
+                        failure_case=failure_case_str,
+                        gradient=gradient,
+                        max_tokens=max_tokens,
+                        model=model,
+                    )
+                new_prompt_seconds = timer.elapsed
+                if journal is not None:
+                    journal.append({"step": step, "phase": "new_prompt", "new_prompt": new_prompt})
             logger.info(f"epoch-{step} | new prompt:\n{new_prompt}")
             # pdb.set_trace()
+            finished_phases = {}
+            self.__report_compression(step, gradient_seconds, new_prompt_seconds)
 
             Consoler.print_in_panel(f"epoch-{step}: 开始执行评测流程", title="APO 自动 prompt")
-            eval_result: dict = self.eval(prompt=new_prompt, test_dataset=test_dataset)
-            accuracy: float = eval_result["accuracy"]
-            failure_cases: List[dict] = eval_result["failure_cases"]
-            logger.info(f"epoch-{step} | accuracy: {accuracy}")
+            with self.__phase_seconds.time(phase="eval"):
+                eval_result: dict = self.__evaluate_candidate(
+                    prompt=new_prompt,
+                    test_dataset=test_dataset,
+                    eval_mode=eval_mode,
+                    incumbent_accuracy=incumbent_accuracy,
+                    target_accuracy=target_accuracy,
+                    max_workers=max_workers,
+                    seed=seed,
+                    pack_size=pack_size,
+                )
+            logger.info(
+                f"epoch-{step} | accuracy: {eval_result['accuracy']} | "
+                f"evaluated rows: {eval_result['n_evaluated']}/{len(test_dataset)}"
+            )
+
+            if eval_result.get("stop_reason") == "rejected":
+                # 候选 prompt 不可能超过当前 prompt，保留当前 prompt 与 failure case
+                logger.info(f"epoch-{step} | new prompt rejected, keep current prompt")
+                accuracy = incumbent_accuracy
+                new_prompt = prompt
+            else:
+                accuracy: float = eval_result["accuracy"]
+                failure_cases: List[dict] = eval_result["failure_cases"]
+                incumbent_accuracy = accuracy
 
             for stop_criterion in stop_criterions:
                 if stop_criterion.is_stop(accuracy):
@@ -167,48 +413,626 @@ class APOPromptOptimizer(ABSPromptOptimizer):
                     break
 
             prompt = new_prompt
+            self.__epochs.inc(mode="sequential")
+
+            if journal is not None:
+                journal.append(
+                    {
+                        "step": step,
+                        "phase": "eval",
+                        "prompt": prompt,
+                        "accuracy": eval_result["accuracy"],
+                        "incumbent_accuracy": incumbent_accuracy,
+                        "n_evaluated": eval_result["n_evaluated"],
+                        "failure_cases": failure_cases,
+                        "stop_criterions": self.__dump_stop_criterions(stop_criterions),
+                        "stop_reason": stop_reason,
+                    }
+                )
 
             if is_stop_flag:
                 return {"prompt": prompt, "step": step, "stop_reason": stop_reason}
 
-    def eval(self, prompt: str, test_dataset: List[dict]) -> dict:
+    def __generate_gradients(
+        self,
+        prompt: str,
+        test_dataset: List[dict],
+        failure_cases: List[dict],
+        failure_sampler: Optional[FailureCaseSampler],
+        n_batches: int,
+        n_reasons: int,
+        model: str,
+    ) -> Tuple[List[dict], str, str]:
         """
-        执行评测流程
+        为当前 prompt 生成梯度，未指定 failure_sampler 时使用全部 failure case
+        :return Tuple[List[dict], str, str] 用于生成新 prompt 的 failure case、它们的字符串与梯度
+        """
+        if failure_sampler is None:
+            failure_case_str: str = self.__make_failure_case_str(test_dataset, failure_cases)
+            gradient: str = self.__generate_gradient(
+                prompt=prompt,
+                failure_case=failure_case_str,
+                n_reasons=n_reasons,
+                model=model,
+            )
+            return failure_cases, failure_case_str, gradient
+
+        # 每个 minibatch 并发生成梯度，新 prompt 使用第一个 minibatch 作为示例
+        batches: List[List[dict]] = failure_sampler.sample(
+            test_dataset, failure_cases, n_batches=n_batches
+        )
+        failure_case_strs: List[str] = [
+            self.__make_failure_case_str(test_dataset, batch) for batch in batches
+        ]
+        with ThreadPoolExecutor(max_workers=len(failure_case_strs)) as executor:
+            gradients: List[str] = list(
+                executor.map(
+                    lambda case_str: self.__generate_gradient(
+                        prompt=prompt,
+                        failure_case=case_str,
+                        n_reasons=n_reasons,
+                        model=model,
+                    ),
+                    failure_case_strs,
+                )
+            )
+
+        return batches[0], failure_case_strs[0], "\n".join(gradients)
+
+    @staticmethod
+    def __dump_stop_criterions(stop_criterions: List[ABSStopCriterion]) -> List[dict]:
+        return [stop_criterion.state_dict() for stop_criterion in stop_criterions]
+
+    @staticmethod
+    def __load_stop_criterions(stop_criterions: List[ABSStopCriterion], states: List[dict]):
+        for stop_criterion, state in zip(stop_criterions, states):
+            stop_criterion.load_state_dict(state)
+
+    def __run_beam(
+        self,
+        model: str,
+        prompt: str,
+        test_dataset: List[dict],
+        stop_criterions: List[ABSStopCriterion],
+        n_reasons: int,
+        max_tokens: int,
+        max_workers: int,
+        beam_width: int,
+        n_expansions: int,
+        minibatch_size: int,
+        seed: Optional[int],
+        eval_mode: str,
+        failure_sampler: FailureCaseSampler,
+        journal: Optional[RunJournal],
+        pack_size: int,
+    ) -> dict:
+        """
+        beam search 模式：保留 top-k 个 prompt，每个 epoch 并发扩展出候选并评测，
+        候选与当前 beam 一起排序后保留最优的 k 个，因此效果变差的 prompt 不会被保留。
+        每次扩展从该 prompt 的 failure case 中分层采样一个 minibatch 作为梯度输入，
+        使同一 prompt 的多个候选互不相同。
+        所有扩展共享一个 max_workers 大小的评测线程池，包括梯度与新 prompt 在内，
+        同时进行的 LLM 请求数不超过 max_workers。
+        设置 journal 时，每个 epoch 结束后记录整个 beam，续跑时从最后完成的 epoch 继续；
+        epoch 中途中断时不保留已完成的扩展，续跑时该 epoch 重新扩展与评测。
+        beam 中的 prompt 都没有 failure case 时以 no_failure_cases 结束。
+        """
+        max_workers = max(1, max_workers)
+        self.__call_slots = threading.BoundedSemaphore(max_workers)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                self.__shared_pool = pool
+                return self.__search_beam(
+                    model=model,
+                    prompt=prompt,
+                    test_dataset=test_dataset,
+                    stop_criterions=stop_criterions,
+                    n_reasons=n_reasons,
+                    max_tokens=max_tokens,
+                    max_workers=max_workers,
+                    beam_width=beam_width,
+                    n_expansions=n_expansions,
+                    seed=seed,
+                    eval_mode=eval_mode,
+                    failure_sampler=failure_sampler,
+                    journal=journal,
+                    pack_size=pack_size,
+                )
+        finally:
+            self.__shared_pool = None
+            self.__call_slots = None
+
+    def __search_beam(
+        self,
+        model: str,
+        prompt: str,
+        test_dataset: List[dict],
+        stop_criterions: List[ABSStopCriterion],
+        n_reasons: int,
+        max_tokens: int,
+        max_workers: int,
+        beam_width: int,
+        n_expansions: int,
+        seed: Optional[int],
+        eval_mode: str,
+        failure_sampler: FailureCaseSampler,
+        journal: Optional[RunJournal],
+        pack_size: int,
+    ) -> dict:
+        """beam search 的主循环，见 __run_beam"""
+        step: int = 0
+        beam: List[dict] = []
+
+        if journal is not None:
+            completed = [record for record in journal.load() if record["phase"] == "beam"]
+            if completed:
+                last: dict = completed[-1]
+                step, beam = last["step"], last["beam"]
+                self.__load_stop_criterions(stop_criterions, last["stop_criterions"])
+                logger.info(f"resume from epoch-{step} | run_dir: {os.path.dirname(journal.path)}")
+
+                if last["stop_reason"]:
+                    return self.__make_beam_result(beam, step, last["stop_reason"])
+
+        if not beam:
+            Consoler.print_in_panel("epoch-0: 评测初始 prompt", title="APO 自动 prompt")
+            with self.__phase_seconds.time(phase="eval"):
+                eval_result: dict = self.eval(
+                    prompt=prompt,
+                    test_dataset=test_dataset,
+                    max_workers=max_workers,
+                    pack_size=pack_size,
+                )
+            beam = [{"prompt": prompt, **eval_result}]
+            logger.info(f"epoch-0 | accuracy: {eval_result['accuracy']}")
+
+            if journal is not None:
+                journal.append(
+                    {
+                        "step": step,
+                        "phase": "beam",
+                        "beam": beam,
+                        "stop_criterions": self.__dump_stop_criterions(stop_criterions),
+                        "stop_reason": "",
+                    }
+                )
+
+        # 每个 epoch 中各次扩展生成梯度与新 prompt 的耗时，用于压缩报告
+        phase_seconds: List[Tuple[float, float]] = []
+
+        def __expand(candidate: dict, failure_cases: List[dict]) -> dict:
+            with self.__phase_seconds.time(phase="gradient") as gradient_timer:
+                failure_case_str: str = self.__make_failure_case_str(test_dataset, failure_cases)
+                gradient: str = self.__generate_gradient(
+                    prompt=candidate["prompt"],
+                    failure_case=failure_case_str,
+                    n_reasons=n_reasons,
+                    model=model,
+                )
+            with self.__phase_seconds.time(phase="new_prompt") as new_prompt_timer:
+                new_prompt: str = self.__generate_new_prompt(
+                    prompt=candidate["prompt"],
+                    failure_case=failure_case_str,
+                    gradient=gradient,
+                    max_tokens=max_tokens,
+                    model=model,
+                )
+            phase_seconds.append((gradient_timer.elapsed, new_prompt_timer.elapsed))
+            # 只有超过 beam 中最差的 prompt 才可能进入 beam；不做提前接受，
+            # 未被淘汰的候选都在全量数据上评测，与 beam 中的准确率可以直接比较
+            with self.__phase_seconds.time(phase="eval"):
+                result: dict = self.__evaluate_candidate(
+                    prompt=new_prompt,
+                    test_dataset=test_dataset,
+                    eval_mode=eval_mode,
+                    incumbent_accuracy=beam[-1]["accuracy"] if len(beam) >= beam_width else None,
+                    target_accuracy=None,
+                    max_workers=max_workers,
+                    seed=seed,
+                    pack_size=pack_size,
+                )
+            return {"prompt": new_prompt, "gradient": gradient, **result}
+
+        while True:
+            jobs = [
+                (candidate, batch)
+                for candidate in beam
+                if candidate["failure_cases"]
+                for batch in failure_sampler.sample(
+                    test_dataset, candidate["failure_cases"], n_batches=n_expansions
+                )
+            ]
+            if not jobs:
+                # beam 中的 prompt 都没有 failure case，无法继续扩展
+                logger.info(f"epoch-{step} | no failure cases to expand, stop")
+                if journal is not None:
+                    journal.append(
+                        {
+                            "step": step,
+                            "phase": "beam",
+                            "beam": beam,
+                            "stop_criterions": self.__dump_stop_criterions(stop_criterions),
+                            "stop_reason": "no_failure_cases",
+                        }
+                    )
+                return self.__make_beam_result(beam, step, "no_failure_cases")
+
+            step += 1
+
+            Consoler.print_in_panel(
+                f"epoch-{step}: 扩展 {len(jobs)} 个候选 prompt", title="APO 自动 prompt"
+            )
+            phase_seconds.clear()
+            # 扩展线程只生成梯度与新 prompt，评测交给共享线程池
+            with ThreadPoolExecutor(max_workers=min(len(jobs), max_workers)) as executor:
+                successors: List[dict] = list(executor.map(lambda job: __expand(*job), jobs))
+            self.__report_compression(
+                step,
+                sum(seconds[0] for seconds in phase_seconds),
+                sum(seconds[1] for seconds in phase_seconds),
+            )
+
+            logger.info(
+                f"epoch-{step} | evaluated rows: "
+                f"{sum(successor['n_evaluated'] for successor in successors)}"
+            )
+            successors = [
+                successor for successor in successors if successor.get("stop_reason") != "rejected"
+            ]
+
+            # 当前 beam 排在前面，sorted 是稳定排序，准确率相同时优先保留已有 prompt
+            pool: List[dict] = []
+            seen_prompts = set()
+            for candidate in beam + successors:
+                if candidate["prompt"] not in seen_prompts:
+                    seen_prompts.add(candidate["prompt"])
+                    pool.append(candidate)
+            beam = sorted(pool, key=lambda candidate: -candidate["accuracy"])[:beam_width]
+
+            accuracy: float = beam[0]["accuracy"]
+            logger.info(
+                f"epoch-{step} | beam accuracy: {[candidate['accuracy'] for candidate in beam]}"
+            )
+
+            self.__epochs.inc(mode="beam")
+
+            stop_reason: str = ""
+            for stop_criterion in stop_criterions:
+                if stop_criterion.is_stop(accuracy):
+                    stop_reason = stop_criterion.stop_reason
+                    break
+
+            if journal is not None:
+                journal.append(
+                    {
+                        "step": step,
+                        "phase": "beam",
+                        "beam": beam,
+                        "stop_criterions": self.__dump_stop_criterions(stop_criterions),
+                        "stop_reason": stop_reason,
+                    }
+                )
+
+            if stop_reason:
+                return self.__make_beam_result(beam, step, stop_reason)
+
+    @staticmethod
+    def __make_beam_result(beam: List[dict], step: int, stop_reason: str) -> dict:
+        return {
+            "prompt": beam[0]["prompt"],
+            "accuracy": beam[0]["accuracy"],
+            "step": step,
+            "stop_reason": stop_reason,
+            "beam": [
+                {"prompt": candidate["prompt"], "accuracy": candidate["accuracy"]}
+                for candidate in beam
+            ],
+        }
+
+    def __evaluate_candidate(
+        self,
+        prompt: str,
+        test_dataset: List[dict],
+        eval_mode: str,
+        incumbent_accuracy: Optional[float],
+        target_accuracy: Optional[float],
+        max_workers: int,
+        seed: Optional[int],
+        pack_size: int = 1,
+    ) -> dict:
+        """
+        按评测模式评测候选 prompt，返回结果中总是包含 n_evaluated
+        """
+        if eval_mode == "adaptive":
+            return self.eval_adaptive(
+                prompt=prompt,
+                test_dataset=test_dataset,
+                incumbent_accuracy=incumbent_accuracy,
+                target_accuracy=target_accuracy,
+                max_workers=max_workers,
+                seed=seed,
+                pack_size=pack_size,
+            )
+
+        eval_result: dict = self.eval(
+            prompt=prompt, test_dataset=test_dataset, max_workers=max_workers, pack_size=pack_size
+        )
+        eval_result["n_evaluated"] = len(test_dataset)
+        return eval_result
+
+    @staticmethod
+    def __get_target_accuracy(stop_criterions: List[ABSStopCriterion]) -> Optional[float]:
+        """
+        从停止条件中获取目标准确率，没有 AccuracyStopCriterion 时返回 None
+        """
+        thresholds = [
+            stop_criterion.accuracy_threhold
+            for stop_criterion in stop_criterions
+            if isinstance(stop_criterion, AccuracyStopCriterion)
+        ]
+        return min(thresholds) if thresholds else None
+
+    def __eval_single(self, prompt: str, data: dict, data_idx: int) -> Optional[dict]:
+        """
+        评测单条数据
+        :param prompt:   str  prompt 文本
+        :param data:     dict 测试数据
+        :param data_idx: int  数据在测试集中的下标
+        :raise LLMServerError LLM 调用失败，不会被当作 failure case 计入准确率
+        :return Optional[dict] 命中时返回 None，否则返回 failure case
+        """
+        resp = self.__generate(
+            prompt=prompt.replace("{{input_content}}", data["input"]),
+            stream=False,
+            temperature=0.0,
+            max_new_tokens=500,
+        )
+        return self.__score(self.__get_content(resp), data, data_idx)
+
+    @staticmethod
+    def __score(result, data: dict, data_idx: int) -> Optional[dict]:
+        """
+        将模型输出与期望结果比较
+        :param result:   模型输出，字符串时先按 JSON 解析
+        :param data:     dict 测试数据
+        :param data_idx: int  数据在测试集中的下标
+        :return Optional[dict] 命中时返回 None，未命中时 reason 为 no_hit，无法解析时 reason 为错误信息
+        """
+        try:
+            result_json = json.loads(result) if isinstance(result, str) else result
+
+            if (
+                result_json[0]["label"] == data["expect"][0]["label"]
+                and result_json[0]["entity"] == data["expect"][0]["entity"]
+            ):
+                return None
+
+            return {"idx": data_idx, "reason": "no_hit", "result": result_json[0]}
+        except Exception as error:
+            return {"idx": data_idx, "reason": f"{error}", "result": result}
+
+    def __eval_packed(
+        self, prompt: str, test_dataset: List[dict], indices: List[int]
+    ) -> List[Optional[dict]]:
+        """
+        在一个请求中评测多条数据，模型按 packed_eval_meta_prompt 的约定返回带序号的结果；
+        缺少结果或结果无法解析的数据会单独再请求一次，单独请求的结果按原有方式计入
         :param prompt:       str        prompt 文本
         :param test_dataset: List[dict] 测试数据集
-        :return dict
+        :param indices:      List[int]  打包在一起的数据下标
+        :raise LLMServerError LLM 调用失败
+        :return List[Optional[dict]] 与 indices 顺序一致的评测结果
         """
-        data_idx, hit_count = 0, 0
-        error_info_list = []
+        if len(indices) == 1:
+            return [self.__eval_single(prompt, test_dataset[indices[0]], indices[0])]
 
-        for data in tqdm.tqdm(test_dataset):
-            resp = self.__llm_server.generate(
-                prompt=prompt.replace("{{input_content}}", data["input"]),
-                stream=False,
-                temperature=0.0,
-                max_new_tokens=500,
+        items: str = "\n".join(
+            json.dumps(
+                {"index": pos + 1, "input": test_dataset[data_idx]["input"]}, ensure_ascii=False
             )
+            for pos, data_idx in enumerate(indices)
+        )
+        packed_prompt: str = (
+            packed_eval_meta_prompt.replace(
+                "{{prompt}}", prompt.replace("{{input_content}}", "<item input>")
+            )
+            .replace("{{n_items}}", str(len(indices)))
+            .replace("{{items}}", items)
+        )
+        resp = self.__generate(
+            prompt=packed_prompt,
+            stream=False,
+            temperature=0.0,
+            max_tokens=500 * len(indices),
+        )
+        outputs: Dict[int, object] = self.__parse_packed(self.__get_content(resp), len(indices))
+
+        results: List[Optional[dict]] = []
+        for pos, data_idx in enumerate(indices):
+            data: dict = test_dataset[data_idx]
+            result = self.__score(outputs[pos], data, data_idx) if pos in outputs else None
+            if pos not in outputs or (result is not None and result["reason"] != "no_hit"):
+                self.__packed_fallbacks.inc()
+                result = self.__eval_single(prompt, data, data_idx)
+            results.append(result)
 
-            resp_dict: dict = json.loads(resp["data"])
-            result_str: str = resp_dict["data"]["choices"][0]["message"]["content"]
+        return results
 
+    @staticmethod
+    def __parse_packed(content: str, n_items: int) -> Dict[int, object]:
+        """
+        解析打包请求的返回值
+        :param content: str 模型输出，应为 [{"index": 1, "output": ...}, ...]
+        :param n_items: int 打包的数据量
+        :return Dict[int, object] 数据在包内的位置（从 0 开始）到输出的映射，无法解析的条目不包含在内
+        """
+        try:
+            elements = json.loads(content)
+        except ValueError:
+            # 模型在 JSON 数组前后带了其他文本（例如 markdown 代码块）
+            start, end = content.find("["), content.rfind("]")
             try:
-                result_json = json.loads(result_str)
+                elements = json.loads(content[start : end + 1]) if 0 <= start < end else None
+            except ValueError:
+                elements = None
 
-                if (
-                    result_json[0]["label"] == data["expect"][0]["label"]
-                    and result_json[0]["entity"] == data["expect"][0]["entity"]
-                ):
-                    hit_count += 1
-                else:
-                    error_info_list.append(
-                        {"idx": data_idx, "reason": "no_hit", "result": result_json[0]}
+        outputs: Dict[int, object] = {}
+        for element in elements if isinstance(elements, list) else []:
+            if not isinstance(element, dict) or "output" not in element:
+                continue
+            index = element.get("index")
+            if isinstance(index, int) and 1 <= index <= n_items and index - 1 not in outputs:
+                outputs[index - 1] = element["output"]
+
+        return outputs
+
+    def __eval_rows(
+        self,
+        prompt: str,
+        test_dataset: List[dict],
+        indices: List[int],
+        max_workers: int = 1,
+        pack_size: int = 1,
+    ) -> List[Optional[dict]]:
+        """
+        评测测试集中指定下标的数据
+        :param prompt:       str        prompt 文本
+        :param test_dataset: List[dict] 测试数据集
+        :param indices:      List[int]  需要评测的数据下标
+        :param max_workers:  int        并发请求数，默认为 1（串行执行）
+        :param pack_size:    int        每个请求打包的数据量，默认为 1（每条数据一个请求）
+        :return List[Optional[dict]] 与 indices 顺序一致的评测结果
+        """
+        self.__eval_rows_total.inc(len(indices))
+        if self.__executor is not None:
+            return self.__executor.eval_rows(prompt, test_dataset, indices)
+
+        if pack_size < 1:
+            raise ValueError(f"pack_size should be positive, got {pack_size}")
+        packs: List[List[int]] = [
+            indices[start : start + pack_size] for start in range(0, len(indices), pack_size)
+        ]
+
+        if self.__shared_pool is not None:
+            results = list(
+                self.__shared_pool.map(
+                    lambda pack: self.__eval_packed(prompt, test_dataset, pack), packs
+                )
+            )
+        elif max_workers <= 1:
+            results = [self.__eval_packed(prompt, test_dataset, pack) for pack in tqdm.tqdm(packs)]
+        else:
+            # executor.map 按提交顺序返回结果，保证 failure case 的顺序与串行一致
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(
+                    tqdm.tqdm(
+                        executor.map(
+                            lambda pack: self.__eval_packed(prompt, test_dataset, pack), packs
+                        ),
+                        total=len(packs),
                     )
-            except Exception as error:
-                error_info_list.append(
-                    {"idx": data_idx, "reason": f"{error}", "result": result_str}
                 )
-            finally:
-                data_idx += 1
+
+        return [result for pack_results in results for result in pack_results]
+
+    def eval(
+        self, prompt: str, test_dataset: List[dict], max_workers: int = 1, pack_size: int = 1
+    ) -> dict:
+        """
+        执行评测流程
+        :param prompt:       str        prompt 文本
+        :param test_dataset: List[dict] 测试数据集
+        :param max_workers:  int        并发请求数，默认为 1（串行执行）
+        :param pack_size:    int        每个请求打包的数据量，默认为 1；大于 1 时多条数据放在同一个请求中，
+                                        模型按序号返回各条结果，缺少或无法解析的结果会逐条重新请求；
+                                        设置了 executor 时由 executor 自己的配置决定
+        :return dict
+        """
+        results = self.__eval_rows(
+            prompt,
+            test_dataset,
+            list(range(len(test_dataset))),
+            max_workers=max_workers,
+            pack_size=pack_size,
+        )
+
+        error_info_list = [result for result in results if result is not None]
+        hit_count = len(results) - len(error_info_list)
 
         return {"accuracy": hit_count / len(test_dataset), "failure_cases": error_info_list}
+
+    def eval_adaptive(
+        self,
+        prompt: str,
+        test_dataset: List[dict],
+        incumbent_accuracy: Optional[float] = None,
+        target_accuracy: Optional[float] = None,
+        initial_ratio: float = 0.1,
+        growth: float = 2.0,
+        z: float = 1.96,
+        max_workers: int = 1,
+        seed: Optional[int] = None,
+        pack_size: int = 1,
+    ) -> dict:
+        """
+        自适应采样评测：在逐步扩大的随机子集上评测，当置信区间上界低于当前最优准确率
+        （不可能超过当前 prompt）或下界达到目标准确率时提前停止
+        :param prompt:             str        prompt 文本
+        :param test_dataset:       List[dict] 测试数据集
+        :param incumbent_accuracy: float      当前 prompt 的准确率，为 None 时不做提前淘汰
+        :param target_accuracy:    float      目标准确率，为 None 时不做提前接受
+        :param initial_ratio:      float      初始子集占测试集的比例
+        :param growth:             float      每轮子集大小的增长倍数
+        :param z:                  float      置信区间的正态分位数，1.96 对应 95% 置信度
+        :param max_workers:        int        并发请求数，默认为 1（串行执行）
+        :param seed:               int        随机采样的种子
+        :param pack_size:          int        每个请求打包的数据量，见 eval
+        :return dict 除 accuracy、failure_cases 外，还包含 n_evaluated（实际评测的数据量）、
+                     stop_reason（rejected / accepted / exhausted）以及置信区间 lower、upper
+        """
+        if not test_dataset:
+            raise ValueError("test_dataset should not be empty")
+
+        order: List[int] = list(range(len(test_dataset)))
+        random.Random(seed).shuffle(order)
+
+        size: int = max(1, math.ceil(len(order) * initial_ratio))
+        n_evaluated: int = 0
+        results: List[Optional[dict]] = []
+
+        while True:
+            results.extend(
+                self.__eval_rows(
+                    prompt,
+                    test_dataset,
+                    order[n_evaluated:size],
+                    max_workers=max_workers,
+                    pack_size=pack_size,
+                )
+            )
+            n_evaluated = size
+
+            error_info_list = [result for result in results if result is not None]
+            hit_count = n_evaluated - len(error_info_list)
+            lower, upper = wilson_interval(hit_count, n_evaluated, z=z)
+
+            if n_evaluated >= len(order):
+                stop_reason = "exhausted"
+                break
+            if incumbent_accuracy is not None and upper < incumbent_accuracy:
+                stop_reason = "rejected"
+                break
+            if target_accuracy is not None and lower >= target_accuracy:
+                stop_reason = "accepted"
+                break
+
+            size = min(len(order), max(size + 1, math.ceil(size * growth)))
+
+        return {
+            "accuracy": hit_count / n_evaluated,
+            "failure_cases": sorted(error_info_list, key=lambda case: case["idx"]),
+            "n_evaluated": n_evaluated,
+            "stop_reason": stop_reason,
+            "lower": lower,
+            "upper": upper,
+        }
@@ -42,3 +42,13 @@ Based on the above information, I wrote an improved prompt. The total length of
 {{gen 'new_prompt' temperature=0.0}}
 {{/assistant ̃}}
 """
+
+packed_eval_meta_prompt = """{{prompt}}
+
+# BATCH
+Apply the instructions above to each of the following {{n_items}} items independently. "<item input>" in the instructions refers to the "input" field of the current item.
+{{items}}
+
+# BATCH OUTPUT FORMAT
+Return only a JSON array with exactly {{n_items}} elements, one per item, and nothing else. Each element must be {"index": <the index of the item>, "output": <the output for that item, exactly in the output format required by the instructions>}.
+"""
@@ -0,0 +1,223 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from prompt_helper.utils.llms.server import ABSLLMServer
+
+
+def shard_indices(indices: List[int], shard_size: int) -> List[List[int]]:
+    """按 shard_size 把数据下标切分为连续的分片
+
+    Args:
+        indices (List[int]): 数据下标
+        shard_size (int): 每个分片的最大数据量
+
+    Returns:
+        List[List[int]]: 分片列表，拼接后与 indices 一致
+    """
+    if shard_size < 1:
+        raise ValueError(f"shard_size should be positive, got {shard_size}")
+    return [indices[start : start + shard_size] for start in range(0, len(indices), shard_size)]
+
+
+class _EvalWorker:
+    """Ray actor：持有自己的 LLM 客户端与 APOPromptOptimizer，在多次评测之间保持连接复用"""
+
+    def __init__(
+        self, llm_server_factory: Callable[[], ABSLLMServer], max_workers: int, pack_size: int = 1
+    ):
+        from prompt_helper.utils.metrics import MetricsRegistry
+        from .main import APOPromptOptimizer
+
+        self.optimizer = APOPromptOptimizer(llm_server_factory(), metrics=MetricsRegistry())
+        self.max_workers = max_workers
+        self.pack_size = pack_size
+
+    def ping(self) -> bool:
+        return True
+
+    def eval_shard(self, prompt: str, rows: List[dict], indices: List[int]) -> dict:
+        """评测一个分片，failure case 的 idx 换算回原测试集中的下标"""
+        result: dict = self.optimizer.eval(
+            prompt, rows, max_workers=self.max_workers, pack_size=self.pack_size
+        )
+        failure_cases = [{**case, "idx": indices[case["idx"]]} for case in result["failure_cases"]]
+        return {"prompt": prompt, "indices": indices, "failure_cases": failure_cases}
+
+
+class RayEvalExecutor:
+    """基于 Ray 的分布式评测执行器
+
+    启动 num_workers 个常驻 actor，每个 actor 在创建时通过 llm_server_factory 构造自己的
+    LLM 服务并一直复用。评测时把测试数据按 shard_size 切分，(prompt, 分片) 作为任务
+    轮流分配给各 actor，多个候选 prompt 的分片可以同时在集群中执行；
+    每完成一个分片就通过 on_progress 回调当前 prompt 的部分准确率。
+
+    传给 APOPromptOptimizer(executor=...) 后，eval、eval_adaptive 与 run 的评测都会
+    通过本执行器完成；也可以直接调用 eval_many 一次评测多个 prompt。
+    address 为 None 时启动或连接本机的 Ray，"auto" 时连接已有集群，因此单机与多节点
+    使用同一套代码。ray 是可选依赖，只在 start 时导入。
+    """
+
+    def __init__(
+        self,
+        llm_server_factory: Callable[[], ABSLLMServer],
+        num_workers: int = 2,
+        shard_size: int = 16,
+        max_workers_per_actor: int = 4,
+        num_cpus_per_actor: float = 1,
+        pack_size: int = 1,
+        on_progress: Optional[Callable[[dict], None]] = None,
+        address: Optional[str] = None,
+        ray_init_kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        :param llm_server_factory:    Callable 在 actor 中构造 LLM 服务的函数，需要可以被序列化
+        :param num_workers:           int      actor 数量
+        :param shard_size:            int      每个任务包含的数据量
+        :param max_workers_per_actor: int      actor 内评测时的并发请求数
+        :param num_cpus_per_actor:    float    每个 actor 占用的 CPU 数量
+        :param pack_size:             int      actor 内评测时每个请求打包的数据量，见 APOPromptOptimizer.eval
+        :param on_progress:           Callable 每完成一个分片时在 driver 中调用，参数为
+                                               {prompt, n_evaluated, n_total, n_hits, accuracy}
+        :param address:               str      Ray 集群地址，为 None 时使用本机
+        :param ray_init_kwargs:       dict     Ray 尚未初始化时传给 ray.init 的其他参数
+        """
+        self.llm_server_factory = llm_server_factory
+        self.num_workers = num_workers
+        self.shard_size = shard_size
+        self.max_workers_per_actor = max_workers_per_actor
+        self.num_cpus_per_actor = num_cpus_per_actor
+        self.pack_size = pack_size
+        self.on_progress = on_progress
+        self.address = address
+        self.ray_init_kwargs = ray_init_kwargs or {}
+
+        self.__actors: list = []
+        self.__next_actor = 0
+        self.__lock = threading.Lock()
+
+    def start(self) -> "RayEvalExecutor":
+        """初始化 Ray 并创建 actor，等待所有 actor 就绪后返回自身；重复调用不会重复创建"""
+        import ray
+
+        with self.__lock:
+            if self.__actors:
+                return self
+
+            if not ray.is_initialized():
+                ray.init(address=self.address, **self.ray_init_kwargs)
+
+            worker_cls = ray.remote(_EvalWorker)
+            actors = [
+                worker_cls.options(
+                    num_cpus=self.num_cpus_per_actor,
+                    # 允许同一个 actor 同时处理多个 prompt 的分片
+                    max_concurrency=self.max_workers_per_actor,
+                ).remote(self.llm_server_factory, self.max_workers_per_actor, self.pack_size)
+                for _ in range(self.num_workers)
+            ]
+            ray.get([actor.ping.remote() for actor in actors])
+            self.__actors = actors
+
+        return self
+
+    def shutdown(self):
+        """结束所有 actor，不会关闭 Ray 本身"""
+        import ray
+
+        with self.__lock:
+            for actor in self.__actors:
+                ray.kill(actor)
+            self.__actors = []
+
+    def __enter__(self) -> "RayEvalExecutor":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def eval_rows(
+        self, prompt: str, test_dataset: List[dict], indices: List[int]
+    ) -> List[Optional[dict]]:
+        """
+        评测测试集中指定下标的数据，与 APOPromptOptimizer 的串行评测结果一致
+        :param prompt:       str        prompt 文本
+        :param test_dataset: List[dict] 测试数据集
+        :param indices:      List[int]  需要评测的数据下标
+        :return List[Optional[dict]] 与 indices 顺序一致的评测结果，命中时为 None
+        """
+        failures: Dict[int, dict] = self.__run([prompt], test_dataset, indices)[0]
+        return [failures.get(data_idx) for data_idx in indices]
+
+    def eval_many(self, prompts: List[str], test_dataset: List[dict]) -> List[dict]:
+        """
+        同时评测多个 prompt，所有 (prompt, 分片) 任务一起提交
+        :param prompts:      List[str]  prompt 列表
+        :param test_dataset: List[dict] 测试数据集
+        :return List[dict] 与 prompts 顺序一致的 {accuracy, failure_cases}，与 eval 的返回值格式相同
+        """
+        if not test_dataset:
+            raise ValueError("test_dataset should not be empty")
+
+        indices = list(range(len(test_dataset)))
+        results: List[dict] = []
+        for failures in self.__run(prompts, test_dataset, indices):
+            results.append(
+                {
+                    "accuracy": (len(indices) - len(failures)) / len(indices),
+                    "failure_cases": [failures[data_idx] for data_idx in sorted(failures)],
+                }
+            )
+        return results
+
+    """
+    工具函数区域
+    """
+
+    def __run(
+        self, prompts: List[str], test_dataset: List[dict], indices: List[int]
+    ) -> List[Dict[int, dict]]:
+        """提交所有任务并按完成顺序收集结果，返回每个 prompt 的 {下标: failure case}"""
+        import ray
+
+        self.start()
+        shards: List[List[int]] = shard_indices(indices, self.shard_size)
+        pending: Dict[Any, int] = {}
+        for prompt_idx, prompt in enumerate(prompts):
+            for shard in shards:
+                rows = [test_dataset[data_idx] for data_idx in shard]
+                ref = self.__pick_actor().eval_shard.remote(prompt, rows, shard)
+                pending[ref] = prompt_idx
+
+        failures: List[Dict[int, dict]] = [{} for _ in prompts]
+        n_evaluated: List[int] = [0 for _ in prompts]
+        while pending:
+            done, _ = ray.wait(list(pending), num_returns=1)
+            for ref in done:
+                prompt_idx = pending.pop(ref)
+                result: dict = ray.get(ref)
+                for case in result["failure_cases"]:
+                    failures[prompt_idx][case["idx"]] = case
+                n_evaluated[prompt_idx] += len(result["indices"])
+
+                if self.on_progress is not None:
+                    n_hits = n_evaluated[prompt_idx] - len(failures[prompt_idx])
+                    self.on_progress(
+                        {
+                            "prompt": prompts[prompt_idx],
+                            "n_evaluated": n_evaluated[prompt_idx],
+                            "n_total": len(indices),
+                            "n_hits": n_hits,
+                            "accuracy": n_hits / n_evaluated[prompt_idx],
+                        }
+                    )
+
+        return failures
+
+    def __pick_actor(self):
+        with self.__lock:
+            if not self.__actors:
+                raise RuntimeError("RayEvalExecutor is shut down")
+            actor = self.__actors[self.__next_actor % len(self.__actors)]
+            self.__next_actor += 1
+        return actor
@@ -10,3 +10,15 @@ class ABSStopCriterion(metaclass=abc.ABCMeta):
         判断是否需要停止
         """
         raise NotImplementedError
+
+    def state_dict(self) -> dict:
+        """
+        返回停止条件的内部状态，用于断点续跑
+        """
+        return {}
+
+    def load_state_dict(self, state: dict):
+        """
+        从 state_dict 恢复停止条件的内部状态
+        """
+        pass
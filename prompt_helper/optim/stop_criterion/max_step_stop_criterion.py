@@ -14,3 +14,9 @@ class MaxStepStopCriterion(ABSStopCriterion):
             return True
 
         return False
+
+    def state_dict(self) -> dict:
+        return {"step": self.step}
+
+    def load_state_dict(self, state: dict):
+        self.step = state.get("step", 0)
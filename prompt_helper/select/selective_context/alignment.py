@@ -0,0 +1,82 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def token_texts_from_offsets(text: str, offsets: Sequence[Sequence[int]]) -> List[str]:
+    """根据 tokenizer 返回的字符偏移切出每个 token 的文本
+
+    只使用每个 token 的结束位置，token i 的文本为 text[end_{i-1}:end_i]，
+    因此所有 token 拼接后就是原文（等价于逐个 decode 后拼接），不需要逐个调用 decode。
+
+    Args:
+        text (str): 原文
+        offsets (Sequence[Sequence[int]]): 每个 token 的 (start, end) 字符偏移
+
+    Returns:
+        List[str]: 每个 token 的文本
+    """
+    if len(offsets) == 0:
+        return []
+
+    ends = np.maximum.accumulate(np.asarray(offsets, dtype=np.int64).reshape(-1, 2)[:, 1])
+    ends[-1] = max(ends[-1], len(text))
+    starts = np.concatenate(([0], ends[:-1]))
+
+    return [text[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+def align_unit_self_information(
+    token_lengths: Sequence[int],
+    token_self_infos: Sequence[float],
+    unit_lengths: Sequence[int],
+    whitespace_tokens: Optional[Sequence[bool]] = None,
+) -> np.ndarray:
+    """将 token 的自信息对齐并平均到词法单元上
+
+    token 与单元都按拼接后的字符位置定位：
+    - token 的结束位置落在若干个单元的结束位置上或之后时，自信息平均分给这些单元；
+    - token 结束在某个单元内部时，自信息全部计入该单元（纯空格 token 除外）。
+
+    Args:
+        token_lengths (Sequence[int]): 每个 token 的字符长度
+        token_self_infos (Sequence[float]): 每个 token 的自信息
+        unit_lengths (Sequence[int]): 每个单元的字符长度
+        whitespace_tokens (Optional[Sequence[bool]], optional): 每个 token 是否为单个空格. Defaults to None.
+
+    Returns:
+        np.ndarray: 每个单元的平均自信息，没有对应 token 的单元为 nan
+    """
+    n_units = len(unit_lengths)
+    if n_units == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    token_ends = np.cumsum(np.asarray(token_lengths, dtype=np.int64))
+    token_starts = token_ends - np.asarray(token_lengths, dtype=np.int64)
+    token_self_infos = np.asarray(token_self_infos, dtype=np.float64)
+    unit_ends = np.cumsum(np.asarray(unit_lengths, dtype=np.int64))
+
+    # first: token 起点所在的单元；last: 结束位置不超过 token 终点的最后一个单元
+    first = np.searchsorted(unit_ends, token_starts, side="right")
+    last = np.searchsorted(unit_ends, token_ends, side="right") - 1
+    inside = last < first
+
+    counts = np.where(inside, 1, last - first + 1)
+    keep = first < n_units
+    if whitespace_tokens is not None:
+        keep &= ~(inside & np.asarray(whitespace_tokens, dtype=bool))
+
+    first, counts = first[keep], counts[keep]
+    shares = (token_self_infos[keep] / counts).repeat(counts)
+
+    # 为每个 token 展开 first, first + 1, ..., first + counts - 1 的单元下标
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    unit_idx = np.repeat(first, counts) + offsets
+    valid = unit_idx < n_units
+    unit_idx, shares = unit_idx[valid], shares[valid]
+
+    totals = np.bincount(unit_idx, weights=shares, minlength=n_units)
+    numbers = np.bincount(unit_idx, minlength=n_units)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return totals / numbers
@@ -0,0 +1,141 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# 支持的推理精度：fp32 为原始精度，bf16 将权重转换为 bfloat16，int8 对线性层做动态量化（仅 CPU）
+INFERENCE_DTYPES = ("fp32", "bf16", "int8")
+
+
+def resolve_device(device: str) -> str:
+    """解析设备名，auto 时有可用的 GPU 则使用 cuda，否则使用 cpu
+
+    Args:
+        device (str): 设备名，auto、cpu、cuda 或 cuda:N
+
+    Returns:
+        str: 实际使用的设备名
+    """
+    if device != "auto":
+        return device
+
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def prepare_model(
+    model,
+    device: str,
+    dtype: str = "fp32",
+    num_threads: Optional[int] = None,
+    compile: bool = False,
+):
+    """按推理配置转换模型
+
+    Args:
+        model: transformers 的因果语言模型
+        device (str): 模型所在设备
+        dtype (str, optional): 推理精度，fp32、bf16 或 int8. Defaults to "fp32".
+        num_threads (Optional[int], optional): torch 的算子内线程数，为 None 时保持默认；
+            该设置对整个进程生效. Defaults to None.
+        compile (bool, optional): 是否使用 torch.compile 编译模型. Defaults to False.
+
+    Returns:
+        转换后的模型
+    """
+    import torch
+
+    if dtype not in INFERENCE_DTYPES:
+        raise ValueError(f"dtype should be one of {list(INFERENCE_DTYPES)}, got {dtype}")
+    if dtype == "int8" and not device.startswith("cpu"):
+        raise ValueError(f"int8 dynamic quantization only supports cpu, got device {device}")
+
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    model = model.to(device).eval()
+    if dtype == "bf16":
+        model = model.to(torch.bfloat16)
+    elif dtype == "int8":
+        from torch.ao.quantization import quantize_dynamic
+
+        model = quantize_dynamic(conv1d_to_linear(model), {torch.nn.Linear}, dtype=torch.qint8)
+
+    if compile:
+        model = torch.compile(model)
+
+    return model
+
+
+def conv1d_to_linear(model):
+    """把 transformers 的 Conv1D（GPT-2 系列使用）原地替换为等价的 nn.Linear
+
+    动态量化只处理 nn.Linear，Conv1D 的权重是转置存储的，需要先转换。
+
+    Args:
+        model: torch 模型
+
+    Returns:
+        替换后的模型（与传入的是同一个对象）
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if not isinstance(child, Conv1D):
+                continue
+
+            in_features, out_features = child.weight.shape
+            linear = torch.nn.Linear(
+                in_features, out_features, device=child.weight.device, dtype=child.weight.dtype
+            )
+            with torch.no_grad():
+                linear.weight.copy_(child.weight.t())
+                linear.bias.copy_(child.bias)
+            setattr(module, name, linear)
+
+    return model
+
+
+def self_information_drift(
+    reference: Sequence[Sequence[float]],
+    candidate: Sequence[Sequence[float]],
+    reduce_ratio: float = 0.35,
+) -> dict:
+    """比较两组 token 自信息的差异
+
+    Args:
+        reference (Sequence[Sequence[float]]): 基准（fp32）的每个句子的 token 自信息
+        candidate (Sequence[Sequence[float]]): 待比较配置的每个句子的 token 自信息
+        reduce_ratio (float, optional): 计算掩码一致率时删除的比例. Defaults to 0.35.
+
+    Returns:
+        dict: n_tokens、max_abs_diff、mean_abs_diff、mean_rel_diff，以及 mask_agreement
+            （按 reduce_ratio 分位数阈值做 token 级掩码时，两者结果一致的 token 比例）
+    """
+    lengths: List[int] = [len(infos) for infos in reference]
+    assert lengths == [len(infos) for infos in candidate], "token counts do not match"
+
+    ref = np.fromiter((info for infos in reference for info in infos), dtype=np.float64)
+    cand = np.fromiter((info for infos in candidate for info in infos), dtype=np.float64)
+    if ref.size == 0:
+        return {
+            "n_tokens": 0,
+            "max_abs_diff": 0.0,
+            "mean_abs_diff": 0.0,
+            "mean_rel_diff": 0.0,
+            "mask_agreement": 1.0,
+        }
+
+    abs_diff = np.abs(cand - ref)
+    ref_mask = ref < np.percentile(ref, reduce_ratio * 100)
+    cand_mask = cand < np.percentile(cand, reduce_ratio * 100)
+
+    return {
+        "n_tokens": int(ref.size),
+        "max_abs_diff": float(abs_diff.max()),
+        "mean_abs_diff": float(abs_diff.mean()),
+        "mean_rel_diff": float((abs_diff / np.maximum(np.abs(ref), 1e-6)).mean()),
+        "mask_agreement": float((ref_mask == cand_mask).mean()),
+    }
@@ -1,20 +1,80 @@
 import re
-from typing import List
+import time
+import threading
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 
-import spacy
-import torch
 import numpy as np
-from nltk.tokenize import sent_tokenize, word_tokenize
-from transformers import AutoTokenizer, AutoModelForCausalLM
 
+from .alignment import align_unit_self_information, token_texts_from_offsets
+from .inference import prepare_model, resolve_device, self_information_drift
 from .types import LexicalUnits
+from prompt_helper.utils.metrics import REGISTRY, MetricsRegistry
+
+if TYPE_CHECKING:
+    import torch
 
 
 class SelectiveContext:
-    def __init__(self, model_name_or_path: str, device: str = "cuda", lang: str = "en"):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
-        self.model = AutoModelForCausalLM.from_pretrained(model_name_or_path).to(device)
-        self.device = device
+    """基于自信息的上下文压缩
+
+    torch、transformers、spaCy 与 nltk 都在首次使用时才导入，语言模型、tokenizer
+    与 spaCy 流水线也在首次访问时才加载，创建实例本身几乎没有开销。
+    需要在服务启动阶段提前加载时调用 warmup()。
+    """
+
+    def __init__(
+        self,
+        model_name_or_path: str,
+        device: str = "auto",
+        lang: str = "en",
+        max_batch_size: int = 16,
+        max_tokens_per_batch: int = 4096,
+        self_info_chunk_size: Optional[int] = None,
+        spacy_batch_size: int = 256,
+        spacy_n_process: int = 1,
+        dtype: str = "fp32",
+        num_threads: Optional[int] = None,
+        compile: bool = False,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Args:
+            model_name_or_path (str): 计算自信息的因果语言模型
+            device (str, optional): 模型所在设备，auto 时有 GPU 则使用 cuda，否则使用 cpu.
+                Defaults to "auto".
+            lang (str, optional): 语言，en 或 zh. Defaults to "en".
+            max_batch_size (int, optional): 一次前向计算的最大句子数. Defaults to 16.
+            max_tokens_per_batch (int, optional): 一次前向计算的最大 token 数（含 padding）. Defaults to 4096.
+            self_info_chunk_size (Optional[int], optional): 按序列分块计算 logits 的块大小，
+                为 None 时一次计算整个序列；分块时只对隐状态逐块调用输出层，
+                不会生成完整的 [seq, vocab] logits。编译后的模型，以及输出层之外还会
+                处理 logits 的模型不支持分块，仍使用完整的前向计算. Defaults to None.
+            spacy_batch_size (int, optional): nlp.pipe 的批大小. Defaults to 256.
+            spacy_n_process (int, optional): nlp.pipe 的进程数. Defaults to 1.
+            dtype (str, optional): 推理精度，fp32、bf16 或 int8（线性层动态量化，仅 CPU），
+                与 fp32 的差异可以用 drift_report 评估. Defaults to "fp32".
+            num_threads (Optional[int], optional): torch 的算子内线程数，加载模型时设置，
+                对整个进程生效；为 None 时保持 torch 的默认值. Defaults to None.
+            compile (bool, optional): 是否使用 torch.compile 编译模型. Defaults to False.
+            metrics (Optional[MetricsRegistry], optional): 指标注册表，各阶段（tokenize、forward、
+                chunk、align、mask）的耗时记录在 selective_context_stage_seconds{stage} 中；
+                为 None 时使用全局的 REGISTRY. Defaults to None.
+        """
+        self.model_name_or_path = model_name_or_path
+        self.lang = lang
+        self.max_batch_size = max_batch_size
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.self_info_chunk_size = self_info_chunk_size
+        self.spacy_batch_size = spacy_batch_size
+        self.spacy_n_process = spacy_n_process
+        self.dtype = dtype
+        self.num_threads = num_threads
+        self.compile = compile
+
+        metrics = metrics if metrics is not None else REGISTRY
+        self.__stage_seconds = metrics.histogram(
+            "selective_context_stage_seconds", "SelectiveContext stage latency"
+        )
 
         self.sent_tokenize_pattern: str = r"(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s"
         self.phrase_mask_token: str = ""
@@ -22,50 +82,295 @@ class SelectiveContext:
         self.keep_leading_word = False
         self.mask_token = ""
 
-        if lang == "en":
-            self.nlp = spacy.load("en_core_web_sm", disable=["ner"])
-            self.nlp.add_pipe("merge_noun_chunks")
-        elif lang == "zh":
-            self.nlp = spacy.load("zh_core_web_sm", disable=["ner"])
+        self.__device = device
+        self.__tokenizer = None
+        self.__model = None
+        self.__nlp = None
+        self.__nlp_loaded = False
+        self.__load_lock = threading.Lock()
+        self.__chunk_logits: Optional[bool] = None
+
+    @property
+    def device(self) -> str:
+        """模型所在设备，auto 在首次访问时解析"""
+        if self.__device == "auto":
+            self.__device = resolve_device(self.__device)
+        return self.__device
+
+    @property
+    def tokenizer(self):
+        """tokenizer，首次访问时加载"""
+        if self.__tokenizer is None:
+            with self.__load_lock:
+                if self.__tokenizer is None:
+                    from transformers import AutoTokenizer
+
+                    self.__tokenizer = AutoTokenizer.from_pretrained(self.model_name_or_path)
+        return self.__tokenizer
+
+    @property
+    def model(self):
+        """计算自信息的语言模型，首次访问时加载"""
+        if self.__model is None:
+            with self.__load_lock:
+                if self.__model is None:
+                    from transformers import AutoModelForCausalLM
+
+                    self.__model = prepare_model(
+                        AutoModelForCausalLM.from_pretrained(self.model_name_or_path),
+                        device=self.device,
+                        dtype=self.dtype,
+                        num_threads=self.num_threads,
+                        compile=self.compile,
+                    )
+        return self.__model
+
+    @property
+    def nlp(self):
+        """spaCy 流水线，首次访问时加载；lang 不是 en 或 zh 时为 None"""
+        if not self.__nlp_loaded:
+            with self.__load_lock:
+                if not self.__nlp_loaded:
+                    self.__nlp = self.__load_nlp(self.lang)
+                    self.__nlp_loaded = True
+        return self.__nlp
+
+    def warmup(self, reduce_level: str = "phrase") -> "SelectiveContext":
+        """提前加载模型、tokenizer 与 spaCy 流水线，并执行一次前向计算
+
+        Args:
+            reduce_level (str, optional): 预热使用的粒度，非 phrase 时不加载 spaCy 流水线.
+                Defaults to "phrase".
+
+        Returns:
+            SelectiveContext: 返回自身
+        """
+        self.compress_batch(["Warm up the model. It is ready."], reduce_level=reduce_level)
+        return self
+
+    def drift_report(self, contexts: List[str], reduce_ratio: float = 0.35) -> dict:
+        """评估当前推理配置相对 fp32 的自信息偏差与速度
+
+        在同一设备上加载一份 fp32 模型作为基准（int8 时使用 cpu），
+        对相同的句子分别计算 token 自信息并比较。
+
+        Args:
+            contexts (List[str]): 用于评估的文档列表
+            reduce_ratio (float, optional): 计算掩码一致率时删除的比例. Defaults to 0.35.
+
+        Returns:
+            dict: 见 self_information_drift，另外包含 dtype、seconds（当前配置耗时）、
+                reference_seconds（fp32 耗时）与 speedup
+        """
+        sentences: List[str] = [
+            sentence
+            for context in contexts
+            for sentence in self.__iter_sentences(re.sub(r"\s+", " ", context))
+        ]
+
+        reference = SelectiveContext(
+            self.model_name_or_path,
+            device="cpu" if self.dtype == "int8" else self.device,
+            lang=self.lang,
+            max_batch_size=self.max_batch_size,
+            max_tokens_per_batch=self.max_tokens_per_batch,
+            self_info_chunk_size=self.self_info_chunk_size,
+        )
+        reference.__tokenizer = self.tokenizer
+
+        timings: List[float] = []
+        results: List[List[dict]] = []
+        for selector in (self, reference):
+            # 先做一次前向计算，避免把模型加载与编译的时间计入
+            selector.__get_self_information_batch(sentences[:1])
+            start = time.perf_counter()
+            results.append(selector.__get_self_information_batch(sentences))
+            timings.append(time.perf_counter() - start)
+
+        report = self_information_drift(
+            [info["self_infos"] for info in results[1]],
+            [info["self_infos"] for info in results[0]],
+            reduce_ratio=reduce_ratio,
+        )
+        report.update(
+            {
+                "dtype": self.dtype,
+                "seconds": timings[0],
+                "reference_seconds": timings[1],
+                "speedup": timings[1] / timings[0] if timings[0] > 0 else float("inf"),
+            }
+        )
+        return report
 
     def __call__(
         self, context: str, reduce_ratio: float = 0.35, reduce_level: str = "phrase"
     ) -> List[str]:
+        return self.compress_batch(
+            [context], reduce_ratio=reduce_ratio, reduce_level=reduce_level
+        )[0]
+
+    def compress_batch(
+        self, contexts: List[str], reduce_ratio: float = 0.35, reduce_level: str = "phrase"
+    ) -> List[Tuple[str, str]]:
+        """批量压缩多个文档
+
+        所有文档的句子放在一起按 token 长度分批计算自信息（减少 padding），
+        phrase 级别时一起送入 spaCy 流水线，然后按文档拆回，各文档独立做阈值筛选，
+        结果与逐个调用 __call__ 一致。
+
+        Args:
+            contexts (List[str]): 文档列表
+            reduce_ratio (float, optional): 删除的比例. Defaults to 0.35.
+            reduce_level (str, optional): 删除的粒度，phrase、sentence 或 token. Defaults to "phrase".
+
+        Returns:
+            List[Tuple[str, str]]: 与 contexts 顺序一致的 (原文, 压缩结果) 列表
+        """
         if reduce_level not in ["phrase", "sentence", "token"]:
             raise ValueError(
                 f"reduce_level should be one of ['sentence', 'phrase', 'token'], got {reduce_level}"
             )
 
-        context: str = re.sub(r"\s+", " ", context)
-        sentences: List[str] = [
-            sent.strip() for sent in re.split(self.sent_tokenize_pattern, context) if sent.strip()
+        contexts = [re.sub(r"\s+", " ", context) for context in contexts]
+        documents: List[List[str]] = [
+            [
+                sent.strip()
+                for sent in re.split(self.sent_tokenize_pattern, context)
+                if sent.strip()
+            ]
+            for context in contexts
         ]
 
-        lexical_unit = self.__split_lexical_unit(sentences=sentences, unit_type=reduce_level)
+        sentences: List[str] = [sentence for document in documents for sentence in document]
+        infos: List[dict] = self.__get_self_information_batch(sentences)
+        docs: Optional[list] = None
+        if reduce_level == "phrase" and sentences:
+            docs = self.__parse_sentences(["".join(info["tokens"]) for info in infos])
+
+        results: List[Tuple[str, str]] = []
+        start = 0
+        for context, document in zip(contexts, documents):
+            end = start + len(document)
+            if not document:
+                results.append((context, ""))
+                continue
+
+            lexical_unit = self.__split_lexical_unit(
+                sentences=document,
+                unit_type=reduce_level,
+                infos=infos[start:end],
+                docs=docs[start:end] if docs is not None else None,
+            )
+            masked_context = self.__mask_lexical_unit(lexical_unit, reduce_ratio, reduce_level)
+            results.append((context, masked_context))
+            start = end
+
+        return results
+
+    def stream(
+        self,
+        context: str,
+        reduce_ratio: float = 0.35,
+        reduce_level: str = "phrase",
+        context_tokens: int = 256,
+        segment_sentences: int = 8,
+    ) -> Iterator[Tuple[str, str]]:
+        """流式压缩长文档
+
+        按句子顺序遍历文档，每个句子在计算自信息时带上前文最后 context_tokens 个 token
+        作为滑动窗口上下文（窗口总长度不超过模型的最大位置数，前文最多占一半，超长句子会被切块），
+        每凑满 segment_sentences 个句子就在该片段内做阈值筛选并立即输出。
+        内存占用只与片段大小和窗口大小有关，与文档长度无关。
 
-        sentences_after_mask = []
-        masked_sentences = []
-        ppl_threshold = np.nanpercentile(lexical_unit.self_infos, reduce_ratio * 100)
+        Args:
+            context (str): 文档文本
+            reduce_ratio (float, optional): 每个片段内被删除的比例. Defaults to 0.35.
+            reduce_level (str, optional): 删除的粒度，phrase、sentence 或 token. Defaults to "phrase".
+            context_tokens (int, optional): 携带的前文 token 数量. Defaults to 256.
+            segment_sentences (int, optional): 每个输出片段包含的句子数. Defaults to 8.
+
+        Yields:
+            Iterator[Tuple[str, str]]: (片段原文, 片段压缩结果)
+        """
+        if reduce_level not in ["phrase", "sentence", "token"]:
+            raise ValueError(
+                f"reduce_level should be one of ['sentence', 'phrase', 'token'], got {reduce_level}"
+            )
 
-        for sentence, info in zip(lexical_unit.texts, lexical_unit.self_infos):
-            if info < ppl_threshold:
-                masked_sentences.append(sentence)
-                sentences_after_mask.append(self.__mask_sentence(sentence, reduce_level))
-            else:
-                sentences_after_mask.append(sentence)
+        context = re.sub(r"\s+", " ", context)
+        max_positions: Optional[int] = self.__max_positions()
+        history: List[int] = []
+        segment: List[str] = []
+
+        def __flush(segment: List[str], history: List[int]) -> Tuple[str, List[int]]:
+            encodings, token_texts = self.__encode(segment)
+            windows: List[Tuple[List[Tuple[List[int], int, int]], List[int]]] = []
+            for ids in encodings:
+                windows.append(self.__make_windows(history, ids, context_tokens, max_positions))
+                history = (history + ids)[-context_tokens:] if context_tokens > 0 else []
+
+            infos: List[dict] = self.__get_self_information_in_windows(windows, token_texts)
+            lexical_unit = self.__split_lexical_unit(
+                sentences=segment, unit_type=reduce_level, infos=infos
+            )
+            return self.__mask_lexical_unit(lexical_unit, reduce_ratio, reduce_level), history
 
-        masked_context = (
-            " ".join(sentences_after_mask)
-            if reduce_level == "sentence"
-            else "".join(sentences_after_mask)
-        )
+        for sentence in self.__iter_sentences(context):
+            segment.append(sentence)
+            if len(segment) >= segment_sentences:
+                masked_segment, history = __flush(segment, history)
+                yield " ".join(segment), masked_segment
+                segment = []
 
-        return context, masked_context
+        if segment:
+            masked_segment, history = __flush(segment, history)
+            yield " ".join(segment), masked_segment
 
     """
     工具函数区域
     """
 
+    def __mask_lexical_unit(
+        self, lexical_unit: LexicalUnits, reduce_ratio: float, reduce_level: str
+    ) -> str:
+        """按自信息的分位数阈值掩码词法单元
+
+        Args:
+            lexical_unit (LexicalUnits): 词法单元
+            reduce_ratio (float): 删除的比例
+            reduce_level (str): 掩码级别
+
+        Returns:
+            str: 掩码后的文本
+        """
+        with self.__stage_seconds.time(stage="mask"):
+            ppl_threshold = np.nanpercentile(lexical_unit.self_infos, reduce_ratio * 100)
+            masked: List[bool] = lexical_unit.mask(ppl_threshold).tolist()
+
+            sentences_after_mask = [
+                self.__mask_sentence(sentence, reduce_level) if is_masked else sentence
+                for sentence, is_masked in zip(lexical_unit.texts, masked)
+            ]
+
+            return (
+                " ".join(sentences_after_mask)
+                if reduce_level == "sentence"
+                else "".join(sentences_after_mask)
+            )
+
+    def __iter_sentences(self, context: str) -> Iterator[str]:
+        """按 sent_tokenize_pattern 逐个切分句子，与 re.split 的结果一致但不需要一次性生成列表"""
+        start = 0
+        for match in re.finditer(self.sent_tokenize_pattern, context):
+            sentence = context[start : match.start()].strip()
+            if sentence:
+                yield sentence
+            start = match.end()
+
+        sentence = context[start:].strip()
+        if sentence:
+            yield sentence
+
     def __mask_sentence(self, sentence: str, reduce_level: str) -> str:
         """掩码句子
 
@@ -80,6 +385,8 @@ class SelectiveContext:
             return self.phrase_mask_token
         elif reduce_level == "sentence":
             if self.keep_leading_word:
+                from nltk.tokenize import word_tokenize
+
                 leading_few_words = " ".join(word_tokenize(sentence)[: self.num_lead_words]) + " "
             else:
                 leading_few_words = ""
@@ -96,30 +403,308 @@ class SelectiveContext:
         Returns:
             dict: 字典，包含 tokens 和 self_infos 两个键
         """
-        inputs = self.tokenizer(sentence, add_special_tokens=False, return_tensors="pt").to(
-            self.device
-        )
-        input_ids = inputs["input_ids"]
-        input_ids_expaned = input_ids[:, 1:].unsqueeze(-1)
+        return self.__get_self_information_batch([sentence])[0]
 
-        outputs = self.model(**inputs)
-        logits = outputs.logits
-        probs = torch.softmax(logits, dim=-1)
-        self_info = -torch.log(probs)
+    def __get_self_information_batch(self, sentences: List[str]) -> List[dict]:
+        """批量获取多个句子内各 token 的自信息
 
-        tokens: List[str] = [
-            self.tokenizer.decode(token_) for token_ in input_ids.squeeze().tolist()[1:]
-        ]
-        self_infos: List[float] = (
-            self_info[:, :-1].gather(-1, input_ids_expaned).squeeze(-1).squeeze(0).tolist()
+        句子按 token 长度排序后分批，右侧 padding 并使用 attention mask，
+        每个句子的结果与逐句计算一致。
+
+        Args:
+            sentences (List[str]): 句子列表
+
+        Returns:
+            List[dict]: 与 sentences 顺序一致的字典列表，每个字典包含 tokens 和 self_infos 两个键
+        """
+        if not sentences:
+            return []
+
+        encodings, token_texts = self.__encode(sentences)
+        return self.__get_self_information_in_windows(
+            [([([], 0, len(ids))], ids) for ids in encodings], token_texts
         )
 
-        return {"tokens": tokens, "self_infos": self_infos}
+    def __encode(self, sentences: List[str]) -> Tuple[List[List[int]], List[List[str]]]:
+        """分词并得到每个 token 的文本
+
+        fast tokenizer 直接根据字符偏移切出 token 文本，否则逐个 token decode。
+
+        Args:
+            sentences (List[str]): 句子列表
+
+        Returns:
+            Tuple[List[List[int]], List[List[str]]]: 每个句子的 token id 与 token 文本
+        """
+        if not sentences:
+            return [], []
+
+        tokenizer = self.tokenizer
+        with self.__stage_seconds.time(stage="tokenize"):
+            if not getattr(tokenizer, "is_fast", False):
+                encodings = tokenizer(sentences, add_special_tokens=False)["input_ids"]
+                return encodings, [
+                    [tokenizer.decode(token_) for token_ in ids] for ids in encodings
+                ]
+
+            outputs = tokenizer(sentences, add_special_tokens=False, return_offsets_mapping=True)
+            token_texts = [
+                token_texts_from_offsets(sentence, offsets)
+                for sentence, offsets in zip(sentences, outputs["offset_mapping"])
+            ]
+            return outputs["input_ids"], token_texts
+
+    def __get_self_information_in_windows(
+        self,
+        windows: List[Tuple[List[Tuple[List[int], int, int]], List[int]]],
+        token_texts: List[List[str]],
+    ) -> List[dict]:
+        """批量计算带前文窗口的自信息
+
+        Args:
+            windows (List[Tuple[List[Tuple[List[int], int, int]], List[int]]]):
+                ([(前文 token id, 片段起点, 片段终点)], 句子 token id) 列表，见 __make_windows
+            token_texts (List[List[str]]): 每个句子的 token 文本
+
+        Returns:
+            List[dict]: 与 windows 顺序一致的字典列表，每个字典包含 tokens 和 self_infos 两个键；
+                没有前文时第一个 token 没有自信息，不包含在结果中
+        """
+        # 展开成 (前文 + 句子片段) 的输入序列，记录每段需要保留的自信息数量
+        sequences: List[List[int]] = []
+        spans: List[List[Tuple[int, int]]] = []
+        for prefixes, ids in windows:
+            sentence_spans = []
+            for prefix, start, end in prefixes:
+                sequences.append(prefix + ids[start:end])
+                # 没有前文的句子片段，首个 token 没有自信息
+                keep = end - start - (1 if not prefix else 0)
+                sentence_spans.append((len(sequences) - 1, keep))
+            spans.append(sentence_spans)
+
+        sequence_self_infos: List[List[float]] = self.__score_sequences(sequences)
+
+        results: List[dict] = []
+        for (prefixes, ids), texts, sentence_spans in zip(windows, token_texts, spans):
+            self_infos: List[float] = []
+            for seq_idx, keep in sentence_spans:
+                if keep > 0:
+                    self_infos.extend(sequence_self_infos[seq_idx][-keep:])
+            results.append(
+                {"tokens": texts[len(ids) - len(self_infos) :], "self_infos": self_infos}
+            )
+
+        return results
+
+    def __make_windows(
+        self,
+        history: List[int],
+        ids: List[int],
+        context_tokens: int,
+        max_positions: Optional[int],
+    ) -> Tuple[List[Tuple[List[int], int, int]], List[int]]:
+        """为一个句子构造滑动窗口，句子过长时切成多个片段，每个片段都带上紧邻的前文
+
+        Args:
+            history (List[int]): 前文 token id
+            ids (List[int]): 句子 token id
+            context_tokens (int): 前文 token 的最大数量
+            max_positions (Optional[int]): 模型的最大位置数，为 None 时不限制窗口长度
+
+        Raises:
+            ValueError: max_positions 小于 2，无法同时容纳前文与句子
+
+        Returns:
+            Tuple[List[Tuple[List[int], int, int]], List[int]]: ([(前文, 片段起点, 片段终点)], 句子 token id)
+        """
+        if max_positions is not None and max_positions < 2:
+            raise ValueError(f"max_positions should be at least 2, got {max_positions}")
+
+        if max_positions is None:
+            # 没有位置数限制时，整个句子与完整的前文放在同一个窗口中
+            context_tokens = max(0, context_tokens)
+            max_positions = context_tokens + max(1, len(ids))
+        else:
+            # 前文最多占窗口的一半，保证超长句子切块后每个片段仍有一半的位置留给句子本身
+            context_tokens = max(0, min(context_tokens, max_positions // 2))
+
+        prefixes: List[Tuple[List[int], int, int]] = []
+        start = 0
+        while start < len(ids):
+            # 句子的后续片段至少带上前一个 token，保证每个 token 都有自信息
+            n_prefix = context_tokens if start == 0 else max(1, context_tokens)
+            prefix = (history + ids[:start])[-n_prefix:] if n_prefix > 0 else []
+            end = min(len(ids), start + max_positions - len(prefix))
+            prefixes.append((prefix, start, end))
+            start = end
+
+        return prefixes, ids
+
+    def __max_positions(self) -> Optional[int]:
+        """模型能处理的最大 token 数，优先使用模型配置，其次使用 tokenizer 的 model_max_length
+
+        Returns:
+            Optional[int]: 最大 token 数，两者都没有设置时为 None
+        """
+        max_positions = getattr(self.model.config, "max_position_embeddings", None)
+        if max_positions is None:
+            # 没有设置 model_max_length 时 transformers 使用一个极大的占位值
+            model_max_length = getattr(self.tokenizer, "model_max_length", None)
+            if model_max_length is not None and model_max_length < int(1e12):
+                max_positions = model_max_length
+        return max_positions
+
+    def __score_sequences(self, sequences: List[List[int]]) -> List[List[float]]:
+        """批量计算 token 序列的自信息
+
+        Args:
+            sequences (List[List[int]]): token id 序列列表
+
+        Returns:
+            List[List[float]]: 与 sequences 顺序一致，每个序列返回长度为 len - 1 的自信息
+        """
+        import torch
+
+        pad_token_id = self.tokenizer.pad_token_id
+        if pad_token_id is None:
+            pad_token_id = self.tokenizer.eos_token_id or 0
+
+        results: List[List[float]] = [None] * len(sequences)
 
-    def _calculate_lexical_unit(self, tokens: List[str], self_info: List[float]):
-        def __noun_phrases(sent):
+        for batch in self.__make_batches([len(ids) for ids in sequences]):
+            max_length = max(len(sequences[idx]) for idx in batch)
+            input_ids = torch.full((len(batch), max_length), pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(batch), max_length), dtype=torch.long)
+            for row, idx in enumerate(batch):
+                input_ids[row, : len(sequences[idx])] = torch.tensor(sequences[idx])
+                attention_mask[row, : len(sequences[idx])] = 1
+            input_ids = input_ids.to(self.device)
+            attention_mask = attention_mask.to(self.device)
+
+            batch_self_infos = self.__compute_self_information(input_ids, attention_mask).tolist()
+
+            for row, idx in enumerate(batch):
+                results[idx] = batch_self_infos[row][: len(sequences[idx]) - 1]
+
+        return results
+
+    def __compute_self_information(
+        self, input_ids: "torch.Tensor", attention_mask: "torch.Tensor"
+    ) -> "torch.Tensor":
+        """计算每个位置下一个 token 的自信息 -log p(x_t | x_<t)
+
+        使用 logsumexp(logits) - logits[target] 的形式，等价于 log_softmax 后取目标 token，
+        数值稳定，且不会额外生成 softmax 与 log 两份 [seq, vocab] 的张量。
+
+        Args:
+            input_ids (torch.Tensor): [batch, seq] 的 token id
+            attention_mask (torch.Tensor): [batch, seq] 的 attention mask
+
+        Returns:
+            torch.Tensor: [batch, seq - 1] 的自信息，第 t 列对应第 t + 1 个 token
+        """
+        import torch
+
+        targets = input_ids[:, 1:]
+        if targets.size(1) == 0:
+            return torch.zeros(targets.shape, dtype=torch.float32)
+
+        model = self.model
+        with torch.inference_mode(), self.__stage_seconds.time(stage="forward"):
+            if self.self_info_chunk_size is None or not self.__can_chunk_logits(input_ids):
+                logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+                return self.__gather_self_information(logits[:, :-1], targets).cpu()
+
+            hidden_states = model.base_model(
+                input_ids=input_ids, attention_mask=attention_mask
+            ).last_hidden_state[:, :-1]
+            output_layer = model.get_output_embeddings()
+
+            self_infos = []
+            for start in range(0, targets.size(1), self.self_info_chunk_size):
+                end = start + self.self_info_chunk_size
+                logits = output_layer(hidden_states[:, start:end])
+                self_infos.append(
+                    self.__gather_self_information(logits, targets[:, start:end]).cpu()
+                )
+
+            return torch.cat(self_infos, dim=1)
+
+    def __can_chunk_logits(self, input_ids: "torch.Tensor") -> bool:
+        """分块计算 logits 是否与完整的前向计算一致，结果在第一次调用时确定
+
+        分块时绕过了模型自己的 forward，只适用于 logits 就是输出层作用在最后隐状态上的模型；
+        编译后的模型、没有输出层的模型不分块，其他模型用一小段输入比较两种计算方式的 logits，
+        不一致（例如对 logits 做了缩放或截断）时不分块。
+        """
+        import torch
+
+        if self.__chunk_logits is None:
+            model = self.model
+            output_layer = model.get_output_embeddings() if not self.compile else None
+            if output_layer is None or getattr(model, "base_model", model) is model:
+                self.__chunk_logits = False
+            else:
+                probe = input_ids[:1, :8]
+                expected = model(input_ids=probe).logits.float()
+                actual = output_layer(model.base_model(input_ids=probe).last_hidden_state)
+                self.__chunk_logits = expected.shape == actual.shape and torch.allclose(
+                    expected, actual.float(), rtol=1e-3, atol=1e-3
+                )
+        return self.__chunk_logits
+
+    @staticmethod
+    def __gather_self_information(
+        logits: "torch.Tensor", targets: "torch.Tensor"
+    ) -> "torch.Tensor":
+        import torch
+
+        logits = logits.float()
+        target_logits = logits.gather(-1, targets.unsqueeze(-1)).squeeze(-1)
+        return torch.logsumexp(logits, dim=-1) - target_logits
+
+    @staticmethod
+    def __load_nlp(lang: str):
+        import spacy
+
+        if lang == "en":
+            nlp = spacy.load("en_core_web_sm", disable=["ner"])
+            nlp.add_pipe("merge_noun_chunks")
+            return nlp
+        elif lang == "zh":
+            return spacy.load("zh_core_web_sm", disable=["ner"])
+        return None
+
+    def __make_batches(self, lengths: List[int]) -> List[List[int]]:
+        """按 token 长度排序并切分批次，控制每批的句子数与 padding 后的 token 数
+
+        Args:
+            lengths (List[int]): 各句子的 token 长度
+
+        Returns:
+            List[List[int]]: 每个批次内句子的下标
+        """
+        batches: List[List[int]] = []
+        batch: List[int] = []
+
+        for idx in sorted(range(len(lengths)), key=lambda idx: lengths[idx]):
+            # 按长度升序遍历，当前句子就是批次内最长的句子
+            if batch and (
+                len(batch) + 1 > self.max_batch_size
+                or (len(batch) + 1) * lengths[idx] > self.max_tokens_per_batch
+            ):
+                batches.append(batch)
+                batch = []
+            batch.append(idx)
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def _calculate_lexical_unit(self, tokens: List[str], self_info: List[float], doc=None):
+        def __noun_phrases(doc):
             noun_phrases = []
-            doc = self.nlp(sent)
 
             for index, chunk in enumerate(doc):
                 if index == 0:
@@ -128,54 +713,63 @@ class SelectiveContext:
                     noun_phrases.append(doc[index - 1].whitespace_ + chunk.text)
             return noun_phrases
 
-        def __unit_info(tokens, self_info, units):
-            current_unit_idx = 0
-            current_position = 0
-            unit_self_info = [[] for _ in range(len(units))]
-
-            for idx, (token, info) in enumerate(zip(tokens, self_info)):
-                current_position += len(token)
-                if current_position == len(units[current_unit_idx]):
-                    unit_self_info[current_unit_idx].append(info)
-                    current_position = current_position - len(units[current_unit_idx])
-                    current_unit_idx += 1
-                elif current_position > len(units[current_unit_idx]):
-                    counter_ = 1
-                    current_position = current_position - len(units[current_unit_idx])
-                    current_unit_idx += 1
-                    while current_position >= len(units[current_unit_idx]):
-                        counter_ += 1
-                        current_position = current_position - len(units[current_unit_idx])
-                        current_unit_idx += 1
-                        if current_unit_idx >= len(units):
-                            break
-                    partial_info = info / counter_
-                    for _ in range(counter_):
-                        unit_self_info[(current_unit_idx - 1) - _].append(partial_info)
-                else:
-                    if token == " ":
-                        continue
-                    unit_self_info[current_unit_idx].append(info)
+        if doc is None:
+            nlp = self.nlp
+            with self.__stage_seconds.time(stage="chunk"):
+                doc = nlp("".join(tokens))
+        with self.__stage_seconds.time(stage="align"):
+            noun_phrases = __noun_phrases(doc)
+            noun_phrases_info = align_unit_self_information(
+                [len(token) for token in tokens],
+                self_info,
+                [len(phrase) for phrase in noun_phrases],
+                whitespace_tokens=[token == " " for token in tokens],
+            ).tolist()
+
+        return noun_phrases, noun_phrases_info
 
-            unit_self_info_ = [np.mean(info) for info in unit_self_info]
-            return unit_self_info_
+    def __parse_sentences(self, sentences: List[str]) -> list:
+        """使用 nlp.pipe 批量执行 spaCy 流水线
 
-        sent = "".join(tokens)
-        noun_phrases = __noun_phrases(sent)
-        noun_phrases_info = __unit_info(tokens, self_info, noun_phrases)
+        Args:
+            sentences (List[str]): 句子列表
 
-        return noun_phrases, noun_phrases_info
+        Returns:
+            list: 与 sentences 顺序一致的 spaCy Doc 列表
+        """
+        nlp = self.nlp
+        with self.__stage_seconds.time(stage="chunk"):
+            return list(
+                nlp.pipe(
+                    sentences, batch_size=self.spacy_batch_size, n_process=self.spacy_n_process
+                )
+            )
 
-    def __split_lexical_unit(self, sentences: List[str], unit_type: str = "phrase"):
+    def __split_lexical_unit(
+        self,
+        sentences: List[str],
+        unit_type: str = "phrase",
+        infos: Optional[List[dict]] = None,
+        docs: Optional[list] = None,
+    ):
         texts: List[str] = []
         self_infos: List[float] = []
 
-        for sentence in sentences:
-            infos: dict = self.__get_self_information(sentence)
-            tokens, self_info = infos["tokens"], infos["self_infos"]
+        if infos is None:
+            infos = self.__get_self_information_batch(sentences)
+
+        if unit_type != "phrase":
+            docs = [None] * len(sentences)
+        elif docs is None:
+            docs = self.__parse_sentences(["".join(info["tokens"]) for info in infos])
+
+        for sentence, info, doc in zip(sentences, infos, docs):
+            tokens, self_info = info["tokens"], info["self_infos"]
 
             if unit_type == "phrase":
-                noun_phrases, noun_phrases_info = self._calculate_lexical_unit(tokens, self_info)
+                noun_phrases, noun_phrases_info = self._calculate_lexical_unit(
+                    tokens, self_info, doc=doc
+                )
 
                 # We need to add a space before the first noun phrase for every sentence except the first one
                 if texts:
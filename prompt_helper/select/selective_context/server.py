@@ -0,0 +1,372 @@
+import json
+import time
+import queue
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from prompt_helper.utils.metrics import REGISTRY, MetricsRegistry
+
+
+class QueueFullError(RuntimeError):
+    """请求队列已满，调用方应稍后重试"""
+
+
+class MicroBatcher:
+    """把并发的压缩请求合并成微批次
+
+    工作线程取到第一个请求后，最多再等待 max_wait_ms 毫秒或凑满 max_batch_size 个请求，
+    然后按 (reduce_ratio, reduce_level) 分组调用 compress_batch。
+    队列长度超过 max_queue_size 时 submit 直接抛出 QueueFullError，形成背压。
+    """
+
+    def __init__(
+        self,
+        compressor,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        max_queue_size: int = 256,
+    ):
+        """
+        :param compressor:     SelectiveContext 提供 compress_batch 方法的压缩器
+        :param max_batch_size: int              每个微批次的最大请求数
+        :param max_wait_ms:    float            取到首个请求后等待更多请求的最长时间（毫秒）
+        :param max_queue_size: int              排队请求的最大数量
+        """
+        self.compressor = compressor
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self.__queue: "queue.Queue[Optional[Tuple[str, float, str, Future]]]" = queue.Queue(
+            maxsize=max_queue_size
+        )
+        self.__lock = threading.Lock()
+        self.__worker: Optional[threading.Thread] = None
+
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_rejected = 0
+
+    def start(self) -> "MicroBatcher":
+        if self.__worker is None:
+            self.__worker = threading.Thread(
+                target=self.__run, name="selective-context-batcher", daemon=True
+            )
+            self.__worker.start()
+        return self
+
+    def stop(self):
+        """停止工作线程，已在队列中的请求会先处理完"""
+        if self.__worker is not None:
+            self.__queue.put(None)
+            self.__worker.join()
+            self.__worker = None
+
+    def submit(self, context: str, reduce_ratio: float = 0.35, reduce_level: str = "phrase"):
+        """提交一个压缩请求
+
+        Args:
+            context (str): 文档文本
+            reduce_ratio (float, optional): 删除的比例. Defaults to 0.35.
+            reduce_level (str, optional): 删除的粒度. Defaults to "phrase".
+
+        Raises:
+            QueueFullError: 队列已满
+
+        Returns:
+            Future: 结果为 (原文, 压缩结果)
+        """
+        future: Future = Future()
+        try:
+            self.__queue.put_nowait((context, reduce_ratio, reduce_level, future))
+        except queue.Full:
+            with self.__lock:
+                self.n_rejected += 1
+            raise QueueFullError("compression queue is full")
+
+        with self.__lock:
+            self.n_requests += 1
+        return future
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "requests": self.n_requests,
+                "batches": self.n_batches,
+                "rejected": self.n_rejected,
+                "queue_size": self.__queue.qsize(),
+                "mean_batch_size": self.n_requests / self.n_batches if self.n_batches else 0.0,
+            }
+
+    """
+    工具函数区域
+    """
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = (
+                        self.__queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self.__queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self.__process(batch)
+            if stopping:
+                return
+
+    def __process(self, batch: List[Tuple[str, float, str, Future]]):
+        with self.__lock:
+            self.n_batches += 1
+
+        groups: Dict[Tuple[float, str], List[Tuple[str, Future]]] = {}
+        for context, reduce_ratio, reduce_level, future in batch:
+            if future.set_running_or_notify_cancel():
+                groups.setdefault((reduce_ratio, reduce_level), []).append((context, future))
+
+        for (reduce_ratio, reduce_level), items in groups.items():
+            try:
+                results = self.compressor.compress_batch(
+                    [context for context, _ in items],
+                    reduce_ratio=reduce_ratio,
+                    reduce_level=reduce_level,
+                )
+            except Exception as error:
+                for _, future in items:
+                    future.set_exception(error)
+                continue
+
+            for (_, future), result in zip(items, results):
+                future.set_result(result)
+
+
+class _CompressionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.__send(200, {"code": 1, "msg": "Success", "data": "ok"})
+        elif self.path == "/stats":
+            self.__send(200, {"code": 1, "msg": "Success", "data": self.server.batcher.stats()})
+        elif self.path == "/metrics":
+            body = self.server.metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.__send(404, {"code": 0, "msg": f"Unknown path {self.path}", "data": ""})
+
+    def do_POST(self):
+        if self.path != "/compress":
+            self.__send(404, {"code": 0, "msg": f"Unknown path {self.path}", "data": ""})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            contexts = body["contexts"] if "contexts" in body else [body["context"]]
+            if not isinstance(contexts, list) or not all(
+                isinstance(context, str) for context in contexts
+            ):
+                raise ValueError("context should be a string and contexts a list of strings")
+            reduce_ratio = float(body.get("reduce_ratio", 0.35))
+            reduce_level = body.get("reduce_level", "phrase")
+            if reduce_level not in ["phrase", "sentence", "token"]:
+                raise ValueError(f"invalid reduce_level {reduce_level}")
+        except Exception as error:
+            self.__send(400, {"code": 0, "msg": f"Bad request. reason: {error}", "data": ""})
+            return
+
+        futures: List[Future] = []
+        try:
+            for context in contexts:
+                futures.append(self.server.batcher.submit(context, reduce_ratio, reduce_level))
+        except QueueFullError as error:
+            # 多文档请求只被接收了一部分时，取消已排队的部分
+            for future in futures:
+                future.cancel()
+            self.__send(503, {"code": 0, "msg": str(error), "data": ""}, {"Retry-After": "1"})
+            return
+
+        # 所有文档共享同一个超时时间，超时后取消还没有开始处理的部分
+        _, not_done = wait(futures, timeout=self.server.request_timeout)
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            self.__send(
+                504,
+                {
+                    "code": 0,
+                    "msg": f"Compression timed out after {self.server.request_timeout}s",
+                    "data": "",
+                },
+            )
+            return
+
+        try:
+            results = [future.result() for future in futures]
+        except Exception as error:
+            self.__send(
+                500, {"code": 0, "msg": f"Failed to compress. reason: {error}", "data": ""}
+            )
+            return
+
+        data = [{"context": context, "compressed": compressed} for context, compressed in results]
+        self.__send(200, {"code": 1, "msg": "Success", "data": data})
+
+    def log_message(self, format, *args):
+        pass
+
+    def __send(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler 需要 (host, port) 形式的客户端地址
+        return request, ("unix", 0)
+
+
+class CompressionServer:
+    """常驻的本地压缩服务
+
+    进程内只持有一个 SelectiveContext，通过 HTTP（TCP 端口或 Unix socket）对外提供服务，
+    并发请求由 MicroBatcher 合并成微批次。
+
+    接口：
+    - POST /compress  {"context": str} 或 {"contexts": [str]}，可选 reduce_ratio、reduce_level
+    - GET  /health
+    - GET  /stats
+    - GET  /metrics   Prometheus 文本格式的指标
+    队列已满时返回 503 与 Retry-After，请求格式错误时返回 400，超过 request_timeout 时返回 504。
+    """
+
+    def __init__(
+        self,
+        compressor,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        unix_socket: Optional[str] = None,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        max_queue_size: int = 256,
+        request_timeout: Optional[float] = 60.0,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        :param compressor:      SelectiveContext 提供 compress_batch 方法的压缩器
+        :param host:            str              监听地址
+        :param port:            int              监听端口，为 0 时随机分配
+        :param unix_socket:     str              Unix socket 路径，指定时忽略 host 与 port
+        :param max_batch_size:  int              每个微批次的最大请求数
+        :param max_wait_ms:     float            凑批的最长等待时间（毫秒）
+        :param max_queue_size:  int              排队请求的最大数量
+        :param request_timeout: float            单个请求等待结果的最长时间（秒）
+        :param metrics:         MetricsRegistry  /metrics 导出的指标注册表，为 None 时使用全局的 REGISTRY
+        """
+        self.batcher = MicroBatcher(
+            compressor,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            max_queue_size=max_queue_size,
+        )
+
+        if unix_socket is not None:
+            self.httpd = _ThreadingUnixHTTPServer(unix_socket, _CompressionHandler)
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), _CompressionHandler)
+            self.httpd.daemon_threads = True
+        self.httpd.batcher = self.batcher
+        self.httpd.request_timeout = request_timeout
+        self.httpd.metrics = metrics if metrics is not None else REGISTRY
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def serve_forever(self):
+        self.batcher.start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.batcher.stop()
+
+    def start(self) -> "CompressionServer":
+        """在后台线程中启动服务"""
+        self.batcher.start()
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.batcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SelectiveContext compression service")
+    parser.add_argument("--model", required=True, help="model name or path")
+    parser.add_argument("--device", default="auto")
+    parser.add_argument("--dtype", default="fp32", choices=["fp32", "bf16", "int8"])
+    parser.add_argument("--num-threads", type=int, default=None)
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", default=None)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--max-queue-size", type=int, default=256)
+    args = parser.parse_args()
+
+    from .main import SelectiveContext
+
+    compressor = SelectiveContext(
+        args.model,
+        device=args.device,
+        lang=args.lang,
+        dtype=args.dtype,
+        num_threads=args.num_threads,
+    ).warmup()
+    server = CompressionServer(
+        compressor,
+        host=args.host,
+        port=args.port,
+        unix_socket=args.unix_socket,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_queue_size=args.max_queue_size,
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
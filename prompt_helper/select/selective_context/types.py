@@ -1,23 +1,133 @@
-from typing import List
-from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
 
 
-@dataclass
 class LexicalUnits:
-    unit_type: str
-    texts: List[str]
-    self_infos: List[float] = None
+    """词法单元序列
+
+    自信息保存在连续的 float32 数组中，文本保存为一个拼接后的字符串加偏移数组。
+    切片返回共享底层存储的视图；push_head / push_tail 原地添加，存储按倍数扩容，
+    摊还复杂度为 O(1)，add_to_head / add_to_tail 与之前一样返回新的对象。
+    对视图添加元素时会先复制出独立的存储，不会影响原对象。
+    """
+
+    __slots__ = (
+        "unit_type",
+        "_infos",
+        "_offsets",
+        "_lo",
+        "_hi",
+        "_buffer",
+        "_origin",
+        "_head_pieces",
+        "_tail_pieces",
+        "_shared",
+    )
+
+    def __init__(
+        self,
+        unit_type: str,
+        texts: Optional[Sequence[str]] = None,
+        self_infos: Optional[Sequence[float]] = None,
+    ):
+        """
+        Args:
+            unit_type (str): 单元类型，phrase、sentence 或 token
+            texts (Optional[Sequence[str]], optional): 单元文本. Defaults to None.
+            self_infos (Optional[Sequence[float]], optional): 单元自信息. Defaults to None.
+        """
+        texts = list(texts) if texts is not None else []
+        if self_infos is None:
+            self_infos = np.full(len(texts), np.nan, dtype=np.float32)
+        assert len(texts) == len(self_infos), "texts and self_infos must have the same length"
+
+        self.unit_type = unit_type
+        self._infos = np.asarray(self_infos, dtype=np.float32).copy()
+        self._offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=self._offsets[1:])
+        self._lo, self._hi = 0, len(texts)
+        self._buffer = "".join(texts)
+        self._origin = 0
+        self._head_pieces: List[str] = []
+        self._tail_pieces: List[str] = []
+        self._shared = False
+
+    @property
+    def texts(self) -> List[str]:
+        """单元文本列表"""
+        buffer, origin = self.__materialize()
+        offsets = (self._offsets[self._lo : self._hi + 1] + origin).tolist()
+        return [buffer[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    @property
+    def self_infos(self) -> np.ndarray:
+        """单元自信息，float32 数组视图"""
+        return self._infos[self._lo : self._hi]
+
+    @property
+    def text(self) -> str:
+        """全部单元拼接后的文本"""
+        buffer, origin = self.__materialize()
+        return buffer[self._offsets[self._lo] + origin : self._offsets[self._hi] + origin]
+
+    def __len__(self) -> int:
+        return self._hi - self._lo
+
+    def __iter__(self) -> Iterable[Tuple[str, float]]:
+        return iter(zip(self.texts, self.self_infos.tolist()))
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            assert step == 1, "LexicalUnits only supports contiguous slices"
+            stop = max(start, stop)
+
+            view = LexicalUnits.__new__(LexicalUnits)
+            view.unit_type = self.unit_type
+            view._infos, view._offsets = self._infos, self._offsets
+            view._lo, view._hi = self._lo + start, self._lo + stop
+            view._buffer, view._origin = self.__materialize()
+            view._head_pieces, view._tail_pieces = [], []
+            view._shared = True
+            return view
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("LexicalUnits index out of range")
+
+        buffer, origin = self.__materialize()
+        start, end = self._offsets[self._lo + index], self._offsets[self._lo + index + 1]
+        return buffer[start + origin : end + origin], float(self._infos[self._lo + index])
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, LexicalUnits):
+            return NotImplemented
+        return (
+            self.unit_type == other.unit_type
+            and self.texts == other.texts
+            and np.array_equal(self.self_infos, other.self_infos, equal_nan=True)
+        )
+
+    def __repr__(self) -> str:
+        return f"LexicalUnits(unit_type={self.unit_type!r}, size={len(self)})"
 
     def __add__(self, other):
         assert self.unit_type == other.unit_type, "Cannot add two different unit types"
-        return LexicalUnits(
-            self.unit_type, self.text + other.text, self.self_info + other.self_info
-        )
+        result = LexicalUnits(self.unit_type)
+        result._infos = np.concatenate((self.self_infos, other.self_infos))
+        self_offsets = self._offsets[self._lo : self._hi + 1] - self._offsets[self._lo]
+        other_offsets = other._offsets[other._lo : other._hi + 1] - other._offsets[other._lo]
+        result._offsets = np.concatenate((self_offsets, other_offsets[1:] + self_offsets[-1]))
+        result._hi = len(result._infos)
+        result._buffer = self.text + other.text
+        return result
 
     def __radd__(self, other):
         if other == 0:
             return self
-        return NotImplementedError()
+        return NotImplemented
 
     def add_to_head(self, token: str, self_info: float):
         """添加到头部
@@ -29,7 +139,7 @@ class LexicalUnits:
         Returns:
             LexicalUnits: 返回新的 LexicalUnits 对象
         """
-        return LexicalUnits(self.unit_type, [token] + self.texts, [self_info] + self.self_infos)
+        return self[:].push_head(token, self_info)
 
     def add_to_tail(self, token: str, self_info: float):
         """添加到尾部
@@ -41,4 +151,84 @@ class LexicalUnits:
         Returns:
             LexicalUnits: 返回新的 LexicalUnits 对象
         """
-        return LexicalUnits(self.unit_type, self.texts + [token], self.self_infos + [self_info])
+        return self[:].push_tail(token, self_info)
+
+    def push_head(self, token: str, self_info: float):
+        """原地添加到头部
+
+        Args:
+            token (str): 添加的 token
+            self_info (float): 添加 token 的 self_info
+
+        Returns:
+            LexicalUnits: 返回自身
+        """
+        self.__ensure_capacity(head=1)
+        self._lo -= 1
+        self._infos[self._lo] = self_info
+        self._offsets[self._lo] = self._offsets[self._lo + 1] - len(token)
+        self._head_pieces.append(token)
+        return self
+
+    def push_tail(self, token: str, self_info: float):
+        """原地添加到尾部
+
+        Args:
+            token (str): 添加的 token
+            self_info (float): 添加 token 的 self_info
+
+        Returns:
+            LexicalUnits: 返回自身
+        """
+        self.__ensure_capacity(tail=1)
+        self._infos[self._hi] = self_info
+        self._offsets[self._hi + 1] = self._offsets[self._hi] + len(token)
+        self._hi += 1
+        self._tail_pieces.append(token)
+        return self
+
+    def mask(self, threshold: float) -> np.ndarray:
+        """返回自信息低于阈值的单元掩码（nan 不会被掩码）"""
+        return self.self_infos < threshold
+
+    """
+    工具函数区域
+    """
+
+    def __materialize(self) -> Tuple[str, int]:
+        """把头尾追加的文本合并进 buffer，返回 (buffer, origin)"""
+        if self._head_pieces or self._tail_pieces:
+            head = "".join(reversed(self._head_pieces))
+            self._buffer = head + self._buffer + "".join(self._tail_pieces)
+            self._origin += len(head)
+            self._head_pieces, self._tail_pieces = [], []
+        return self._buffer, self._origin
+
+    def __ensure_capacity(self, head: int = 0, tail: int = 0):
+        if self._shared:
+            # 视图与原对象共享存储，添加前先复制出只包含自身内容的存储
+            self.__reallocate(0, 0)
+            buffer, origin = self.__materialize()
+            start = self._offsets[self._lo]
+            self._buffer = buffer[start + origin : self._offsets[self._hi] + origin]
+            self._offsets[self._lo : self._hi + 1] -= start
+            self._origin = 0
+            self._shared = False
+
+        head_slack, tail_slack = self._lo, len(self._infos) - self._hi
+        if head_slack < head or tail_slack < tail:
+            size = max(len(self), 1)
+            self.__reallocate(
+                head_slack if head_slack >= head else max(size, head),
+                tail_slack if tail_slack >= tail else max(size, tail),
+            )
+
+    def __reallocate(self, head_slack: int, tail_slack: int):
+        size = len(self)
+        infos = np.empty(head_slack + size + tail_slack, dtype=np.float32)
+        offsets = np.empty(head_slack + size + tail_slack + 1, dtype=np.int64)
+        infos[head_slack : head_slack + size] = self.self_infos
+        offsets[head_slack : head_slack + size + 1] = self._offsets[self._lo : self._hi + 1]
+
+        self._infos, self._offsets = infos, offsets
+        self._lo, self._hi = head_slack, head_slack + size
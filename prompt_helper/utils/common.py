@@ -1,10 +1,6 @@
 import os
 import subprocess
 
-from rich import print
-from rich.panel import Panel
-from loguru import logger
-
 
 def get_root_dir() -> str:
     cur_path = os.path.abspath(os.path.dirname(__file__))  # 获取当前文件的目录
@@ -15,6 +11,9 @@ def get_root_dir() -> str:
 class Consoler:
     @staticmethod
     def print_in_panel(text: str, title: str = "", subtitle: str = ""):
+        from rich import print
+        from rich.panel import Panel
+
         if title and subtitle:
             print(Panel(text, title=title, subtitle=subtitle))
         elif title:
@@ -39,6 +38,8 @@ class SystemCommander:
 
 
 def get_logger(log_dir=None, format_=None):
+    from loguru import logger
+
     if log_dir is None:
         log_dir = "./logs"
     if format_ is None:
@@ -71,4 +72,10 @@ def get_logger(log_dir=None, format_=None):
     return logger
 
 
-logger_ = get_logger()
+def __getattr__(name: str):
+    # logger_ 在首次访问时才配置，导入本模块不会触发 loguru 的初始化
+    if name == "logger_":
+        global logger_
+        logger_ = get_logger()
+        return logger_
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,44 @@
 import abc
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from .response import LLMResponse
+
+
+class LLMServerError(Exception):
+    """LLM 服务调用失败
+
+    status_code 为 HTTP 状态码（网络错误等没有状态码时为 None），
+    retryable 表示是否值得重试（限流、服务端错误、网络错误），
+    retry_after 为服务端建议的重试等待秒数。
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retryable: Optional[bool] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = is_retryable_status(status_code) if retryable is None else retryable
+        self.retry_after = retry_after
+
+    @property
+    def throttled(self) -> bool:
+        return self.status_code == 429
+
+    def to_response(self) -> LLMResponse:
+        """转换为 generate 的失败返回值"""
+        return LLMResponse.from_error(self)
+
+
+def is_retryable_status(status_code: Optional[int]) -> bool:
+    """限流（429）、超时（408）、服务端错误（5xx）与没有状态码的网络错误可以重试"""
+    return status_code is None or status_code in (408, 429) or status_code >= 500
 
 
 class ABSLLMServer(metaclass=abc.ABCMeta):
@@ -12,4 +52,37 @@ class ABSLLMServer(metaclass=abc.ABCMeta):
         stream: bool = False,
         **kwargs,
     ):
+        """
+        非流式调用返回 LLMResponse（成功时 code 为 1，失败时 code 为 0），
+        流式调用返回逐个产出文本增量的迭代器
+        """
         raise NotImplementedError
+
+    async def agenerate(self, prompt: str, **kwargs):
+        """异步生成，默认将同步的 generate 放到线程池中执行
+
+        Args:
+            prompt (str): prompt 文本
+
+        Returns:
+            与 generate(stream=False) 的返回值相同
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.generate, prompt, stream=False, **kwargs)
+        )
+
+    def generate_many(self, prompts: List[str], max_concurrency: int = 8, **kwargs) -> list:
+        """并发生成多个 prompt 的结果
+
+        Args:
+            prompts (List[str]): prompt 文本列表
+            max_concurrency (int, optional): 最大并发请求数. Defaults to 8.
+
+        Returns:
+            list: 与 prompts 顺序一致的结果列表
+        """
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            return list(
+                executor.map(lambda prompt: self.generate(prompt, stream=False, **kwargs), prompts)
+            )
@@ -0,0 +1,227 @@
+import copy
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from . import ABSLLMServer, LLMResponse
+from .response import json_dumps, json_loads
+
+
+class CachedLLMServer(ABSLLMServer):
+    """带缓存的 LLM 服务包装器
+
+    以 (model, prompt, 生成参数) 的哈希作为键，内存 LRU 在前、sqlite 磁盘存储在后。
+    默认只缓存确定性调用（temperature == 0），流式调用与失败的调用不会被缓存。
+    timeout 等只影响传输的参数不参与缓存键，每次命中都返回缓存结果的副本。
+    """
+
+    # 不影响生成结果的传输参数，不参与缓存键
+    TRANSPORT_KWARGS = frozenset({"timeout", "deadline", "stream", "headers", "request_id"})
+
+    def __init__(
+        self,
+        llm_server: ABSLLMServer,
+        cache_path: Optional[str] = None,
+        max_memory_entries: int = 1024,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+        cache_non_deterministic: bool = False,
+    ):
+        """
+        :param llm_server:              ABSLLMServer 被包装的 LLM 服务
+        :param cache_path:              str          sqlite 文件路径，为 None 时只使用内存缓存
+        :param max_memory_entries:      int          内存 LRU 的最大条目数
+        :param max_disk_bytes:          int          磁盘缓存的最大字节数，超出后淘汰最久未访问的条目
+        :param cache_non_deterministic: bool         是否缓存 temperature 不为 0 的调用，默认为 False
+        """
+        super().__init__()
+        self.__llm_server = llm_server
+        self.__max_memory_entries = max_memory_entries
+        self.__max_disk_bytes = max_disk_bytes
+        self.__cache_non_deterministic = cache_non_deterministic
+
+        self.__lock = threading.Lock()
+        self.__memory: "OrderedDict[str, dict]" = OrderedDict()
+        self.__conn: Optional[sqlite3.Connection] = None
+        self.__disk_bytes = 0
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+        if cache_path is not None:
+            self.__conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "accessed REAL NOT NULL)"
+            )
+            self.__conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)"
+            )
+            self.__conn.commit()
+            self.__disk_bytes = self.__conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()[0]
+
+    @staticmethod
+    def make_key(prompt: str, **kwargs) -> str:
+        """根据 model、prompt 与生成参数计算缓存键"""
+        params = {
+            name: value
+            for name, value in kwargs.items()
+            if name not in CachedLLMServer.TRANSPORT_KWARGS
+        }
+        payload = json.dumps(
+            {"model": kwargs.get("model", ""), "prompt": prompt, "kwargs": params},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def generate(self, prompt: str, stream: bool = False, **kwargs):
+        if stream or not self.__is_cacheable(**kwargs):
+            with self.__lock:
+                self.bypasses += 1
+            return self.__llm_server.generate(prompt, stream=stream, **kwargs)
+
+        key = self.make_key(prompt, **kwargs)
+        resp = self.__get(key)
+        if resp is not None:
+            return resp
+
+        resp = self.__llm_server.generate(prompt, stream=False, **kwargs)
+        # 失败的调用不缓存，下次仍会重新请求
+        if isinstance(resp, LLMResponse) and resp.ok:
+            self.__put(key, resp)
+        elif isinstance(resp, dict) and resp.get("code") == 1 and resp.get("data"):
+            self.__put(key, resp)
+
+        return resp
+
+    def stats(self) -> dict:
+        """返回缓存命中统计"""
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self.__memory),
+                "disk_bytes": self.__disk_bytes,
+            }
+
+    def reset_stats(self):
+        with self.__lock:
+            self.hits = self.memory_hits = self.disk_hits = 0
+            self.misses = self.bypasses = 0
+
+    def close(self):
+        with self.__lock:
+            if self.__conn is not None:
+                self.__conn.close()
+                self.__conn = None
+
+    """
+    工具函数区域
+    """
+
+    def __is_cacheable(self, **kwargs) -> bool:
+        if self.__cache_non_deterministic:
+            return True
+        return kwargs.get("temperature") == 0
+
+    def __get(self, key: str) -> Optional[dict]:
+        with self.__lock:
+            if key in self.__memory:
+                self.__memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return copy.deepcopy(self.__memory[key])
+
+            if self.__conn is not None:
+                row = self.__conn.execute(
+                    "SELECT value FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self.__conn.execute(
+                        "UPDATE llm_cache SET accessed = ? WHERE key = ?", (time.time(), key)
+                    )
+                    self.__conn.commit()
+                    resp = self.__decode(row[0])
+                    self.__remember(key, resp)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return resp
+
+            self.misses += 1
+            return None
+
+    def __put(self, key: str, resp: dict):
+        with self.__lock:
+            self.__remember(key, resp)
+
+            if self.__conn is None:
+                return
+
+            value = self.__encode(resp)
+            size = len(value.encode("utf-8"))
+            old = self.__conn.execute(
+                "SELECT size FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if old is not None:
+                self.__disk_bytes -= old[0]
+
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self.__disk_bytes += size
+            self.__evict_disk()
+            self.__conn.commit()
+
+    @staticmethod
+    def __encode(resp) -> str:
+        if isinstance(resp, LLMResponse):
+            return json_dumps({"response": resp.to_dict()})
+        return json_dumps(resp)
+
+    @staticmethod
+    def __decode(value: str):
+        # LLMResponse 存为 {"response": {...}}，其他为 generate 返回的原始字典
+        resp = json_loads(value)
+        if isinstance(resp, dict) and set(resp) == {"response"}:
+            return LLMResponse.from_dict(resp["response"])
+        return resp
+
+    def __remember(self, key: str, resp: dict):
+        # 保存副本，调用方修改返回的结果不会影响缓存
+        self.__memory[key] = copy.deepcopy(resp)
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.__max_memory_entries:
+            self.__memory.popitem(last=False)
+
+    def __evict_disk(self):
+        """按最久未访问的顺序淘汰磁盘条目，直到总大小不超过上限"""
+        while self.__disk_bytes > self.__max_disk_bytes:
+            rows = self.__conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed ASC LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self.__disk_bytes = 0
+                break
+
+            for key, size in rows:
+                self.__conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.__disk_bytes -= size
+                if self.__disk_bytes <= self.__max_disk_bytes:
+                    break
@@ -0,0 +1,83 @@
+import math
+import time
+from typing import Optional, Tuple
+
+from . import ABSLLMServer, LLMResponse
+from prompt_helper.utils.metrics import REGISTRY, MetricsRegistry
+
+
+class InstrumentedLLMServer(ABSLLMServer):
+    """记录调用指标的 LLM 服务包装器
+
+    记录的指标（标签为 server 与 model）：
+    - llm_request_seconds          非流式调用的延迟分布
+    - llm_requests_total           调用次数，status 为 ok、error（code 为 0）或 exception
+    - llm_prompt_tokens_total      prompt token 数
+    - llm_completion_tokens_total  completion token 数
+    响应中带有 usage 时使用服务返回的 token 数，否则按约 4 个字符 1 个 token 估计。
+    """
+
+    def __init__(
+        self,
+        llm_server: ABSLLMServer,
+        name: str = "default",
+        registry: Optional[MetricsRegistry] = None,
+    ):
+        """
+        :param llm_server: ABSLLMServer    被包装的 LLM 服务
+        :param name:       str             指标中 server 标签的值
+        :param registry:   MetricsRegistry 指标注册表，为 None 时使用全局的 REGISTRY
+        """
+        super().__init__()
+        self.__llm_server = llm_server
+        self.__name = name
+
+        registry = registry if registry is not None else REGISTRY
+        self.__latency = registry.histogram("llm_request_seconds", "LLM request latency")
+        self.__requests = registry.counter("llm_requests_total", "LLM requests by status")
+        self.__prompt_tokens = registry.counter("llm_prompt_tokens_total", "LLM prompt tokens")
+        self.__completion_tokens = registry.counter(
+            "llm_completion_tokens_total", "LLM completion tokens"
+        )
+
+    def generate(self, prompt: str, stream: bool = False, **kwargs):
+        labels = {"server": self.__name, "model": kwargs.get("model", "")}
+        if stream:
+            self.__requests.inc(status="stream", **labels)
+            return self.__llm_server.generate(prompt, stream=True, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            resp = self.__llm_server.generate(prompt, stream=False, **kwargs)
+        except Exception:
+            self.__requests.inc(status="exception", **labels)
+            raise
+        finally:
+            self.__latency.observe(time.perf_counter() - start, **labels)
+
+        ok = isinstance(resp, (dict, LLMResponse)) and resp.get("code") == 1
+        self.__requests.inc(status="ok" if ok else "error", **labels)
+        if ok:
+            prompt_tokens, completion_tokens = self.__count_tokens(prompt, resp)
+            self.__prompt_tokens.inc(prompt_tokens, **labels)
+            self.__completion_tokens.inc(completion_tokens, **labels)
+
+        return resp
+
+    """
+    工具函数区域
+    """
+
+    @staticmethod
+    def __count_tokens(prompt: str, resp) -> Tuple[int, int]:
+        try:
+            response = LLMResponse.coerce(resp)
+            usage = response.usage or {}
+            if "prompt_tokens" in usage and "completion_tokens" in usage:
+                return int(usage["prompt_tokens"]), int(usage["completion_tokens"])
+            content = response.content or ""
+        except Exception:
+            data = resp.get("data")
+            content = data if isinstance(data, str) else ""
+
+        return math.ceil(len(prompt) / 4), math.ceil(len(content) / 4)
@@ -0,0 +1,49 @@
+from typing import Any, List, Mapping, Optional, Iterator
+
+from langchain.llms.base import LLM
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk
+
+from .xinchen import XinchenChatClient
+
+
+class EnglishChatLLM(LLM):
+    client: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "custom"
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        if self.client is None:
+            self.client = XinchenChatClient()
+        # 失败时抛出 LLMServerError，由调用方决定是否重试
+        return self.client.request(prompt, **kwargs).content
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        if self.client is None:
+            self.client = XinchenChatClient()
+
+        if stop is not None:
+            kwargs["stop"] = stop
+        for delta in self.client.stream_chat(prompt, **kwargs):
+            chunk = GenerationChunk(text=delta)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(delta, chunk=chunk)
+            yield chunk
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return {"n": 10}
@@ -0,0 +1,367 @@
+import time
+import random
+import threading
+from typing import Optional
+
+from . import ABSLLMServer, LLMResponse, LLMServerError, is_retryable_status
+
+
+class TokenBucket:
+    """令牌桶限流器：以 rate 个/秒的速度补充令牌，最多积累 capacity 个"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        :param rate:     float 每秒补充的令牌数
+        :param capacity: float 桶容量（允许的突发请求数），默认为 max(1, rate)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.__tokens = self.capacity
+        self.__updated_at = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self, deadline: Optional[float] = None) -> bool:
+        """获取一个令牌，必要时等待
+
+        Args:
+            deadline (Optional[float], optional): time.monotonic() 下的截止时刻. Defaults to None.
+
+        Returns:
+            bool: 截止时刻之前拿到令牌时返回 True
+        """
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(
+                    self.capacity, self.__tokens + (now - self.__updated_at) * self.rate
+                )
+                self.__updated_at = now
+
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return True
+                wait = (1 - self.__tokens) / self.rate
+
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class AIMDLimiter:
+    """AIMD（加性增、乘性减）自适应并发限制
+
+    每次成功且延迟未超过 latency_target 时，并发上限增加 1 / limit（约每轮增加 1）；
+    遇到限流或延迟超标时上限乘以 backoff。同一批在途请求只会触发一次下调。
+    """
+
+    def __init__(
+        self,
+        initial: float = 4,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        backoff: float = 0.5,
+        latency_target: Optional[float] = None,
+    ):
+        """
+        :param initial:        float 初始并发上限
+        :param min_limit:      float 并发上限的最小值
+        :param max_limit:      float 并发上限的最大值
+        :param backoff:        float 下调时的乘数
+        :param latency_target: float 延迟目标（秒），超过时视为拥塞，为 None 时只根据限流下调
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_target = latency_target
+
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self.__condition = threading.Condition()
+        self.__generation = 0
+
+    def acquire(self, deadline: Optional[float] = None) -> Optional[int]:
+        """等待空闲的并发槽位
+
+        Returns:
+            Optional[int]: 获取到槽位时返回当前的代数（用于 release），超过截止时刻时返回 None
+        """
+        with self.__condition:
+            while self.in_flight >= int(self.limit):
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    return None
+                self.__condition.wait(timeout)
+
+            self.in_flight += 1
+            return self.__generation
+
+    def release(self, generation: int, congested: bool, latency: Optional[float] = None):
+        """释放槽位并根据结果调整并发上限
+
+        Args:
+            generation (int): acquire 返回的代数
+            congested (bool): 是否遇到限流
+            latency (Optional[float], optional): 本次请求的延迟（秒）. Defaults to None.
+        """
+        with self.__condition:
+            self.in_flight -= 1
+
+            slow = (
+                self.latency_target is not None
+                and latency is not None
+                and latency > self.latency_target
+            )
+            if congested or slow:
+                # 下调之前发出的请求再次报告拥塞时不重复下调
+                if generation == self.__generation:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self.__generation += 1
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self.__condition.notify_all()
+
+
+class _LimitedStream:
+    """流式结果的包装：迭代结束、出错或调用 close() 时才释放 AIMD 的并发槽位
+
+    其他属性（如 ChatStream 的 stats、text）直接读取被包装的流。
+    """
+
+    def __init__(self, stream, limiter: AIMDLimiter, generation: int, latency: float):
+        self.__stream = stream
+        self.__iterator = iter(stream)
+        self.__limiter = limiter
+        self.__generation = generation
+        self.__latency = latency
+        self.__released = False
+        self.__lock = threading.Lock()
+
+    def __iter__(self) -> "_LimitedStream":
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.__iterator)
+        except BaseException:
+            self.__release()
+            raise
+
+    def __enter__(self) -> "_LimitedStream":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getattr__(self, name: str):
+        if name.startswith("_LimitedStream__"):
+            raise AttributeError(name)
+        return getattr(self.__stream, name)
+
+    def close(self):
+        try:
+            if hasattr(self.__stream, "close"):
+                self.__stream.close()
+        finally:
+            self.__release()
+
+    def __del__(self):
+        # 调用方没有读完也没有关闭时，在回收时归还槽位
+        self.__release()
+
+    def __release(self):
+        with self.__lock:
+            if self.__released:
+                return
+            self.__released = True
+        self.__limiter.release(self.__generation, congested=False, latency=self.__latency)
+
+
+class ResilientLLMServer(ABSLLMServer):
+    """带限流、自适应并发与重试的 LLM 服务包装器
+
+    - 令牌桶限制请求速率；
+    - AIMD 根据限流响应（429）与延迟自动调整并发上限，限流解除后吞吐逐渐恢复；
+    - 可重试的失败（限流、5xx、网络错误）按带抖动的指数退避重试，
+      优先使用服务端给出的 Retry-After；
+    - 每次调用可以设置截止时间（deadline 秒），它是整次调用的总耗时上限，包括等待令牌、
+      等待并发名额、退避与请求本身；剩余时间作为 timeout 参数传给被包装的服务，
+      超时后返回最后一次的失败结果。
+    - 流式调用在流读完、出错或关闭之前一直占用并发名额。
+    最终失败时返回 code 为 0 的 LLMResponse，与 XinchenLLMServer 的失败返回值一致。
+    """
+
+    def __init__(
+        self,
+        llm_server: ABSLLMServer,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        initial_concurrency: float = 4,
+        min_concurrency: float = 1,
+        max_concurrency: float = 64,
+        latency_target: Optional[float] = None,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        deadline: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        """
+        :param llm_server:          ABSLLMServer 被包装的 LLM 服务
+        :param rate:                float        每秒最多发出的请求数，为 None 时不限速
+        :param burst:               float        令牌桶容量，默认为 max(1, rate)
+        :param initial_concurrency: float        初始并发上限
+        :param min_concurrency:     float        并发上限的最小值
+        :param max_concurrency:     float        并发上限的最大值
+        :param latency_target:      float        延迟目标（秒），超过时下调并发上限
+        :param max_retries:         int          最大重试次数
+        :param base_delay:          float        指数退避的初始等待秒数
+        :param max_delay:           float        单次退避的最大等待秒数
+        :param deadline:            float        每次调用的默认总耗时上限（秒），可以在调用时用 deadline 参数覆盖
+        :param seed:                int          退避抖动的随机种子
+        """
+        super().__init__()
+        self.__llm_server = llm_server
+        self.__bucket = TokenBucket(rate, burst) if rate is not None else None
+        self.limiter = AIMDLimiter(
+            initial=initial_concurrency,
+            min_limit=min_concurrency,
+            max_limit=max_concurrency,
+            latency_target=latency_target,
+        )
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+        self.__rng = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    def generate(self, prompt: str, stream: bool = False, **kwargs):
+        timeout: Optional[float] = kwargs.pop("deadline", self.deadline)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        attempt = 0
+        while True:
+            resp, error, retry_after = self.__attempt(prompt, stream, deadline, **kwargs)
+            if error is None and not self.__is_retryable_failure(resp):
+                if isinstance(resp, (dict, LLMResponse)) and resp.get("code") == 0:
+                    self.__count(failures=1)
+                return resp
+
+            if attempt >= self.max_retries:
+                break
+
+            delay = self.__backoff(attempt, retry_after)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                break
+
+            attempt += 1
+            self.__count(retries=1)
+            time.sleep(delay)
+
+        self.__count(failures=1)
+        if error is not None:
+            if stream:
+                raise error
+            if not isinstance(error, LLMServerError):
+                error = LLMServerError(f"{type(error).__name__}: {error}")
+            return error.to_response()
+        return resp
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "failures": self.failures,
+                "concurrency_limit": self.limiter.limit,
+                "in_flight": self.limiter.in_flight,
+            }
+
+    """
+    工具函数区域
+    """
+
+    def __attempt(self, prompt: str, stream: bool, deadline: Optional[float], **kwargs):
+        """执行一次调用，返回 (结果, 异常, 建议的重试等待秒数)"""
+        if self.__bucket is not None and not self.__bucket.acquire(deadline):
+            return None, LLMServerError("deadline exceeded while rate limited"), None
+
+        generation = self.limiter.acquire(deadline)
+        if generation is None:
+            return None, LLMServerError("deadline exceeded while waiting for concurrency"), None
+
+        if deadline is not None:
+            # 请求本身也不能超过截止时间，调用方设置的 timeout 更短时保留
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.limiter.release(generation, congested=False)
+                return None, LLMServerError("deadline exceeded before the request was sent"), None
+            kwargs["timeout"] = min(kwargs.get("timeout", remaining), remaining)
+
+        self.__count(requests=1)
+        start = time.monotonic()
+        resp, error = None, None
+        try:
+            resp = self.__llm_server.generate(prompt, stream=stream, **kwargs)
+        except Exception as exc:
+            if not self.__is_transient(exc):
+                self.limiter.release(generation, congested=False)
+                raise
+            error = exc
+
+        latency = time.monotonic() - start
+        status, retry_after = self.__failure_info(resp, error)
+        throttled = status == 429
+        if throttled:
+            self.__count(throttled=1)
+        if stream and error is None and not isinstance(resp, (dict, LLMResponse)):
+            # 流式结果在读完或关闭之前一直占用并发槽位
+            return _LimitedStream(resp, self.limiter, generation, latency), None, None
+        self.limiter.release(generation, congested=throttled, latency=latency)
+
+        return resp, error, retry_after
+
+    @staticmethod
+    def __is_transient(error: Exception) -> bool:
+        """可重试的异常：可重试的 LLMServerError 与网络相关的 OSError（含 requests 的异常）"""
+        if isinstance(error, LLMServerError):
+            return error.retryable
+        return isinstance(error, OSError)
+
+    @staticmethod
+    def __failure_info(resp, error):
+        if isinstance(error, LLMServerError):
+            return error.status_code, error.retry_after
+        if isinstance(resp, (dict, LLMResponse)) and resp.get("code") == 0:
+            return resp.get("status"), resp.get("retry_after")
+        return None, None
+
+    @staticmethod
+    def __is_retryable_failure(resp) -> bool:
+        if not isinstance(resp, (dict, LLMResponse)) or resp.get("code") != 0:
+            return False
+        if "retryable" in resp:
+            return bool(resp["retryable"])
+        return is_retryable_status(resp.get("status"))
+
+    def __backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """带完全抖动的指数退避，服务端给出 Retry-After 时至少等待该时长"""
+        with self.__lock:
+            delay = self.__rng.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def __count(self, requests: int = 0, retries: int = 0, throttled: int = 0, failures: int = 0):
+        with self.__lock:
+            self.requests += requests
+            self.retries += retries
+            self.throttled += throttled
+            self.failures += failures
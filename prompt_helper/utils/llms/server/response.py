@@ -0,0 +1,184 @@
+import json
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，没有安装时使用标准库
+    orjson = None
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    """解析 JSON，安装了 orjson 时使用 orjson，可以直接传入响应的原始字节"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj: Any) -> str:
+    """序列化为 JSON 字符串，安装了 orjson 时使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False)
+
+
+class LLMResponse:
+    """generate(stream=False) 的返回值
+
+    响应体只在收到时解析一次，生成的文本、token 用量、延迟与结束原因直接作为属性读取。
+    code 为 1 表示成功、0 表示失败，失败时 status、retryable、retry_after 与 LLMServerError 一致。
+
+    为兼容按字典读取的旧代码，支持 resp["code"]、resp["msg"]、resp.get("status") 等写法；
+    resp["data"] 为服务原始结果的 JSON 字符串，只在读取时才序列化。
+    """
+
+    __slots__ = (
+        "code",
+        "msg",
+        "content",
+        "usage",
+        "latency",
+        "finish_reason",
+        "status",
+        "retryable",
+        "retry_after",
+        "body",
+    )
+
+    # 可以按字典方式读取的字段
+    _KEYS = ("code", "msg", "data", "status", "retryable", "retry_after")
+
+    def __init__(
+        self,
+        code: int = 1,
+        msg: str = "Success",
+        content: str = "",
+        usage: Optional[dict] = None,
+        latency: Optional[float] = None,
+        finish_reason: Optional[str] = None,
+        status: Optional[int] = None,
+        retryable: Optional[bool] = None,
+        retry_after: Optional[float] = None,
+        body: Optional[dict] = None,
+    ):
+        """
+        :param code:          int   1 为成功，0 为失败
+        :param msg:           str   说明，失败时为失败原因
+        :param content:       str   生成的文本
+        :param usage:         dict  token 用量，例如 {"prompt_tokens": 10, "completion_tokens": 5}
+        :param latency:       float 请求耗时（秒）
+        :param finish_reason: str   结束原因，例如 stop、length
+        :param status:        int   HTTP 状态码
+        :param retryable:     bool  失败时是否值得重试
+        :param retry_after:   float 失败时服务端建议的重试等待秒数
+        :param body:          dict  服务返回的原始结果
+        """
+        self.code = code
+        self.msg = msg
+        self.content = content
+        self.usage = usage
+        self.latency = latency
+        self.finish_reason = finish_reason
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.body = body
+
+    @property
+    def ok(self) -> bool:
+        return self.code == 1
+
+    @property
+    def data(self) -> str:
+        """服务原始结果的 JSON 字符串，与旧的 {"code", "msg", "data"} 返回值中的 data 一致"""
+        return json_dumps(self.body) if self.body is not None else ""
+
+    @classmethod
+    def from_body(
+        cls, body: dict, latency: Optional[float] = None, status: Optional[int] = None
+    ) -> "LLMResponse":
+        """
+        从服务的结果构造，结果可以是 {"code", "data": {"choices", "usage"}} 或 OpenAI 格式
+        :raise KeyError / IndexError / TypeError 结果中没有生成的文本
+        """
+        data = body["data"] if isinstance(body.get("data"), dict) else body
+        choice: dict = data["choices"][0]
+        return cls(
+            content=choice["message"]["content"],
+            usage=data.get("usage"),
+            latency=latency,
+            finish_reason=choice.get("finish_reason"),
+            status=status,
+            body=body,
+        )
+
+    @classmethod
+    def from_bytes(
+        cls, raw: Union[bytes, str], latency: Optional[float] = None, status: Optional[int] = None
+    ) -> "LLMResponse":
+        """
+        从响应体的原始字节解析
+        :raise ValueError 响应体不是 JSON；KeyError / IndexError / TypeError 结果中没有生成的文本
+        """
+        return cls.from_body(json_loads(raw), latency=latency, status=status)
+
+    @classmethod
+    def from_error(cls, error) -> "LLMResponse":
+        """从 LLMServerError 构造失败的返回值"""
+        return cls(
+            code=0,
+            msg=f"Failed to generate response. reason: {error}",
+            status=error.status_code,
+            retryable=error.retryable,
+            retry_after=error.retry_after,
+        )
+
+    @classmethod
+    def coerce(cls, resp: Union["LLMResponse", dict]) -> "LLMResponse":
+        """
+        将 generate 的返回值统一为 LLMResponse，兼容旧的 {"code", "msg", "data"} 字典
+        :raise ValueError / KeyError / IndexError / TypeError 成功的返回值中无法解析出生成的文本
+        """
+        if isinstance(resp, cls):
+            return resp
+
+        if resp.get("code") != 1:
+            return cls(
+                code=0,
+                msg=resp.get("msg", f"{resp}"),
+                status=resp.get("status"),
+                retryable=resp.get("retryable"),
+                retry_after=resp.get("retry_after"),
+            )
+
+        data = resp["data"]
+        return cls.from_body(json_loads(data) if isinstance(data, (str, bytes)) else data)
+
+    def to_dict(self) -> dict:
+        """转换为可以 JSON 序列化的字典，与 from_dict 互逆"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, value: dict) -> "LLMResponse":
+        return cls(**value)
+
+    def __getitem__(self, key: str):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        value = getattr(self, key) if key in self._KEYS else None
+        return default if value is None else value
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._KEYS and getattr(self, key) is not None
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, LLMResponse):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        if self.ok:
+            return f"LLMResponse(content={self.content!r}, finish_reason={self.finish_reason!r})"
+        return f"LLMResponse(code=0, msg={self.msg!r}, status={self.status!r})"
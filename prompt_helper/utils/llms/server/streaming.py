@@ -0,0 +1,196 @@
+import math
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+from . import LLMServerError
+from .response import json_loads
+
+
+def iter_sse_data(lines: Iterable[Union[bytes, str]]) -> Iterator[str]:
+    """按 SSE 协议解析事件，逐个返回事件的 data 字段
+
+    多行 data 以换行拼接，空行表示事件结束；注释行（以 : 开头）与其他字段被忽略。
+
+    Args:
+        lines (Iterable[Union[bytes, str]]): 响应的行，例如 requests 的 iter_lines()
+
+    Yields:
+        Iterator[str]: 每个事件的 data
+    """
+    data: List[str] = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r")
+
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+            continue
+        if line.startswith(":"):
+            continue
+
+        field, _, value = line.partition(":")
+        if field == "data":
+            data.append(value[1:] if value.startswith(" ") else value)
+
+    if data:
+        yield "\n".join(data)
+
+
+def iter_response_lines(response) -> Iterator[bytes]:
+    """逐行读取 requests 的流式响应，数据一到达就返回，不等待缓冲区填满
+
+    requests 的 iter_lines 按固定大小读取，非 chunked 的响应在凑满一块之前不会返回，
+    这里优先使用 urllib3 的 read1 读取当前已到达的数据。
+    """
+    read1 = getattr(response.raw, "read1", None)
+    if read1 is None:
+        yield from response.iter_lines(chunk_size=None)
+        return
+
+    buffer = b""
+    while True:
+        chunk = read1(8192, decode_content=True)
+        if not chunk:
+            break
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        yield from lines
+
+    if buffer:
+        yield buffer
+
+
+def extract_delta(event: dict) -> str:
+    """从一个流式事件中取出新增的文本
+
+    兼容 OpenAI 格式（choices[0].delta.content）与服务包装后的格式（data.choices[0].delta.content）。
+
+    Raises:
+        LLMServerError: 事件中的 code 表示服务端出错；事件带有 status 时作为状态码，
+            带有 retryable 时覆盖按状态码判断的结果，都没有时视为可以重试的服务端错误
+    """
+    if "code" in event and event["code"] != 0:
+        status = event.get("status", event.get("status_code"))
+        raise LLMServerError(
+            f"stream error: {event.get('msg') or event}",
+            status_code=status if isinstance(status, int) else None,
+            retryable=event.get("retryable"),
+        )
+
+    body = event["data"] if isinstance(event.get("data"), dict) else event
+    choices = body.get("choices") or [{}]
+    delta = choices[0].get("delta") or choices[0].get("message") or {}
+    return delta.get("content") or choices[0].get("text") or ""
+
+
+def iter_sse_deltas(lines: Iterable[Union[bytes, str]]) -> Iterator[str]:
+    """解析 SSE 响应并逐个返回文本增量，遇到 [DONE] 事件时结束"""
+    for data in iter_sse_data(lines):
+        if data.strip() == "[DONE]":
+            return
+
+        delta = extract_delta(json_loads(data))
+        if delta:
+            yield delta
+
+
+class StreamStats:
+    """一次流式调用的延迟统计：首 token 延迟（TTFT）与 token 间延迟（ITL）"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at: float = time.perf_counter() if started_at is None else started_at
+        self.chunk_times: List[float] = []
+        self.finished_at: Optional[float] = None
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """首 token 延迟（秒），还没有收到任何增量时为 None"""
+        return self.chunk_times[0] - self.started_at if self.chunk_times else None
+
+    @property
+    def inter_token_latencies(self) -> List[float]:
+        """相邻两个增量之间的间隔（秒）"""
+        return [b - a for a, b in zip(self.chunk_times[:-1], self.chunk_times[1:])]
+
+    def to_dict(self) -> dict:
+        itl = sorted(self.inter_token_latencies)
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return {
+            "ttft": self.ttft,
+            "n_chunks": len(self.chunk_times),
+            "mean_itl": sum(itl) / len(itl) if itl else None,
+            "p50_itl": percentile(itl, 50),
+            "p95_itl": percentile(itl, 95),
+            "total_time": end - self.started_at,
+        }
+
+
+class ChatStream:
+    """流式调用的结果，迭代得到文本增量，同时记录延迟统计
+
+    迭代结束、出错或调用 close() 时会调用 on_finish(stats)。
+    """
+
+    def __init__(
+        self,
+        deltas: Iterator[str],
+        on_finish: Optional[Callable[[StreamStats], None]] = None,
+        on_close: Optional[Callable[[], None]] = None,
+        started_at: Optional[float] = None,
+    ):
+        """
+        :param deltas:     Iterator 文本增量迭代器
+        :param on_finish:  Callable 结束时的回调，参数为 StreamStats
+        :param on_close:   Callable 释放底层连接的回调
+        :param started_at: float    发出请求的时刻（time.perf_counter），为 None 时取当前时刻
+        """
+        self.stats = StreamStats(started_at)
+        self.text = ""
+        self.__deltas = deltas
+        self.__on_finish = on_finish
+        self.__on_close = on_close
+        self.__finished = False
+
+    def __iter__(self) -> "ChatStream":
+        return self
+
+    def __enter__(self) -> "ChatStream":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __next__(self) -> str:
+        if self.__finished:
+            raise StopIteration
+
+        try:
+            delta = next(self.__deltas)
+        except BaseException:
+            self.close()
+            raise
+
+        self.stats.chunk_times.append(time.perf_counter())
+        self.text += delta
+        return delta
+
+    def close(self):
+        if self.__finished:
+            return
+
+        self.__finished = True
+        self.stats.finished_at = time.perf_counter()
+        if self.__on_close is not None:
+            self.__on_close()
+        if self.__on_finish is not None:
+            self.__on_finish(self.stats)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """已排序列表的分位数（最近秩法），列表为空时返回 None"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))
+    return values[index]
@@ -1,117 +1,264 @@
 import uuid
-import json
-from typing import Any, List, Mapping, Optional, Iterator
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
 
 import requests
-from langchain.llms.base import LLM
-from langchain.callbacks.manager import CallbackManagerForLLMRun
-from langchain_core.outputs import GenerationChunk
+from loguru import logger
+from requests.adapters import HTTPAdapter
 
-from . import ABSLLMServer
+from . import ABSLLMServer, LLMServerError
+from .response import LLMResponse, json_dumps, json_loads
+from .streaming import (
+    ChatStream,
+    StreamStats,
+    iter_response_lines,
+    iter_sse_deltas,
+    percentile,
+)
 
 
-class EnglishChatLLM(LLM):
-    @property
-    def _llm_type(self) -> str:
-        return "custom"
+DEFAULT_CHAT_URL = "http://bridge.xinchenai.com/v1/chat/completions"
 
-    def _call(
-        self,
-        prompt: str,
-        stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
-        **kwargs: Any,
-    ) -> str:
-        model: str = kwargs.get("model", "gpt-3.5-turbo")
-        temperature: float = kwargs.get("temperature", 0.7)
-        top_p: float = kwargs.get("top_p", 1.0)
-        max_tokens: int = kwargs.get("max_tokens", 500)
-        presence_penalty: float = kwargs.get("presence_penalty", 0.0)
-        frequency_penalty: float = kwargs.get("frequency_penalty", 0.0)
+
+class XinchenChatClient:
+    """基于连接池的 chat completions HTTP 客户端
+
+    所有请求复用同一个 requests.Session，连接在请求之间保持 keep-alive，
+    避免每次调用都重新建立 TCP 连接。
+    """
+
+    def __init__(self, url: str = DEFAULT_CHAT_URL, pool_size: int = 10):
+        self.url = url
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.verify = False
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, prompt: str, **kwargs: Any) -> LLMResponse:
+        """发送一次非流式请求，响应体的原始字节只解析一次
+
+        Raises:
+            LLMServerError: 网络错误、HTTP 错误状态码、无法解析的响应或服务返回的 code 不为 0，
+                其中包含状态码与是否可以重试
+
+        Returns:
+            LLMResponse: 生成的文本、token 用量、延迟与结束原因，body 为服务返回的原始结果
+        """
         timeout: int = kwargs.get("timeout", 120)
 
+        started_at = time.perf_counter()
         try:
-            response = requests.post(
-                "http://bridge.xinchenai.com/v1/chat/completions",
-                json={
-                    "request_id": str(uuid.uuid4()),
-                    "messages": [{"role": "system", "content": prompt}],
-                    "max_tokens": max_tokens,
-                    "temperature": temperature,
-                    "top_p": top_p,
-                    "frequency_penalty": frequency_penalty,
-                    "presence_penalty": presence_penalty,
-                    "model": model,
-                    "source": "joyland",
-                },
-                verify=False,
+            response = self.session.post(
+                self.url,
+                data=json_dumps(self.__make_payload(prompt, **kwargs)).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
                 timeout=timeout,
             )
-            result = json.loads(response.text)
-
-            if result["code"] == 0:
-                return json.dumps(result)
-            else:
-                print(result)
-                return ""
-        except Exception as e:
-            print(f"chatgpt Error: {e}")
-            return None
+        except requests.RequestException as error:
+            raise LLMServerError(f"request failed: {error}") from error
+        latency = time.perf_counter() - started_at
+
+        if response.status_code >= 400:
+            raise LLMServerError(
+                f"HTTP {response.status_code}: {response.text[:200]}",
+                status_code=response.status_code,
+                retry_after=self.__parse_retry_after(response.headers.get("Retry-After")),
+            )
+
+        try:
+            result = json_loads(response.content)
+        except ValueError as error:
+            raise LLMServerError(
+                f"invalid response: {response.content[:200]!r}", status_code=response.status_code
+            ) from error
+
+        if not isinstance(result, dict) or result.get("code") != 0:
+            raise LLMServerError(
+                f"service error: {result}", status_code=response.status_code, retryable=False
+            )
+
+        try:
+            return LLMResponse.from_body(result, latency=latency, status=response.status_code)
+        except (KeyError, IndexError, TypeError) as error:
+            raise LLMServerError(
+                f"invalid response: {result}", status_code=response.status_code, retryable=False
+            ) from error
+
+    def chat(self, prompt: str, **kwargs: Any) -> str:
+        """兼容旧接口：成功时返回 JSON 字符串，服务报错时返回空字符串，请求失败时返回 None"""
+        try:
+            return self.request(prompt, **kwargs).data
+        except LLMServerError as error:
+            logger.error(f"chatgpt Error: {error}")
+            return "" if error.status_code is not None else None
 
-    def _stream(
+    def stream_chat(
         self,
         prompt: str,
-        stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        on_finish: Optional[Callable[[StreamStats], None]] = None,
         **kwargs: Any,
-    ) -> Iterator[GenerationChunk]:
-        resp = requests.post(
-            "http://model-hub-test.heyfriday.cn/v1/chat/completions",
-            json={
-                "task_id": "c56c27d5102b42c1a8c41ddc51d904dc",
-                "model": "english_chat",
-                "dialogue_id": "671184",
-                "character_name": "Stepmom's family",
-                "messages": [{"role": "system", "content": prompt, "name": ""}],
-                "temperature": 0.7,
-                "top_p": 1.0,
-                "n": 1,
-                "stream": True,
-                "stop": None,
-                "max_tokens": 500,
-                "presence_penalty": 0.0,
-                "frequency_penalty": 0.0,
-                "search_web": False,
-                "ability_type": "",
-                "regenerate_history": None,
-                "param": None,
-            },
+    ) -> ChatStream:
+        """流式调用，返回逐个产出文本增量的 ChatStream
+
+        请求立即发出，响应按 SSE 事件逐个解析，收到 [DONE] 事件后结束；
+        ChatStream.stats 记录首 token 延迟与 token 间延迟。
+
+        Args:
+            prompt (str): prompt
+            on_finish (Optional[Callable[[StreamStats], None]], optional): 流结束时的回调. Defaults to None.
+            **kwargs: 生成参数，与 chat 相同；stop 会原样传给服务
+
+        Raises:
+            LLMServerError: 请求失败或服务返回错误的状态码
+
+        Returns:
+            ChatStream: 文本增量迭代器
+        """
+        timeout: int = kwargs.get("timeout", 120)
+        payload = self.__make_payload(prompt, **kwargs)
+        payload["stream"] = True
+        if kwargs.get("stop") is not None:
+            payload["stop"] = kwargs["stop"]
+
+        started_at = time.perf_counter()
+        try:
+            response = self.session.post(self.url, json=payload, timeout=timeout, stream=True)
+        except requests.RequestException as error:
+            raise LLMServerError(f"request failed: {error}") from error
+
+        if response.status_code >= 400:
+            response.close()
+            raise LLMServerError(
+                f"HTTP {response.status_code}",
+                status_code=response.status_code,
+                retry_after=self.__parse_retry_after(response.headers.get("Retry-After")),
+            )
+
+        return ChatStream(
+            iter_sse_deltas(iter_response_lines(response)),
+            on_finish=on_finish,
+            on_close=response.close,
+            started_at=started_at,
         )
 
-        for chunk in resp.iter_lines():
-            if not chunk:
-                continue
+    def close(self):
+        self.session.close()
+
+    """
+    工具函数区域
+    """
 
-            chunk_data: str = chunk.decode().replace("data:", "")
-            yield GenerationChunk(text=chunk_data)
+    @staticmethod
+    def __parse_retry_after(value: Optional[str]) -> Optional[float]:
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
 
-    @property
-    def _identifying_params(self) -> Mapping[str, Any]:
-        return {"n": 10}
+    @staticmethod
+    def __make_payload(prompt: str, **kwargs: Any) -> dict:
+        return {
+            "request_id": str(uuid.uuid4()),
+            "messages": [{"role": "system", "content": prompt}],
+            "max_tokens": kwargs.get("max_tokens", 500),
+            "temperature": kwargs.get("temperature", 0.7),
+            "top_p": kwargs.get("top_p", 1.0),
+            "frequency_penalty": kwargs.get("frequency_penalty", 0.0),
+            "presence_penalty": kwargs.get("presence_penalty", 0.0),
+            "model": kwargs.get("model", "gpt-3.5-turbo"),
+            "source": "joyland",
+        }
 
 
 class XinchenLLMServer(ABSLLMServer):
-    def __init__(self):
+    def __init__(
+        self, url: str = DEFAULT_CHAT_URL, pool_size: int = 10, stream_stats_window: int = 1000
+    ):
+        """
+        :param url:                 str 服务地址
+        :param pool_size:           int 连接池大小，同时也是 agenerate / generate_many 的默认并发数
+        :param stream_stats_window: int stream_stats 统计最近多少次流式调用
+        """
         super().__init__()
-        self.__llm = EnglishChatLLM()
+        self.__pool_size = pool_size
+        self.__client = XinchenChatClient(url=url, pool_size=pool_size)
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__stream_lock = threading.Lock()
+        self.__stream_history: "deque[StreamStats]" = deque(maxlen=stream_stats_window)
 
-    def generate(self, prompt: str, stream: bool = False, **kwargs) -> dict:
+    def generate(self, prompt: str, stream: bool = False, **kwargs):
+        """
+        stream 为 True 时返回 ChatStream，迭代得到文本增量，延迟统计见 ChatStream.stats；
+        否则返回 LLMResponse，失败时 code 为 0
+        """
         if stream:
-            resp = self.__llm.stream(prompt, kwargs)
-            return resp
+            return self.__client.stream_chat(prompt, on_finish=self.__record_stream, **kwargs)
 
         try:
-            resp: str = self.__llm(prompt, **kwargs)
-            return {"code": 1, "msg": "Success", "data": resp}
-        except Exception as error:
-            return {"code": 0, "msg": f"Failed to generate response. reason: {error}", "data": ""}
+            return self.__client.request(prompt, **kwargs)
+        except LLMServerError as error:
+            return error.to_response()
+
+    async def agenerate(self, prompt: str, **kwargs) -> LLMResponse:
+        # 使用与连接池等大的专用线程池，保证在途请求数不超过连接池容量
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=self.__pool_size, thread_name_prefix="xinchen"
+            )
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.__executor, lambda: self.generate(prompt, stream=False, **kwargs)
+        )
+
+    def generate_many(
+        self, prompts: List[str], max_concurrency: Optional[int] = None, **kwargs
+    ) -> List[LLMResponse]:
+        if max_concurrency is None:
+            max_concurrency = self.__pool_size
+        return super().generate_many(prompts, max_concurrency=max_concurrency, **kwargs)
+
+    def stream_stats(self) -> dict:
+        """最近若干次流式调用的首 token 延迟（TTFT）与 token 间延迟（ITL）汇总，单位为秒"""
+        with self.__stream_lock:
+            history = list(self.__stream_history)
+
+        ttfts = sorted(stats.ttft for stats in history if stats.ttft is not None)
+        itls = sorted(itl for stats in history for itl in stats.inter_token_latencies)
+        return {
+            "n_streams": len(history),
+            "p50_ttft": percentile(ttfts, 50),
+            "p95_ttft": percentile(ttfts, 95),
+            "p50_itl": percentile(itls, 50),
+            "p95_itl": percentile(itls, 95),
+        }
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+        self.__client.close()
+
+    """
+    工具函数区域
+    """
+
+    def __record_stream(self, stats: StreamStats):
+        with self.__stream_lock:
+            self.__stream_history.append(stats)
+
+
+def __getattr__(name: str):
+    # EnglishChatLLM 依赖 langchain，按需导入，保持 xinchen 模块的导入开销很小
+    if name == "EnglishChatLLM":
+        from .langchain_llm import EnglishChatLLM
+
+        return EnglishChatLLM
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,243 @@
+import json
+import time
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 默认的延迟分桶（秒），覆盖毫秒级的本地计算到分钟级的 LLM 调用
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra is not None else [])
+    if not items:
+        return ""
+    escaped = [
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in items
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """单调递增的计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self.__lock = threading.Lock()
+        self.__values: Dict[LabelKey, float] = {}
+
+    def inc(self, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self.__lock:
+            self.__values[key] = self.__values.get(key, 0.0) + value
+
+    def get(self, **labels) -> float:
+        with self.__lock:
+            return self.__values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> List[dict]:
+        with self.__lock:
+            return [{"labels": dict(key), "value": value} for key, value in self.__values.items()]
+
+    def reset(self):
+        """清空所有标签组合的值"""
+        with self.__lock:
+            self.__values = {}
+
+    def to_prometheus(self) -> List[str]:
+        with self.__lock:
+            items = list(self.__values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start", "elapsed")
+
+    def __init__(self, histogram: "Histogram", labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, **self.labels)
+
+
+class Histogram:
+    """分桶直方图，记录观测值的分布、总和与次数"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self.__lock = threading.Lock()
+        # 每个标签组合对应 [各桶计数（非累计）..., +Inf 桶计数, 总和, 次数]
+        self.__values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.__lock:
+            series = self.__values.get(key)
+            if series is None:
+                series = self.__values[key] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels) -> _Timer:
+        """返回计时上下文管理器，退出时记录经过的秒数，并保存在 elapsed 中"""
+        return _Timer(self, labels)
+
+    def get(self, **labels) -> dict:
+        """返回某个标签组合的 count 与 sum"""
+        with self.__lock:
+            series = self.__values.get(_label_key(labels))
+            if series is None:
+                return {"count": 0, "sum": 0.0}
+            return {"count": int(series[-1]), "sum": series[-2]}
+
+    def reset(self):
+        """清空所有标签组合的观测值"""
+        with self.__lock:
+            self.__values = {}
+
+    def samples(self) -> List[dict]:
+        with self.__lock:
+            items = [(key, list(series)) for key, series in self.__values.items()]
+
+        samples = []
+        for key, series in items:
+            cumulative, buckets = 0.0, {}
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-2]):
+                cumulative += count
+                buckets[_format_value(bound)] = int(cumulative)
+            samples.append(
+                {
+                    "labels": dict(key),
+                    "count": int(series[-1]),
+                    "sum": series[-2],
+                    "buckets": buckets,
+                }
+            )
+        return samples
+
+    def to_prometheus(self) -> List[str]:
+        lines = []
+        for sample in self.samples():
+            key = _label_key(sample["labels"])
+            for bound, count in sample["buckets"].items():
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', bound))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(sample['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {sample['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表
+
+    counter / histogram 按名称获取或创建指标，同名指标只会创建一次。
+    指标的更新只有一次加锁与少量算术运算，可以在生产环境中常开。
+    导出支持 Prometheus 文本格式（to_prometheus）与 JSON 快照（snapshot / to_json）。
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self.__get_or_create(name, lambda: Counter(name, help), Counter)
+
+    def histogram(
+        self, name: str, help: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.__get_or_create(name, lambda: Histogram(name, help, buckets), Histogram)
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式"""
+        lines: List[str] = []
+        for metric in self.__list():
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.to_prometheus())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """导出为可以 JSON 序列化的字典"""
+        return {
+            metric.name: {"type": metric.kind, "help": metric.help, "samples": metric.samples()}
+            for metric in self.__list()
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False)
+
+    def reset(self):
+        """清空所有指标的值
+
+        指标本身保留在注册表中，各模块已经持有的 Counter / Histogram 之后的更新仍然会被导出。
+        """
+        for metric in self.__list():
+            metric.reset()
+
+    """
+    工具函数区域
+    """
+
+    def __get_or_create(self, name: str, factory, kind):
+        metric = self.__metrics.get(name)
+        if metric is None:
+            with self.__lock:
+                metric = self.__metrics.get(name)
+                if metric is None:
+                    metric = self.__metrics[name] = factory()
+
+        if not isinstance(metric, kind):
+            raise ValueError(f"metric {name} is already registered as {metric.kind}")
+        return metric
+
+    def __list(self) -> list:
+        with self.__lock:
+            return [self.__metrics[name] for name in sorted(self.__metrics)]
+
+
+# 进程内默认的注册表，各模块未指定注册表时都记录到这里
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,9 @@
+"""离线性能基准
+
+使用本地 mock LLM 服务与随机初始化的小模型，不依赖网络。
+基准都标记为 slow，默认的测试不会运行，需要显式指定：
+    python -m pytest tests/benchmarks -m slow -s
+测量结果与 baselines.json 比较，超出容差时测试失败；耗时与内存的基线来自开发机，
+容差留出了机器差异的余量，PROMPT_HELPER_BENCHMARK_TOLERANCE 可以统一放宽容差，
+设置 PROMPT_HELPER_UPDATE_BASELINES=1 时用本次结果更新基线。
+"""
@@ -0,0 +1,86 @@
+import os
+import json
+from typing import Dict, List
+
+from loguru import logger
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# 设置后用本次的测量结果覆盖 baselines.json，而不是与之比较
+UPDATE_ENV = "PROMPT_HELPER_UPDATE_BASELINES"
+# 耗时类指标允许的倍数，默认使用 baselines.json 中各指标的 tolerance
+TOLERANCE_ENV = "PROMPT_HELPER_BENCHMARK_TOLERANCE"
+
+
+def load_baselines(path: str = BASELINE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def compare(name: str, results: Dict[str, float], baselines: dict) -> List[str]:
+    """
+    将测量结果与基线比较
+    :param name:      str              基准名称，对应 baselines.json 的顶层键
+    :param results:   Dict[str, float] 测量结果
+    :param baselines: dict             load_baselines 的返回值
+    :return List[str] 退化的指标说明，为空表示没有退化
+
+    每个指标的基线为 {"value", "direction", "tolerance"}，direction 为
+    lower（越小越好，超过 value * tolerance 视为退化）、higher（越大越好，
+    低于 value / tolerance 视为退化）或 exact（必须相等）。
+    """
+    override = os.environ.get(TOLERANCE_ENV)
+    regressions: List[str] = []
+
+    for metric, baseline in baselines.get(name, {}).items():
+        if metric not in results:
+            regressions.append(f"{name}.{metric}: missing")
+            continue
+
+        value, expected = results[metric], baseline["value"]
+        tolerance = float(override) if override else baseline.get("tolerance", 1.0)
+        direction = baseline["direction"]
+        if direction == "exact":
+            failed = value != expected
+            bound = expected
+        elif direction == "lower":
+            bound = expected * tolerance
+            failed = value > bound
+        elif direction == "higher":
+            bound = expected / tolerance
+            failed = value < bound
+        else:
+            raise ValueError(f"unknown direction {direction} for {name}.{metric}")
+
+        if failed:
+            regressions.append(
+                f"{name}.{metric}: {value:.4g} vs baseline {expected:.4g} "
+                f"({direction}, bound {bound:.4g})"
+            )
+
+    return regressions
+
+
+def update(name: str, results: Dict[str, float], path: str = BASELINE_PATH):
+    """用测量结果更新基线的 value，保留已有的 direction 与 tolerance"""
+    baselines = load_baselines(path)
+    section = baselines.setdefault(name, {})
+    for metric, value in results.items():
+        section.setdefault(metric, {"direction": "lower", "tolerance": 3.0})["value"] = value
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(baselines, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def check(testcase, name: str, results: Dict[str, float]):
+    """在 unittest 中检查测量结果，设置 PROMPT_HELPER_UPDATE_BASELINES 时改为更新基线"""
+    logger.info(f"benchmark {name}: {json.dumps(results, sort_keys=True)}")
+    if os.environ.get(UPDATE_ENV):
+        update(name, results)
+        return
+
+    regressions = compare(name, results, load_baselines())
+    testcase.assertEqual(regressions, [], "performance regression against baselines.json")
@@ -0,0 +1,122 @@
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from tests.helpers.stub_llm import apo_responder
+
+
+class _MockChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分两次写出，不关闭 Nagle 时每个请求会额外等待约 40ms 的延迟确认
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server: "MockChatServer" = self.server.mock
+        delay, status = server.next_outcome()
+        time.sleep(delay)
+
+        if status != 200:
+            payload = f"injected error {status}".encode()
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "0.01")
+        else:
+            prompt: str = body["messages"][0]["content"]
+            content: str = server.responder(prompt)
+            result = {
+                "code": 0,
+                "data": {
+                    "choices": [{"message": {"content": content}, "finish_reason": "stop"}],
+                    "usage": {
+                        "prompt_tokens": len(prompt) // 4,
+                        "completion_tokens": len(content) // 4,
+                    },
+                },
+            }
+            payload = json.dumps(result).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockChatServer:
+    """本地的 chat completions 服务，返回与 XinchenChatClient 相同格式的结果
+
+    每个请求等待 latency ± jitter 秒后返回，按 error_rate 的概率注入 429 或 503 错误，
+    用于在没有远程服务时稳定地复现 APO 的调用模式。
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.005,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        responder: Callable[[str], str] = apo_responder,
+    ):
+        """
+        :param latency:    float 每个请求的平均延迟（秒）
+        :param jitter:     float 延迟的抖动范围（秒），实际延迟在 latency ± jitter 内均匀分布
+        :param error_rate: float 注入错误的概率，注入的错误一半为 429、一半为 503
+        :param seed:       int   延迟抖动与错误注入的随机种子
+        :param responder:  Callable[[str], str] 根据 prompt 生成回复内容
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.responder = responder
+
+        self.requests = 0
+        self.errors = 0
+        self.__rng = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__httpd: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.__httpd.server_address[1]}/v1/chat/completions"
+
+    def next_outcome(self):
+        """返回下一个请求的 (延迟, 状态码)"""
+        with self.__lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.__rng.uniform(-self.jitter, self.jitter))
+            status = 200
+            if self.__rng.random() < self.error_rate:
+                status = self.__rng.choice([429, 503])
+                self.errors += 1
+        return delay, status
+
+    def reset(self):
+        with self.__lock:
+            self.requests = 0
+            self.errors = 0
+
+    def start(self) -> "MockChatServer":
+        self.__httpd = ThreadingHTTPServer(("127.0.0.1", 0), _MockChatHandler)
+        self.__httpd.daemon_threads = True
+        self.__httpd.mock = self
+        threading.Thread(target=self.__httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.__httpd is not None:
+            self.__httpd.shutdown()
+            self.__httpd.server_close()
+            self.__httpd = None
+
+    def __enter__(self) -> "MockChatServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
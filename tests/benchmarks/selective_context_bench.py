@@ -0,0 +1,42 @@
+"""SelectiveContext 的吞吐与内存测量
+
+在独立的解释器中运行，使峰值 RSS 只包含本次测量：
+    python -m tests.benchmarks.selective_context_bench <model_dir>
+输出一行 JSON。
+"""
+import sys
+import json
+import time
+import resource
+
+from tests.helpers.tiny_lm import build_tiny_causal_lm, make_corpus
+
+N_DOCS = 64
+N_ROUNDS = 3
+
+
+def measure(model_dir: str) -> dict:
+    from prompt_helper.select.selective_context.main import SelectiveContext
+
+    build_tiny_causal_lm(model_dir)
+    selector = SelectiveContext(model_dir, device="cpu").warmup(reduce_level="sentence")
+    docs = make_corpus(N_DOCS, seed=1)
+    n_tokens = sum(len(selector.tokenizer(doc)["input_ids"]) for doc in docs)
+
+    results = {}
+    for reduce_level in ["sentence", "token"]:
+        # 取多轮中最快的一次，减少调度抖动的影响
+        best = float("inf")
+        for _ in range(N_ROUNDS):
+            start = time.perf_counter()
+            selector.compress_batch(docs, reduce_ratio=0.35, reduce_level=reduce_level)
+            best = min(best, time.perf_counter() - start)
+        results[f"{reduce_level}_tokens_per_second"] = n_tokens / best
+
+    # Linux 上 ru_maxrss 的单位为 KB
+    results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(measure(sys.argv[1])))
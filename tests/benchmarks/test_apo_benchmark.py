@@ -0,0 +1,82 @@
+import time
+import unittest
+
+import pytest
+
+from tests.benchmarks import baseline
+from tests.benchmarks.mock_llm import MockChatServer
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+from prompt_helper.optim.stop_criterion import MaxStepStopCriterion
+from prompt_helper.utils.llms.server.resilient import ResilientLLMServer
+from prompt_helper.utils.llms.server.xinchen import XinchenLLMServer
+from prompt_helper.utils.metrics import MetricsRegistry
+
+# 耗时与机器有关，默认不运行，见 tests/benchmarks/__init__.py
+pytestmark = pytest.mark.slow
+
+N_ROWS = 32
+N_EPOCHS = 3
+
+test_dataset = [
+    {"input": f"I like item {idx}", "output": "", "expect": [{"label": "Like", "entity": ""}]}
+    for idx in range(N_ROWS)
+]
+
+
+def _run_apo(
+    server: MockChatServer, resilient: bool = False, max_workers: int = 4, pack_size: int = 1
+) -> dict:
+    """在 mock 服务上运行 N_EPOCHS 个 epoch，返回每个 epoch 的耗时、调用数与评测吞吐"""
+    xinchen = XinchenLLMServer(url=server.url, pool_size=max_workers)
+    llm = ResilientLLMServer(xinchen, base_delay=0.01, seed=0) if resilient else xinchen
+    registry = MetricsRegistry()
+    optimizer = APOPromptOptimizer(llm, metrics=registry)
+
+    server.reset()
+    start = time.perf_counter()
+    try:
+        result = optimizer.run(
+            model="mock",
+            prompt="Label the message.\nuser: {{input_content}}",
+            test_dataset=test_dataset,
+            stop_criterions=[MaxStepStopCriterion(N_EPOCHS)],
+            n_reasons=2,
+            max_workers=max_workers,
+            pack_size=pack_size,
+        )
+    finally:
+        xinchen.close()
+    elapsed = time.perf_counter() - start
+
+    assert result["step"] == N_EPOCHS, result
+    eval_seconds = registry.histogram("apo_phase_seconds").get(phase="eval")["sum"]
+    return {
+        "epoch_seconds": elapsed / N_EPOCHS,
+        "llm_calls_per_epoch": server.requests / N_EPOCHS,
+        "eval_rows_per_second": registry.counter("apo_eval_rows_total").get() / eval_seconds,
+    }
+
+
+class TestAPOBenchmark(unittest.TestCase):
+    """APO 的离线基准：epoch 耗时、每个 epoch 的 LLM 调用数与评测吞吐"""
+
+    def test_sequential(self):
+        with MockChatServer(latency=0.005) as server:
+            results = _run_apo(server)
+        baseline.check(self, "apo_sequential", results)
+
+    def test_packed(self):
+        # 每个请求打包 8 条数据，每个 epoch 的调用数从 34 降到 6
+        with MockChatServer(latency=0.005) as server:
+            results = _run_apo(server, pack_size=8)
+        baseline.check(self, "apo_packed", results)
+
+    def test_error_injection(self):
+        # 10% 的请求返回 429 / 503，由 ResilientLLMServer 重试
+        with MockChatServer(latency=0.005, jitter=0.002, error_rate=0.1, seed=0) as server:
+            results = _run_apo(server, resilient=True)
+        baseline.check(self, "apo_error_injection", results)
+
+
+if __name__ == "__main__":
+    unittest.main()
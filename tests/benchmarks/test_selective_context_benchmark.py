@@ -0,0 +1,37 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import unittest
+
+import pytest
+
+from tests.benchmarks import baseline
+
+# 耗时与内存占用与机器有关，默认不运行，见 tests/benchmarks/__init__.py
+pytestmark = pytest.mark.slow
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TestSelectiveContextBenchmark(unittest.TestCase):
+    """SelectiveContext 在本地小模型上的 tokens/sec 与峰值 RSS"""
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "ru_maxrss is measured in KB on Linux")
+    def test_throughput(self):
+        with tempfile.TemporaryDirectory() as model_dir:
+            result = subprocess.run(
+                [sys.executable, "-m", "tests.benchmarks.selective_context_bench", model_dir],
+                cwd=ROOT,
+                capture_output=True,
+                text=True,
+            )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+        results = json.loads(result.stdout.strip().splitlines()[-1])
+        baseline.check(self, "selective_context", results)
+
+
+if __name__ == "__main__":
+    unittest.main()
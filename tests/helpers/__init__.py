@@ -0,0 +1 @@
+"""单元测试与基准共用的测试替身：不经过网络的 LLM 服务与随机初始化的小模型"""
@@ -0,0 +1,82 @@
+import json
+import threading
+from typing import Callable, List, Optional, Union
+
+from prompt_helper.utils.llms.server import ABSLLMServer
+
+GRADIENT = "1. The prompt does not define the labels.\n2. The prompt has no examples."
+NEW_PROMPT = "Classify the user message into one label.\nuser: {{input_content}}"
+
+
+def _classify(text: str) -> list:
+    digits = text.rstrip().rsplit(" ", 1)[-1]
+    label = "Like" if digits.isdigit() and int(digits) % 2 == 0 else "None"
+    return [{"label": label, "entity": ""}]
+
+
+def make_apo_responder(
+    classify: Callable[[str], Union[list, str]] = _classify,
+    gradient: str = GRADIENT,
+    new_prompt: Union[str, Callable[[], str]] = NEW_PROMPT,
+) -> Callable[[str], str]:
+    """构造模拟 APO 各阶段回复的函数
+
+    梯度请求返回 gradient，改写请求返回 new_prompt（为函数时每次调用生成），
+    其他请求视为评测，由 classify 根据输入给出结果（列表会序列化为 JSON）；
+    打包评测请求对每条输入分别调用 classify，按序号返回。
+    """
+
+    def responder(prompt: str) -> str:
+        if "reasons why the prompt" in prompt:
+            return gradient
+        if "I wrote an improved prompt" in prompt:
+            return new_prompt() if callable(new_prompt) else new_prompt
+
+        items = [json.loads(line) for line in prompt.splitlines() if line.startswith('{"index"')]
+        if items:
+            return json.dumps(
+                [{"index": item["index"], "output": classify(item["input"])} for item in items]
+            )
+        output = classify(prompt)
+        return output if isinstance(output, str) else json.dumps(output)
+
+    return responder
+
+
+# 输入以偶数结尾时回答 Like，否则回答 None，结果只与输入有关
+apo_responder = make_apo_responder()
+
+
+def chat_response(content: str, usage: Optional[dict] = None) -> dict:
+    """按 generate 旧的 {"code", "msg", "data"} 格式包装生成的文本"""
+    data = {"code": 0, "data": {"choices": [{"message": {"content": content}}]}}
+    if usage is not None:
+        data["data"]["usage"] = usage
+    return {"code": 1, "msg": "Success", "data": json.dumps(data)}
+
+
+class StubLLMServer(ABSLLMServer):
+    """不经过网络的 LLM 服务，回复由 responder 根据 prompt 生成
+
+    responder 返回字符串时按 chat_response 包装，返回字典时原样返回（用于模拟失败），
+    抛出的异常直接传给调用方。所有请求的 prompt 与参数记录在 prompts、kwargs 中。
+    """
+
+    def __init__(self, responder: Callable[[str], Union[str, dict]] = apo_responder):
+        super().__init__()
+        self.responder = responder
+        self.prompts: List[str] = []
+        self.kwargs: List[dict] = []
+        self.lock = threading.Lock()
+
+    @property
+    def calls(self) -> int:
+        return len(self.prompts)
+
+    def generate(self, prompt: str, stream: bool = False, **kwargs) -> dict:
+        with self.lock:
+            self.prompts.append(prompt)
+            self.kwargs.append(kwargs)
+
+        content = self.responder(prompt)
+        return chat_response(content) if isinstance(content, str) else content
@@ -0,0 +1,60 @@
+import random
+from typing import List
+
+WORDS = (
+    "the a model prompt context token sentence user label large language small quick "
+    "brown fox lazy dog compress remove redundant information measure surprise value "
+    "input output example reason answer question people like dislike hobby goal"
+).split()
+
+
+def make_corpus(n_docs: int, n_sentences: int = 8, seed: int = 0) -> List[str]:
+    """生成 n_docs 个文档，每个文档包含 n_sentences 个随机句子，结果只与 seed 有关"""
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(n_docs):
+        sentences = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize() + "."
+            for _ in range(n_sentences)
+        ]
+        docs.append(" ".join(sentences))
+    return docs
+
+
+def build_tiny_causal_lm(path: str, vocab_size: int = 512, seed: int = 0) -> str:
+    """
+    在 path 下构造一个随机初始化的小型 GPT-2 与字节级 BPE tokenizer，不需要下载任何文件
+    :param path:       str 保存目录
+    :param vocab_size: int BPE 词表大小
+    :param seed:       int 模型初始化的随机种子
+    :return str 保存目录，可以直接传给 SelectiveContext
+    """
+    import torch
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator(
+        make_corpus(200, seed=seed),
+        vocab_size=vocab_size,
+        min_frequency=1,
+        special_tokens=["<|endoftext|>"],
+        show_progress=False,
+    )
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=bpe._tokenizer, bos_token="<|endoftext|>", eos_token="<|endoftext|>"
+    )
+    tokenizer.save_pretrained(path)
+
+    torch.manual_seed(seed)
+    config = GPT2Config(
+        vocab_size=len(tokenizer),
+        n_positions=256,
+        n_embd=64,
+        n_layer=2,
+        n_head=2,
+        bos_token_id=0,
+        eos_token_id=0,
+    )
+    GPT2LMHeadModel(config).save_pretrained(path)
+    return path
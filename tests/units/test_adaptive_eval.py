@@ -0,0 +1,70 @@
+import unittest
+
+from tests.helpers.stub_llm import StubLLMServer, make_apo_responder
+from prompt_helper.optim.apo.adaptive_eval import wilson_interval
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+
+
+def _label(prompt: str) -> list:
+    """根据 prompt 中的标记返回固定标签"""
+    return [{"label": "None" if prompt.startswith("good") else "Like", "entity": ""}]
+
+
+label_responder = make_apo_responder(classify=_label)
+
+
+test_dataset = [
+    {"input": f"input-{idx}", "expect": [{"label": "None", "entity": ""}]} for idx in range(200)
+]
+
+
+class TestAdaptiveEval(unittest.TestCase):
+    def test_wilson_interval(self):
+        lower, upper = wilson_interval(50, 100)
+        self.assertLess(lower, 0.5)
+        self.assertGreater(upper, 0.5)
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+
+        narrow_lower, narrow_upper = wilson_interval(500, 1000)
+        self.assertLess(narrow_upper - narrow_lower, upper - lower)
+
+    def test_reject_bad_candidate_early(self):
+        llm_server = StubLLMServer(label_responder)
+        optimizer = APOPromptOptimizer(llm_server=llm_server)
+        result = optimizer.eval_adaptive(
+            "bad {{input_content}}", test_dataset, incumbent_accuracy=0.9, seed=0
+        )
+
+        self.assertEqual(result["stop_reason"], "rejected")
+        self.assertEqual(result["n_evaluated"], 20)
+        self.assertEqual(llm_server.calls, 20)
+        self.assertEqual(len(result["failure_cases"]), 20)
+
+    def test_accept_good_candidate_early(self):
+        optimizer = APOPromptOptimizer(llm_server=StubLLMServer(label_responder))
+        result = optimizer.eval_adaptive(
+            "good {{input_content}}", test_dataset, target_accuracy=0.8, seed=0
+        )
+
+        self.assertEqual(result["stop_reason"], "accepted")
+        self.assertLess(result["n_evaluated"], len(test_dataset))
+        self.assertEqual(result["accuracy"], 1.0)
+
+    def test_exhausted_matches_full_eval(self):
+        optimizer = APOPromptOptimizer(llm_server=StubLLMServer(label_responder))
+        adaptive = optimizer.eval_adaptive("bad {{input_content}}", test_dataset, seed=0)
+        full = optimizer.eval("bad {{input_content}}", test_dataset)
+
+        self.assertEqual(adaptive["stop_reason"], "exhausted")
+        self.assertEqual(adaptive["accuracy"], full["accuracy"])
+        self.assertEqual(adaptive["failure_cases"], full["failure_cases"])
+
+    def test_empty_dataset(self):
+        llm_server = StubLLMServer(label_responder)
+        with self.assertRaises(ValueError):
+            APOPromptOptimizer(llm_server=llm_server).eval_adaptive("good {{input_content}}", [])
+        self.assertEqual(llm_server.calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import time
+import threading
+import unittest
+
+from tests.helpers.stub_llm import StubLLMServer, make_apo_responder
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+from prompt_helper.optim.stop_criterion import AccuracyStopCriterion, MaxStepStopCriterion
+
+test_dataset = [
+    {"input": f"item {idx}", "output": "", "expect": [{"label": "Like", "entity": ""}]}
+    for idx in range(20)
+]
+
+
+class _ScoredLLMServer(StubLLMServer):
+    """prompt 以 q<n> 开头时前 n 条数据回答正确，即准确率为 n / 20
+
+    改写请求按顺序返回 scores 中的分数对应的新 prompt。
+    """
+
+    def __init__(self, scores):
+        self.scores = list(scores)
+        super().__init__(
+            make_apo_responder(classify=self.__classify, new_prompt=self.__new_prompt)
+        )
+
+    def __new_prompt(self) -> str:
+        with self.lock:
+            return f"q{self.scores.pop(0)} #{len(self.prompts)}\nuser: {{{{input_content}}}}"
+
+    @staticmethod
+    def __classify(prompt: str) -> list:
+        score = int(prompt.split()[0][1:])
+        label = "Like" if int(prompt.rsplit(" ", 1)[-1]) < score else "None"
+        return [{"label": label, "entity": ""}]
+
+
+def _run(
+    llm_server, prompt: str, n_steps: int, stop_criterions=(), seed: int = 0, **kwargs
+) -> dict:
+    return APOPromptOptimizer(llm_server).run(
+        model="m",
+        prompt=f"{prompt}\nuser: {{{{input_content}}}}",
+        test_dataset=test_dataset,
+        stop_criterions=[*stop_criterions, MaxStepStopCriterion(n_steps)],
+        beam_width=2,
+        n_expansions=2,
+        seed=seed,
+        **kwargs,
+    )
+
+
+class TestBeamSearch(unittest.TestCase):
+    def test_keep_top_k(self):
+        # epoch-1 由 q4 扩展出 q10、q2；epoch-2 由 q10、q4 扩展出 q6、q1、q14、q3
+        llm_server = _ScoredLLMServer([10, 2, 6, 1, 14, 3])
+        result = _run(llm_server, "q4", n_steps=2)
+
+        self.assertEqual(result["step"], 2)
+        self.assertEqual([candidate["accuracy"] for candidate in result["beam"]], [0.7, 0.5])
+        self.assertEqual(result["prompt"], result["beam"][0]["prompt"])
+        self.assertTrue(result["prompt"].startswith("q14 "))
+        self.assertEqual(result["accuracy"], 0.7)
+
+    def test_worse_candidates_dropped(self):
+        # epoch-1 由 q16 扩展出 q3、q5；epoch-2 的 4 个候选都比 beam 中的 q16、q5 差
+        llm_server = _ScoredLLMServer([3, 5, 1, 2, 0, 4])
+        result = _run(llm_server, "q16", n_steps=2)
+
+        self.assertEqual(
+            [candidate["prompt"].split()[0] for candidate in result["beam"]], ["q16", "q5"]
+        )
+        self.assertEqual(result["accuracy"], 0.8)
+
+    def test_adaptive_eval(self):
+        llm_server = _ScoredLLMServer([10, 2, 6, 1, 14, 3])
+        result = _run(llm_server, "q4", n_steps=2, eval_mode="adaptive", max_workers=4)
+
+        accuracies = [candidate["accuracy"] for candidate in result["beam"]]
+        self.assertEqual(len(accuracies), 2)
+        self.assertEqual(accuracies, sorted(accuracies, reverse=True))
+        self.assertGreaterEqual(accuracies[0], 0.5)
+
+    def test_adaptive_eval_same_footing(self):
+        # 目标准确率很低时，q10 在 seed=2 的前 2 条数据上就能提前接受（准确率 1.0）；
+        # beam 中的候选仍在全量数据上评测
+        llm_server = _ScoredLLMServer([10, 2])
+        result = _run(
+            llm_server,
+            "q4",
+            n_steps=2,
+            stop_criterions=[AccuracyStopCriterion(0.3)],
+            eval_mode="adaptive",
+            seed=2,
+        )
+
+        self.assertEqual((result["step"], result["stop_reason"]), (1, "accuracy"))
+        self.assertEqual([candidate["accuracy"] for candidate in result["beam"]], [0.5, 0.2])
+
+    def test_no_failure_cases(self):
+        # q20 答对全部数据，没有 failure case 可以扩展，不依赖停止条件也会结束
+        llm_server = _ScoredLLMServer([])
+        result = _run(llm_server, "q20", n_steps=100)
+
+        self.assertEqual((result["step"], result["stop_reason"]), (0, "no_failure_cases"))
+        self.assertEqual(result["accuracy"], 1.0)
+        self.assertEqual(llm_server.calls, len(test_dataset))
+
+    def test_concurrency_bounded(self):
+        lock = threading.Lock()
+        in_flight, peak = [0], [0]
+        responder = make_apo_responder()
+
+        def slow_responder(prompt: str) -> str:
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.002)
+            with lock:
+                in_flight[0] -= 1
+            return responder(prompt)
+
+        n_threads = threading.active_count()
+        peak_threads = [0]
+
+        def counting_responder(prompt: str) -> str:
+            peak_threads[0] = max(peak_threads[0], threading.active_count() - n_threads)
+            return slow_responder(prompt)
+
+        APOPromptOptimizer(StubLLMServer(counting_responder)).run(
+            model="m",
+            prompt="Label the message.\nuser: {{input_content}}",
+            test_dataset=test_dataset,
+            stop_criterions=[MaxStepStopCriterion(2)],
+            beam_width=2,
+            n_expansions=3,
+            max_workers=3,
+            seed=0,
+        )
+
+        self.assertLessEqual(peak[0], 3)
+        self.assertGreater(peak[0], 1)
+        # 共享的评测线程池与扩展线程池各自最多 max_workers 个线程
+        self.assertLessEqual(peak_threads[0], 2 * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import socket
+import tempfile
+import threading
+import unittest
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+from prompt_helper.select.selective_context.server import (
+    CompressionServer,
+    MicroBatcher,
+    QueueFullError,
+)
+
+
+class _FakeCompressor:
+    """记录每次 compress_batch 的批大小，压缩结果为原文转大写"""
+
+    def __init__(self, gate: threading.Event = None):
+        self.gate = gate
+        self.batch_sizes = []
+
+    def compress_batch(self, contexts, reduce_ratio=0.35, reduce_level="phrase"):
+        if self.gate is not None:
+            self.gate.wait()
+        self.batch_sizes.append(len(contexts))
+        return [(context, context.upper()) for context in contexts]
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+
+
+def _post(conn: http.client.HTTPConnection, payload: dict):
+    conn.request("POST", "/compress", body=json.dumps(payload))
+    resp = conn.getresponse()
+    return resp.status, json.loads(resp.read())
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def test_coalesce(self):
+        compressor = _FakeCompressor()
+        batcher = MicroBatcher(compressor, max_batch_size=8, max_wait_ms=200).start()
+        try:
+            futures = [batcher.submit(f"doc {idx}") for idx in range(8)]
+            results = [future.result(timeout=5) for future in futures]
+        finally:
+            batcher.stop()
+
+        self.assertEqual(results, [(f"doc {idx}", f"DOC {idx}") for idx in range(8)])
+        self.assertEqual(compressor.batch_sizes, [8])
+        self.assertEqual(batcher.stats()["batches"], 1)
+
+    def test_group_by_params(self):
+        compressor = _FakeCompressor()
+        batcher = MicroBatcher(compressor, max_batch_size=4, max_wait_ms=200).start()
+        try:
+            futures = [
+                batcher.submit("a", reduce_level="token"),
+                batcher.submit("b", reduce_level="phrase"),
+                batcher.submit("c", reduce_level="token"),
+                batcher.submit("d", reduce_level="phrase"),
+            ]
+            [future.result(timeout=5) for future in futures]
+        finally:
+            batcher.stop()
+
+        self.assertEqual(sorted(compressor.batch_sizes), [2, 2])
+
+    def test_backpressure(self):
+        gate = threading.Event()
+        batcher = MicroBatcher(
+            _FakeCompressor(gate), max_batch_size=1, max_wait_ms=0, max_queue_size=2
+        ).start()
+        try:
+            first = batcher.submit("first")
+            # 等待工作线程取走第一个请求并阻塞在 compress_batch 中
+            deadline = time.monotonic() + 5
+            while batcher.stats()["queue_size"]:
+                if time.monotonic() > deadline:
+                    self.fail("the worker did not take the first request within 5s")
+                time.sleep(0.001)
+            batcher.submit("second")
+            batcher.submit("third")
+            with self.assertRaises(QueueFullError):
+                batcher.submit("fourth")
+            self.assertEqual(batcher.stats()["rejected"], 1)
+        finally:
+            gate.set()
+            batcher.stop()
+
+        self.assertEqual(first.result(timeout=5), ("first", "FIRST"))
+
+
+class TestCompressionServer(unittest.TestCase):
+    def test_http(self):
+        compressor = _FakeCompressor()
+        server = CompressionServer(compressor, port=0, max_batch_size=16, max_wait_ms=50).start()
+        host, port = server.address
+
+        def __request(idx: int):
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            try:
+                return _post(conn, {"context": f"doc {idx}", "reduce_level": "token"})
+            finally:
+                conn.close()
+
+        try:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                responses = list(executor.map(__request, range(8)))
+
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            status, body = _post(conn, {"contexts": ["x", "y"]})
+            self.assertEqual(status, 200)
+            self.assertEqual([item["compressed"] for item in body["data"]], ["X", "Y"])
+
+            for payload in [
+                {"context": "x", "reduce_level": "word"},
+                {"contexts": "xyz"},
+                {"contexts": ["x", 1]},
+                {"context": ["x"]},
+            ]:
+                status, body = _post(conn, payload)
+                self.assertEqual(status, 400, payload)
+                self.assertEqual(body["code"], 0)
+            conn.close()
+        finally:
+            server.shutdown()
+
+        for idx, (status, body) in enumerate(responses):
+            self.assertEqual(status, 200)
+            self.assertEqual(body["data"], [{"context": f"doc {idx}", "compressed": f"DOC {idx}"}])
+        # 并发请求被合并，批次数少于请求数
+        self.assertLess(len(compressor.batch_sizes), 10)
+
+    def test_timeout(self):
+        gate = threading.Event()
+        compressor = _FakeCompressor(gate)
+        server = CompressionServer(
+            compressor, port=0, max_batch_size=1, max_wait_ms=0, request_timeout=0.2
+        ).start()
+        try:
+            conn = http.client.HTTPConnection(*server.address, timeout=10)
+            # 第一个文档卡在压缩中，第二个文档还在排队
+            status, body = _post(conn, {"contexts": ["a", "b"]})
+            conn.close()
+        finally:
+            gate.set()
+            server.shutdown()
+
+        self.assertEqual(status, 504)
+        self.assertEqual(body["code"], 0)
+        # 排队中的文档被取消，不会再被压缩
+        self.assertEqual(compressor.batch_sizes, [1])
+
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "compress.sock")
+            server = CompressionServer(_FakeCompressor(), unix_socket=path).start()
+            try:
+                conn = _UnixHTTPConnection(path)
+                status, body = _post(conn, {"context": "hello"})
+                conn.request("GET", "/stats")
+                stats = json.loads(conn.getresponse().read())["data"]
+                conn.close()
+            finally:
+                server.shutdown()
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body["data"], [{"context": "hello", "compressed": "HELLO"}])
+        self.assertEqual(stats["requests"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import time
+import random
+import unittest
+
+from tests.helpers.stub_llm import StubLLMServer, make_apo_responder
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+
+
+def _slow_parity(prompt: str) -> list:
+    """随机等待一段时间后作答，使并发请求的完成顺序与提交顺序不同"""
+    time.sleep(random.uniform(0, 0.005))
+    label = "Like" if int(prompt.rsplit(" ", 1)[-1]) % 3 == 0 else "None"
+    return [{"label": label, "entity": ""}]
+
+
+slow_responder = make_apo_responder(classify=_slow_parity)
+
+test_dataset = [
+    {"input": f"item {idx}", "output": "", "expect": [{"label": "Like", "entity": ""}]}
+    for idx in range(40)
+]
+
+
+class TestConcurrentEval(unittest.TestCase):
+    def test_same_as_sequential(self):
+        prompt = "Label the message.\nuser: {{input_content}}"
+        expected = APOPromptOptimizer(StubLLMServer(slow_responder)).eval(prompt, test_dataset)
+
+        for max_workers in [2, 8]:
+            with self.subTest(max_workers=max_workers):
+                llm_server = StubLLMServer(slow_responder)
+                result = APOPromptOptimizer(llm_server).eval(
+                    prompt, test_dataset, max_workers=max_workers
+                )
+
+                # failure case 的顺序决定梯度 prompt 的内容，必须与串行评测一致
+                self.assertEqual(result, expected)
+                self.assertEqual(
+                    [case["idx"] for case in result["failure_cases"]],
+                    [idx for idx in range(len(test_dataset)) if idx % 3 != 0],
+                )
+                self.assertEqual(llm_server.calls, len(test_dataset))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import tempfile
+import unittest
+
+from tests.helpers.stub_llm import StubLLMServer, apo_responder
+from prompt_helper.optim.apo.failure_compressor import FailureCaseCompressor
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+from prompt_helper.optim.stop_criterion import MaxStepStopCriterion
+from prompt_helper.utils.metrics import MetricsRegistry
+
+
+class _HalfSelectiveContext:
+    """保留每个输入前一半单词的压缩器，记录每次 compress_batch 的输入"""
+
+    def __init__(self):
+        self.batches = []
+
+    def compress_batch(self, contexts, reduce_ratio=0.35, reduce_level="phrase"):
+        self.batches.append(list(contexts))
+        return [
+            (context, " ".join(context.split()[: len(context.split()) // 2]))
+            for context in contexts
+        ]
+
+
+filler = " ".join(f"word{idx}" for idx in range(40))
+test_dataset = [
+    {"input": f"{filler} item {idx}", "output": "", "expect": [{"label": "Like", "entity": ""}]}
+    for idx in range(6)
+]
+
+
+class TestFailureCaseCompressor(unittest.TestCase):
+    def test_compress(self):
+        selective_context = _HalfSelectiveContext()
+        compressor = FailureCaseCompressor(selective_context, min_tokens=20)
+        long_text = test_dataset[0]["input"]
+
+        results = compressor.compress([long_text, "short text", long_text])
+        self.assertEqual(results[0], results[2])
+        self.assertLess(len(results[0]), len(long_text))
+        self.assertEqual(results[1], "short text")
+        self.assertEqual(selective_context.batches, [[long_text]])
+
+        self.assertEqual(compressor.compress([long_text]), results[:1])
+        self.assertEqual(len(selective_context.batches), 1)
+
+        stats = compressor.pop_stats()
+        self.assertEqual(
+            (stats["n_inputs"], stats["n_compressed"], stats["cache_hits"]), (4, 3, 1)
+        )
+        self.assertEqual(stats["saved_tokens"], stats["raw_tokens"] - stats["compressed_tokens"])
+        self.assertGreater(stats["saved_ratio"], 0.3)
+        self.assertEqual(compressor.pop_stats()["n_inputs"], 0)
+
+        with self.assertRaises(ValueError):
+            FailureCaseCompressor(selective_context, reduce_level="word")
+
+    def test_apo_run(self):
+        registry = MetricsRegistry()
+        llm_server = StubLLMServer()
+        compressor = FailureCaseCompressor(_HalfSelectiveContext(), min_tokens=20)
+        optimizer = APOPromptOptimizer(llm_server, metrics=registry, compressor=compressor)
+        optimizer.run(
+            model="mock",
+            prompt="Label the message.\nuser: {{input_content}}",
+            test_dataset=test_dataset,
+            stop_criterions=[MaxStepStopCriterion(2)],
+            n_reasons=2,
+        )
+
+        reports = optimizer.compression_reports()
+        self.assertEqual([report["step"] for report in reports], [1, 2])
+        for report in reports:
+            self.assertGreater(report["saved_tokens"], 0)
+            self.assertGreaterEqual(report["gradient_seconds"], report["seconds"])
+
+        gradient_prompts = [p for p in llm_server.prompts if "reasons why the prompt" in p]
+        self.assertTrue(gradient_prompts)
+        for prompt in gradient_prompts:
+            self.assertNotIn(filler, prompt)
+            self.assertIn("'expect'", prompt)
+
+        tokens = registry.counter("apo_failure_input_tokens_total")
+        self.assertEqual(tokens.get(kind="raw"), sum(r["raw_tokens"] for r in reports))
+        self.assertLess(tokens.get(kind="compressed"), tokens.get(kind="raw"))
+
+    def test_resume_after_gradient(self):
+        def crash_on_new_prompt(prompt: str) -> str:
+            if "I wrote an improved prompt" in prompt:
+                raise ConnectionError("network is down")
+            return apo_responder(prompt)
+
+        def run(llm_server) -> APOPromptOptimizer:
+            compressor = FailureCaseCompressor(_HalfSelectiveContext(), min_tokens=20)
+            optimizer = APOPromptOptimizer(
+                llm_server, metrics=MetricsRegistry(), compressor=compressor
+            )
+            optimizer.run(
+                model="mock",
+                prompt="Label the message.\nuser: {{input_content}}",
+                test_dataset=test_dataset,
+                stop_criterions=[MaxStepStopCriterion(2)],
+                run_dir=tmp_dir,
+            )
+            return optimizer
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with self.assertRaises(ConnectionError):
+                run(StubLLMServer(crash_on_new_prompt))
+
+            # 第 1 个 epoch 的梯度已经完成，续跑时直接生成新 prompt，示例仍然经过压缩
+            llm_server = StubLLMServer()
+            optimizer = run(llm_server)
+
+        self.assertNotIn("reasons why the prompt", llm_server.prompts[0])
+        self.assertIn("I wrote an improved prompt", llm_server.prompts[0])
+        self.assertNotIn(filler, llm_server.prompts[0])
+
+        reports = optimizer.compression_reports()
+        self.assertEqual([report["step"] for report in reports], [1, 2])
+        for report in reports:
+            self.assertGreater(report["saved_tokens"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+
+from tests.helpers.stub_llm import NEW_PROMPT, StubLLMServer, make_apo_responder
+from prompt_helper.optim.apo.failure_sampler import (
+    FailureCaseSampler,
+    approx_token_count,
+    format_failure_case,
+)
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+from prompt_helper.optim.stop_criterion import MaxStepStopCriterion
+
+
+test_dataset = [{"input": f"input-{idx}" * 10} for idx in range(1000)]
+failure_cases = [
+    {"idx": idx, "reason": "no_hit" if idx % 4 else "Expecting value", "result": "x" * 40}
+    for idx in range(1000)
+]
+
+
+class TestFailureCaseSampler(unittest.TestCase):
+    def test_batches_fit_token_budget(self):
+        sampler = FailureCaseSampler(token_budget=300, seed=0)
+        batches = sampler.sample(test_dataset, failure_cases, n_batches=3)
+
+        self.assertEqual(len(batches), 3)
+        for batch in batches:
+            self.assertTrue(batch)
+            self.assertLess(len(batch), len(failure_cases))
+            tokens = [
+                approx_token_count(format_failure_case(test_dataset, case, len(failure_cases)))
+                for case in batch
+            ]
+            self.assertLessEqual(sum(tokens), 300)
+            # 两个分层都应该被采样到
+            self.assertEqual({case["reason"] == "no_hit" for case in batch}, {True, False})
+
+    def test_max_cases(self):
+        sampler = FailureCaseSampler(max_cases=4, seed=0)
+        batch = sampler.sample(test_dataset, failure_cases)[0]
+
+        self.assertEqual(len(batch), 4)
+
+    def test_oversized_case_still_returned(self):
+        sampler = FailureCaseSampler(token_budget=1, seed=0)
+        batch = sampler.sample(test_dataset, failure_cases[:5])[0]
+
+        self.assertEqual(len(batch), 1)
+
+
+class TestRunWithFailureSampler(unittest.TestCase):
+    def setUp(self):
+        self.llm_server = StubLLMServer(
+            make_apo_responder(classify=lambda prompt: [{"label": "None", "entity": ""}])
+        )
+        self.test_dataset = [
+            {"input": f"input-{idx}", "output": "", "expect": [{"label": "Like", "entity": ""}]}
+            for idx in range(50)
+        ]
+
+    def __run(self, **kwargs) -> dict:
+        return APOPromptOptimizer(self.llm_server).run(
+            model="m",
+            prompt="Label the message.\nuser: {{input_content}}",
+            test_dataset=self.test_dataset,
+            stop_criterions=[MaxStepStopCriterion(2)],
+            seed=0,
+            **kwargs,
+        )
+
+    def test_gradient_batches_fit_budget(self):
+        self.__run(failure_token_budget=200, n_gradient_batches=3)
+
+        gradient_prompts = [p for p in self.llm_server.prompts if "reasons why the prompt" in p]
+        # 每个 epoch 并发生成 3 个梯度
+        self.assertEqual(len(gradient_prompts), 2 * 3)
+        for prompt in gradient_prompts:
+            n_cases = prompt.count("user: {'input'")
+            self.assertGreater(n_cases, 0)
+            self.assertLess(n_cases, len(self.test_dataset))
+
+    def test_gradient_critiques_current_prompt(self):
+        self.__run()
+
+        gradient_prompts = [p for p in self.llm_server.prompts if "reasons why the prompt" in p]
+        self.assertEqual(len(gradient_prompts), 2)
+        # 第一个 epoch 评价初始 prompt，第二个 epoch 评价改写后的 prompt，与 beam 模式一致
+        self.assertIn('My current prompt is:\n"Label the message.', gradient_prompts[0])
+        self.assertIn(f'My current prompt is:\n"{NEW_PROMPT}"', gradient_prompts[1])
+
+    def test_invalid_n_gradient_batches(self):
+        with self.assertRaises(ValueError):
+            self.__run(failure_token_budget=200, n_gradient_batches=0)
+        self.assertEqual(self.llm_server.calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
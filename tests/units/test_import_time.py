@@ -0,0 +1,53 @@
+import re
+import sys
+import json
+import subprocess
+import unittest
+
+# 各模块的导入耗时预算（秒），在独立的解释器中用 -X importtime 测量
+IMPORT_BUDGETS = {
+    "prompt_helper.optim.apo.main": 1.0,
+    "prompt_helper.select.selective_context.main": 1.0,
+    "prompt_helper.utils.common": 0.5,
+    "prompt_helper.utils.llms.server.xinchen": 1.0,
+    "prompt_helper.utils.llms.server.cache": 0.5,
+}
+
+# 导入时不允许加载的重量级依赖
+HEAVY_MODULES = ["torch", "transformers", "spacy", "nltk", "langchain", "langchain_core"]
+
+
+def _measure_import(module: str):
+    """返回 (模块累计导入耗时（秒）, 导入后已加载的重量级依赖)"""
+    code = (
+        f"import sys, json, {module}\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    cumulative = None
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(\S+)\s*$", line)
+        if match and match.group(2) == module:
+            cumulative = int(match.group(1)) / 1e6
+
+    return cumulative, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class TestImportTime(unittest.TestCase):
+    def test_import_budget(self):
+        for module, budget in IMPORT_BUDGETS.items():
+            with self.subTest(module=module):
+                cumulative, loaded = _measure_import(module)
+                self.assertIsNotNone(cumulative)
+                self.assertEqual(loaded, [])
+                self.assertLess(cumulative, budget)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+
+from prompt_helper.select.selective_context.types import LexicalUnits
+
+
+class TestLexicalUnits(unittest.TestCase):
+    def setUp(self):
+        self.units = LexicalUnits("phrase", ["The cat", " sat", " on", " the mat"], [1, 2, 3, 4])
+
+    def test_storage(self):
+        self.assertEqual(self.units.texts, ["The cat", " sat", " on", " the mat"])
+        self.assertEqual(self.units.self_infos.dtype, np.float32)
+        self.assertEqual(self.units.text, "The cat sat on the mat")
+        self.assertEqual(self.units[1], (" sat", 2.0))
+
+    def test_slice_is_view(self):
+        view = self.units[1:3]
+
+        self.assertEqual(view.texts, [" sat", " on"])
+        self.assertTrue(np.shares_memory(view.self_infos, self.units.self_infos))
+
+        # 对视图添加元素不会影响原对象
+        view.push_tail(" it", 9)
+        self.assertEqual(view.texts, [" sat", " on", " it"])
+        self.assertEqual(self.units.texts, ["The cat", " sat", " on", " the mat"])
+
+    def test_add_to_head_and_tail(self):
+        head = self.units.add_to_head("Yes, ", 0)
+        tail = self.units[:2].add_to_tail(" down", 5)
+
+        # 返回新的对象，原对象与切片的来源都不变
+        self.assertEqual(head.texts, ["Yes, ", "The cat", " sat", " on", " the mat"])
+        self.assertEqual(head.self_infos.tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(tail.texts, ["The cat", " sat", " down"])
+        self.assertEqual(self.units.texts, ["The cat", " sat", " on", " the mat"])
+        self.assertEqual(self.units.self_infos.tolist(), [1, 2, 3, 4])
+
+    def test_push_head_and_tail(self):
+        for idx in range(100):
+            self.assertIs(self.units.push_tail(f" t{idx}", idx), self.units)
+            self.units.push_head(f"h{idx} ", -idx)
+
+        self.assertEqual(len(self.units), 204)
+        self.assertEqual(self.units[0], ("h99 ", -99.0))
+        self.assertEqual(self.units[-1], (" t99", 99.0))
+        self.assertEqual(self.units[100:104].texts, ["The cat", " sat", " on", " the mat"])
+
+    def test_add(self):
+        other = LexicalUnits("phrase", [".", " Done"], [5, 6])
+        merged = self.units[2:] + other
+
+        self.assertEqual(merged.texts, [" on", " the mat", ".", " Done"])
+        self.assertEqual(merged.self_infos.tolist(), [3, 4, 5, 6])
+        self.assertIs(sum([self.units]), self.units)
+
+    def test_mask(self):
+        self.assertEqual(self.units.mask(2.5).tolist(), [True, True, False, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import json
+import tempfile
+import unittest
+
+from prompt_helper.utils.llms.server import ABSLLMServer
+from prompt_helper.utils.llms.server.cache import CachedLLMServer
+from prompt_helper.utils.llms.server.resilient import ResilientLLMServer
+
+
+class _CountingLLMServer(ABSLLMServer):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def generate(self, prompt: str, stream: bool = False, **kwargs) -> dict:
+        self.calls += 1
+        return {"code": 1, "msg": "Success", "data": json.dumps({"prompt": prompt, **kwargs})}
+
+
+class TestCachedLLMServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, "llm_cache.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_deterministic_calls_are_cached(self):
+        backend = _CountingLLMServer()
+        llm = CachedLLMServer(backend)
+
+        first = llm.generate("hello", temperature=0.0, model="m")
+        second = llm.generate("hello", temperature=0.0, model="m")
+        llm.generate("hello", temperature=0.0, model="other")
+        llm.generate("hello", temperature=0.7, model="m")
+
+        self.assertEqual(first, second)
+        self.assertEqual(backend.calls, 3)
+        self.assertEqual(llm.stats()["hits"], 1)
+        self.assertEqual(llm.stats()["misses"], 2)
+        self.assertEqual(llm.stats()["bypasses"], 1)
+
+    def test_transport_kwargs_not_in_key(self):
+        self.assertEqual(
+            CachedLLMServer.make_key("hello", temperature=0.0, model="m", timeout=1.5),
+            CachedLLMServer.make_key("hello", temperature=0.0, model="m", timeout=9),
+        )
+        self.assertNotEqual(
+            CachedLLMServer.make_key("hello", temperature=0.0, model="m", top_p=0.5),
+            CachedLLMServer.make_key("hello", temperature=0.0, model="m"),
+        )
+
+    def test_behind_resilient_llm(self):
+        # ResilientLLMServer 每次调用都把剩余时间作为 timeout 传给缓存
+        backend = _CountingLLMServer()
+        llm = ResilientLLMServer(CachedLLMServer(backend), deadline=30)
+        resps = [llm.generate("hello", temperature=0.0, model="m") for _ in range(3)]
+
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(resps[1:], resps[:1] * 2)
+
+    def test_returns_copies(self):
+        llm = CachedLLMServer(_CountingLLMServer(), cache_path=self.cache_path)
+        first = llm.generate("hello", temperature=0.0)
+        first["msg"] = "changed"
+        second = llm.generate("hello", temperature=0.0)
+        second["data"] = "changed"
+
+        self.assertEqual(llm.generate("hello", temperature=0.0)["msg"], "Success")
+        self.assertNotEqual(llm.generate("hello", temperature=0.0)["data"], "changed")
+        llm.close()
+
+    def test_disk_cache_survives_restart(self):
+        llm = CachedLLMServer(_CountingLLMServer(), cache_path=self.cache_path)
+        llm.generate("hello", temperature=0.0)
+        llm.close()
+
+        backend = _CountingLLMServer()
+        llm = CachedLLMServer(backend, cache_path=self.cache_path)
+        llm.generate("hello", temperature=0.0)
+        llm.close()
+
+        self.assertEqual(backend.calls, 0)
+        self.assertEqual(llm.stats()["disk_hits"], 1)
+
+    def test_disk_eviction_by_size(self):
+        llm = CachedLLMServer(
+            _CountingLLMServer(),
+            cache_path=self.cache_path,
+            max_memory_entries=1,
+            max_disk_bytes=200,
+        )
+        for idx in range(20):
+            llm.generate(f"prompt-{idx}", temperature=0.0)
+
+        self.assertLessEqual(llm.stats()["disk_bytes"], 200)
+        llm.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
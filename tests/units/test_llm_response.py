@@ -0,0 +1,88 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+from prompt_helper.utils.llms.server import ABSLLMServer, LLMServerError
+from prompt_helper.utils.llms.server import response as response_module
+from prompt_helper.utils.llms.server.cache import CachedLLMServer
+from prompt_helper.utils.llms.server.response import LLMResponse
+
+body = {
+    "code": 0,
+    "data": {
+        "choices": [{"message": {"content": "你好"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 2},
+    },
+}
+
+
+class _TypedLLMServer(ABSLLMServer):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def generate(self, prompt: str, stream: bool = False, **kwargs) -> LLMResponse:
+        self.calls += 1
+        return LLMResponse.from_body(body, latency=0.5)
+
+
+class TestLLMResponse(unittest.TestCase):
+    def test_from_bytes(self):
+        for backend in [response_module.orjson, None]:
+            with self.subTest(orjson=backend is not None), mock.patch.object(
+                response_module, "orjson", backend
+            ):
+                resp = LLMResponse.from_bytes(json.dumps(body).encode(), latency=0.1, status=200)
+                self.assertEqual(resp.content, "你好")
+                self.assertEqual(resp.usage["completion_tokens"], 2)
+                self.assertEqual((resp.finish_reason, resp.latency, resp.ok), ("stop", 0.1, True))
+
+        with self.assertRaises(ValueError):
+            LLMResponse.from_bytes(b"not json")
+
+    def test_dict_compat(self):
+        resp = LLMResponse.from_body(body)
+        self.assertEqual(resp["code"], 1)
+        self.assertEqual(json.loads(resp["data"]), body)
+        self.assertNotIn("status", resp)
+        self.assertIsNone(resp.get("retryable"))
+
+        failed = LLMServerError("slow down", status_code=429, retry_after=2.0).to_response()
+        self.assertEqual((failed["code"], failed["status"], failed["retryable"]), (0, 429, True))
+        self.assertIn("retryable", failed)
+        self.assertEqual(failed["data"], "")
+
+    def test_coerce(self):
+        legacy = {"code": 1, "msg": "Success", "data": json.dumps(body)}
+        self.assertEqual(LLMResponse.coerce(legacy), LLMResponse.from_body(body))
+
+        failed = LLMResponse.coerce({"code": 0, "msg": "failed", "data": "", "status": 503})
+        self.assertEqual((failed.ok, failed.msg, failed.status), (False, "failed", 503))
+
+        with self.assertRaises(LLMServerError):
+            APOPromptOptimizer._APOPromptOptimizer__get_content(failed)
+        with self.assertRaises(LLMServerError):
+            APOPromptOptimizer._APOPromptOptimizer__get_content({"code": 1, "data": "{}"})
+
+    def test_disk_cache_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_path = os.path.join(tmp_dir, "llm_cache.sqlite")
+            llm = CachedLLMServer(_TypedLLMServer(), cache_path=cache_path)
+            first = llm.generate("hello", temperature=0.0)
+            llm.close()
+
+            backend = _TypedLLMServer()
+            llm = CachedLLMServer(backend, cache_path=cache_path)
+            second = llm.generate("hello", temperature=0.0)
+            llm.close()
+
+        self.assertEqual(backend.calls, 0)
+        self.assertIsInstance(second, LLMResponse)
+        self.assertEqual(second, first)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import json
+import unittest
+
+from tests.helpers.stub_llm import StubLLMServer, chat_response, make_apo_responder
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+from prompt_helper.optim.stop_criterion import MaxStepStopCriterion
+from prompt_helper.utils.llms.server.instrumented import InstrumentedLLMServer
+from prompt_helper.utils.metrics import MetricsRegistry
+
+
+def _fake(prompt: str):
+    """prompt 为 boom 时抛出异常、为 fail 时返回 code 0、为 usage 时带上 token 用量"""
+    if prompt == "boom":
+        raise ConnectionError("network is down")
+    if prompt == "fail":
+        return {"code": 0, "msg": "failed", "data": ""}
+    if prompt == "usage":
+        return chat_response(
+            fake_responder(prompt), usage={"prompt_tokens": 11, "completion_tokens": 7}
+        )
+    return fake_responder(prompt)
+
+
+fake_responder = make_apo_responder(
+    classify=lambda prompt: [{"label": "Like", "entity": ""}],
+    gradient="gradient",
+    new_prompt="better {{input_content}}",
+)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        counter = self.registry.counter("requests_total", "Requests")
+        counter.inc(status="ok")
+        counter.inc(2, status="ok")
+        counter.inc(status="error")
+
+        self.assertIs(self.registry.counter("requests_total"), counter)
+        self.assertEqual(counter.get(status="ok"), 3)
+        self.assertIn('requests_total{status="ok"} 3', self.registry.to_prometheus())
+        with self.assertRaises(ValueError):
+            self.registry.histogram("requests_total")
+
+    def test_histogram(self):
+        histogram = self.registry.histogram("latency_seconds", buckets=(0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 3.0]:
+            histogram.observe(value, phase="eval")
+        with histogram.time(phase="gradient"):
+            pass
+
+        text = self.registry.to_prometheus()
+        self.assertIn("# TYPE latency_seconds histogram", text)
+        self.assertIn('latency_seconds_bucket{phase="eval",le="0.1"} 2', text)
+        self.assertIn('latency_seconds_bucket{phase="eval",le="1"} 3', text)
+        self.assertIn('latency_seconds_bucket{phase="eval",le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_count{phase="eval"} 4', text)
+        self.assertEqual(histogram.get(phase="gradient")["count"], 1)
+
+        snapshot = json.loads(self.registry.to_json())
+        samples = {
+            sample["labels"]["phase"]: sample for sample in snapshot["latency_seconds"]["samples"]
+        }
+        self.assertAlmostEqual(samples["eval"]["sum"], 3.65)
+        self.assertEqual(samples["eval"]["buckets"], {"0.1": 2, "1": 3, "+Inf": 4})
+
+    def test_reset_keeps_instruments(self):
+        counter = self.registry.counter("requests_total")
+        histogram = self.registry.histogram("latency_seconds")
+        counter.inc(3)
+        histogram.observe(0.5)
+
+        self.registry.reset()
+        self.assertEqual(counter.get(), 0)
+        self.assertEqual(histogram.get()["count"], 0)
+
+        # 重置前取得的指标仍然注册在表中，之后的更新会被导出
+        counter.inc()
+        histogram.observe(0.2)
+        self.assertIs(self.registry.counter("requests_total"), counter)
+        text = self.registry.to_prometheus()
+        self.assertIn("requests_total 1", text)
+        self.assertIn("latency_seconds_count 1", text)
+
+
+class TestInstrumentedLLMServer(unittest.TestCase):
+    def test_generate(self):
+        registry = MetricsRegistry()
+        llm = InstrumentedLLMServer(StubLLMServer(_fake), name="fake", registry=registry)
+
+        llm.generate("usage", model="m")
+        llm.generate("x" * 40, model="m")
+        llm.generate("fail", model="m")
+        with self.assertRaises(ConnectionError):
+            llm.generate("boom", model="m")
+
+        requests = registry.counter("llm_requests_total")
+        labels = {"server": "fake", "model": "m"}
+        self.assertEqual(requests.get(status="ok", **labels), 2)
+        self.assertEqual(requests.get(status="error", **labels), 1)
+        self.assertEqual(requests.get(status="exception", **labels), 1)
+        self.assertEqual(registry.histogram("llm_request_seconds").get(**labels)["count"], 4)
+        # usage 中的 11 个 token 加上按字符估计的 10 个 token
+        self.assertEqual(registry.counter("llm_prompt_tokens_total").get(**labels), 21)
+
+    def test_apo_phases(self):
+        registry = MetricsRegistry()
+        llm = InstrumentedLLMServer(StubLLMServer(_fake), registry=registry)
+        optimizer = APOPromptOptimizer(llm, metrics=registry)
+        test_dataset = [
+            {"input": f"text {idx}", "output": "", "expect": [{"label": "Dislike", "entity": ""}]}
+            for idx in range(3)
+        ]
+        optimizer.run(
+            model="m",
+            prompt="classify {{input_content}}",
+            test_dataset=test_dataset,
+            stop_criterions=[MaxStepStopCriterion(2)],
+        )
+
+        phases = registry.histogram("apo_phase_seconds")
+        for phase in ["gradient", "new_prompt", "eval"]:
+            self.assertEqual(phases.get(phase=phase)["count"], 2)
+        self.assertEqual(registry.counter("apo_epochs_total").get(mode="sequential"), 2)
+        self.assertEqual(registry.counter("apo_eval_rows_total").get(), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tests.helpers.stub_llm import chat_response
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+from prompt_helper.utils.llms.server import ABSLLMServer
+from prompt_helper.utils.llms.server.xinchen import XinchenLLMServer
+from prompt_helper.utils.metrics import MetricsRegistry
+
+
+def _answer(text: str):
+    """输入以偶数结尾时回答 Like，否则回答 None"""
+    label = "Like" if int(text.rsplit("-", 1)[-1]) % 2 == 0 else "None"
+    return [{"label": label, "entity": ""}]
+
+
+class _PackedLLMServer(ABSLLMServer):
+    """同时支持单条请求与打包请求的 LLM 服务
+
+    打包请求中 drop 里的输入不返回结果，broken 里的输入返回无法解析的结果，
+    garbage 为 True 时整个打包请求返回非 JSON 文本。
+    """
+
+    def __init__(self, drop=(), broken=(), garbage=False):
+        super().__init__()
+        self.drop, self.broken, self.garbage = set(drop), set(broken), garbage
+        self.single_calls = 0
+        self.packed_calls = 0
+        self.packed_max_tokens = []
+
+    def generate(self, prompt: str, stream: bool = False, **kwargs) -> dict:
+        return chat_response(self.answer(prompt, kwargs.get("max_tokens")))
+
+    def answer(self, prompt: str, max_tokens=None) -> str:
+        items = [json.loads(line) for line in prompt.splitlines() if line.startswith('{"index"')]
+        if not items:
+            self.single_calls += 1
+            return json.dumps(_answer(prompt))
+
+        self.packed_calls += 1
+        self.packed_max_tokens.append(max_tokens)
+        outputs = [
+            {
+                "index": item["index"],
+                "output": "oops" if item["input"] in self.broken else _answer(item["input"]),
+            }
+            for item in items
+            if item["input"] not in self.drop
+        ]
+        return "not json" if self.garbage else f"```json\n{json.dumps(outputs)}\n```"
+
+
+class _StubChatHandler(BaseHTTPRequestHandler):
+    """以 Xinchen 接口格式返回 server.llm 的回答"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        content = self.server.llm.answer(body["messages"][0]["content"], body["max_tokens"])
+        payload = json.dumps(
+            {"code": 0, "data": {"choices": [{"message": {"content": content}}]}}
+        ).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+test_dataset = [
+    {"input": f"input-{idx}", "expect": [{"label": "Like", "entity": ""}]} for idx in range(10)
+]
+prompt = "Label the text.\nuser: {{input_content}}"
+
+
+class TestPackedEval(unittest.TestCase):
+    def setUp(self):
+        self.expected = APOPromptOptimizer(_PackedLLMServer()).eval(prompt, test_dataset)
+
+    def test_packed(self):
+        llm_server = _PackedLLMServer()
+        result = APOPromptOptimizer(llm_server).eval(prompt, test_dataset, pack_size=4)
+
+        self.assertEqual(result, self.expected)
+        self.assertEqual(result["accuracy"], 0.5)
+        self.assertEqual((llm_server.packed_calls, llm_server.single_calls), (3, 0))
+        # 输出长度预算随打包条数增长
+        self.assertEqual(llm_server.packed_max_tokens, [2000, 2000, 1000])
+
+    def test_fallback(self):
+        registry = MetricsRegistry()
+        llm_server = _PackedLLMServer(drop=["input-2"], broken=["input-5"])
+        result = APOPromptOptimizer(llm_server, metrics=registry).eval(
+            prompt, test_dataset, pack_size=4, max_workers=2
+        )
+
+        self.assertEqual(result, self.expected)
+        self.assertEqual((llm_server.packed_calls, llm_server.single_calls), (3, 2))
+        self.assertEqual(registry.counter("apo_packed_fallbacks_total").get(), 2)
+
+    def test_unparseable_response(self):
+        llm_server = _PackedLLMServer(garbage=True)
+        result = APOPromptOptimizer(llm_server).eval_adaptive(
+            prompt, test_dataset, initial_ratio=1.0, pack_size=5
+        )
+
+        self.assertEqual(result["failure_cases"], self.expected["failure_cases"])
+        self.assertEqual((llm_server.packed_calls, llm_server.single_calls), (2, 10))
+
+    def test_xinchen_payload(self):
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubChatHandler)
+        httpd.llm = _PackedLLMServer()
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        llm_server = XinchenLLMServer(
+            url=f"http://127.0.0.1:{httpd.server_address[1]}/v1/chat/completions", pool_size=2
+        )
+        try:
+            result = APOPromptOptimizer(llm_server).eval(prompt, test_dataset, pack_size=4)
+        finally:
+            llm_server.close()
+            httpd.shutdown()
+            httpd.server_close()
+
+        self.assertEqual(result, self.expected)
+        self.assertEqual(httpd.llm.packed_max_tokens, [2000, 2000, 1000])
+
+
+if __name__ == "__main__":
+    unittest.main()
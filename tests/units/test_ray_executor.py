@@ -0,0 +1,232 @@
+import os
+import sys
+import time
+import types
+import random
+import unittest
+import importlib.util
+from functools import partial
+from unittest import mock
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from tests.helpers.stub_llm import StubLLMServer, make_apo_responder
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+from prompt_helper.optim.apo.ray_executor import RayEvalExecutor, shard_indices
+from prompt_helper.optim.stop_criterion import MaxStepStopCriterion
+
+HAS_RAY = importlib.util.find_spec("ray") is not None
+
+
+def _parity(prompt: str) -> list:
+    """输入以偶数结尾时回答 Like，否则回答 None 并在 entity 中带上所在进程的 pid"""
+    if int(prompt.rsplit(" ", 1)[-1]) % 2 == 0:
+        return [{"label": "Like", "entity": ""}]
+    return [{"label": "None", "entity": str(os.getpid())}]
+
+
+parity_responder = make_apo_responder(
+    classify=_parity, gradient="gradient", new_prompt="better {{input_content}}"
+)
+
+
+test_dataset = [
+    {"input": f"item {idx}", "output": "", "expect": [{"label": "Like", "entity": ""}]}
+    for idx in range(10)
+]
+
+
+class TestShardIndices(unittest.TestCase):
+    def test_shard(self):
+        self.assertEqual(shard_indices([3, 1, 4, 1, 5], 2), [[3, 1], [4, 1], [5]])
+        self.assertEqual(shard_indices([], 2), [])
+        with self.assertRaises(ValueError):
+            shard_indices([1], 0)
+
+
+def _make_fake_ray() -> types.ModuleType:
+    """在当前进程中模拟 ray 的 actor 接口，actor 的方法在线程池中执行，完成顺序随机"""
+    pool = ThreadPoolExecutor(max_workers=4)
+    fake_ray = types.ModuleType("ray")
+    fake_ray.actors = []
+
+    class _Method:
+        def __init__(self, method):
+            self.method = method
+
+        def remote(self, *args):
+            def call():
+                time.sleep(random.uniform(0, 0.005))
+                return self.method(*args)
+
+            return pool.submit(call)
+
+    class _Actor:
+        def __init__(self, instance):
+            self.instance = instance
+
+        def __getattr__(self, name):
+            return _Method(getattr(self.instance, name))
+
+    class _ActorClass:
+        def __init__(self, cls):
+            self.cls = cls
+
+        def options(self, **kwargs):
+            return self
+
+        def remote(self, *args):
+            actor = _Actor(self.cls(*args))
+            fake_ray.actors.append(actor)
+            return actor
+
+    def ray_wait(refs, num_returns=1):
+        done, _ = wait(refs, return_when=FIRST_COMPLETED)
+        done = [ref for ref in refs if ref in done][:num_returns]
+        return done, [ref for ref in refs if ref not in done]
+
+    fake_ray.is_initialized = lambda: True
+    fake_ray.remote = _ActorClass
+    fake_ray.wait = ray_wait
+    fake_ray.get = (
+        lambda refs: [ref.result() for ref in refs] if isinstance(refs, list) else refs.result()
+    )
+    fake_ray.kill = lambda actor: fake_ray.actors.remove(actor)
+    return fake_ray
+
+
+class TestRayEvalExecutorLocal(unittest.TestCase):
+    """用进程内的 ray 替身运行 RayEvalExecutor 的分片、下标换算与进度回报逻辑"""
+
+    def setUp(self):
+        self.fake_ray = _make_fake_ray()
+        patcher = mock.patch.dict(sys.modules, {"ray": self.fake_ray})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.progress = []
+        self.executor = RayEvalExecutor(
+            partial(StubLLMServer, parity_responder),
+            num_workers=2,
+            shard_size=3,
+            on_progress=self.progress.append,
+        ).start()
+        self.addCleanup(self.executor.shutdown)
+
+    def test_eval_rows(self):
+        indices = [9, 2, 4, 7, 1, 0, 5]
+        results = self.executor.eval_rows("classify {{input_content}}", test_dataset, indices)
+
+        # 分片内的下标换算回原测试集，结果顺序与 indices 一致
+        self.assertEqual(
+            [None if result is None else result["idx"] for result in results],
+            [9, None, None, 7, 1, None, 5],
+        )
+        self.assertEqual(len(self.fake_ray.actors), 2)
+
+        # 3 个分片按完成顺序累计回报
+        n_evaluated = [update["n_evaluated"] for update in self.progress]
+        self.assertEqual(len(n_evaluated), 3)
+        self.assertEqual(n_evaluated, sorted(n_evaluated))
+        final = self.progress[-1]
+        self.assertEqual((final["n_evaluated"], final["n_total"]), (7, 7))
+        self.assertEqual((final["n_hits"], final["accuracy"]), (3, 3 / 7))
+        for update in self.progress:
+            self.assertEqual(update["accuracy"], update["n_hits"] / update["n_evaluated"])
+
+    def test_eval_many(self):
+        prompts = ["a {{input_content}}", "b {{input_content}}"]
+        results = self.executor.eval_many(prompts, test_dataset)
+
+        self.assertEqual([result["accuracy"] for result in results], [0.5, 0.5])
+        for result in results:
+            self.assertEqual([case["idx"] for case in result["failure_cases"]], [1, 3, 5, 7, 9])
+        # 每个 prompt 的 4 个分片各回报一次
+        for prompt in prompts:
+            updates = [update for update in self.progress if update["prompt"] == prompt]
+            self.assertEqual(len(updates), 4)
+            self.assertEqual(updates[-1]["n_evaluated"], len(test_dataset))
+            self.assertEqual(updates[-1]["accuracy"], 0.5)
+
+    def test_eval_many_empty(self):
+        with self.assertRaises(ValueError):
+            self.executor.eval_many(["a {{input_content}}"], [])
+
+    def test_optimizer_eval(self):
+        optimizer = APOPromptOptimizer(StubLLMServer(parity_responder), executor=self.executor)
+        expected = APOPromptOptimizer(StubLLMServer(parity_responder)).eval(
+            "classify {{input_content}}", test_dataset
+        )
+        self.assertEqual(optimizer.eval("classify {{input_content}}", test_dataset), expected)
+
+    def test_shutdown(self):
+        self.executor.shutdown()
+        self.assertEqual(self.fake_ray.actors, [])
+
+
+@unittest.skipUnless(HAS_RAY, "ray is not installed")
+class TestRayEvalExecutor(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import ray
+
+        ray.init(num_cpus=2, include_dashboard=False, log_to_driver=False)
+        cls.progress = []
+        cls.executor = RayEvalExecutor(
+            partial(StubLLMServer, parity_responder),
+            num_workers=2,
+            shard_size=3,
+            on_progress=cls.progress.append,
+        ).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        import ray
+
+        cls.executor.shutdown()
+        ray.shutdown()
+
+    def setUp(self):
+        self.progress.clear()
+
+    def test_eval(self):
+        optimizer = APOPromptOptimizer(StubLLMServer(parity_responder), executor=self.executor)
+        result = optimizer.eval("classify {{input_content}}", test_dataset)
+
+        self.assertEqual(result["accuracy"], 0.5)
+        self.assertEqual([case["idx"] for case in result["failure_cases"]], [1, 3, 5, 7, 9])
+        # 两个 actor 各自持有 LLM 服务，且都不在 driver 进程中
+        pids = {case["result"]["entity"] for case in result["failure_cases"]}
+        self.assertEqual(len(pids), 2)
+        self.assertNotIn(str(os.getpid()), pids)
+
+        # 4 个分片逐个回报部分准确率
+        self.assertEqual(len(self.progress), 4)
+        self.assertEqual(self.progress[-1]["n_evaluated"], 10)
+        self.assertEqual(self.progress[-1]["accuracy"], 0.5)
+
+    def test_eval_many(self):
+        results = self.executor.eval_many(
+            ["a {{input_content}}", "b {{input_content}}"], test_dataset
+        )
+        self.assertEqual([result["accuracy"] for result in results], [0.5, 0.5])
+        self.assertEqual(
+            {update["prompt"] for update in self.progress},
+            {"a {{input_content}}", "b {{input_content}}"},
+        )
+
+    def test_run(self):
+        optimizer = APOPromptOptimizer(StubLLMServer(parity_responder), executor=self.executor)
+        result = optimizer.run(
+            model="m",
+            prompt="classify {{input_content}}",
+            test_dataset=test_dataset,
+            stop_criterions=[MaxStepStopCriterion(2)],
+            eval_mode="adaptive",
+            seed=0,
+        )
+        self.assertEqual(result["step"], 2)
+        self.assertGreater(len(self.progress), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
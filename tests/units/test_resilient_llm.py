@@ -0,0 +1,209 @@
+import json
+import time
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tests.helpers.stub_llm import chat_response
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+from prompt_helper.utils.llms.server import ABSLLMServer, LLMServerError
+from prompt_helper.utils.llms.server.resilient import (
+    AIMDLimiter,
+    ResilientLLMServer,
+    TokenBucket,
+)
+from prompt_helper.utils.llms.server.xinchen import XinchenLLMServer
+
+
+class _FlakyLLMServer(ABSLLMServer):
+    """按顺序返回 script 中的结果，script 用完后一直返回成功
+
+    slow 表示请求一直等到 timeout 参数给出的时间后才超时，未设置 timeout 时等待 10 秒。
+    """
+
+    def __init__(self, script=()):
+        super().__init__()
+        self.script = list(script)
+        self.calls = 0
+        self.timeouts = []
+        self.lock = threading.Lock()
+
+    def generate(self, prompt: str, stream: bool = False, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.timeouts.append(kwargs.get("timeout"))
+            step = self.script.pop(0) if self.script else "ok"
+
+        if isinstance(step, Exception):
+            raise step
+        if step == "slow":
+            time.sleep(kwargs.get("timeout", 10))
+            raise TimeoutError("read timed out")
+        if step == "ok":
+            return iter(prompt.split()) if stream else chat_response(prompt)
+        return LLMServerError(f"HTTP {step}", status_code=step).to_response()
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    """前 n_throttled 个请求返回 429，之后返回正常结果"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests += 1
+            throttled = self.server.requests <= self.server.n_throttled
+
+        if throttled:
+            payload, status = b"slow down", 429
+        else:
+            result = {
+                "code": 0,
+                "data": {"choices": [{"message": {"content": body["messages"][0]["content"]}}]},
+            }
+            payload, status = json.dumps(result).encode(), 200
+
+        self.send_response(status)
+        if throttled:
+            self.send_header("Retry-After", "0.01")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestResilientLLMServer(unittest.TestCase):
+    def test_retry_throttled(self):
+        inner = _FlakyLLMServer([429, 503, "ok"])
+        llm = ResilientLLMServer(inner, base_delay=0.001, initial_concurrency=4, seed=0)
+
+        resp = llm.generate("hello")
+        self.assertEqual(resp["code"], 1)
+        self.assertEqual(inner.calls, 3)
+
+        stats = llm.stats()
+        self.assertEqual((stats["retries"], stats["throttled"], stats["failures"]), (2, 1, 0))
+        self.assertLess(stats["concurrency_limit"], 4)
+
+    def test_non_retryable(self):
+        inner = _FlakyLLMServer([400])
+        llm = ResilientLLMServer(inner, base_delay=0.001)
+
+        resp = llm.generate("hello")
+        self.assertEqual((resp["code"], resp["status"]), (0, 400))
+        self.assertEqual(inner.calls, 1)
+
+    def test_exceptions(self):
+        inner = _FlakyLLMServer([ConnectionError("reset"), "ok"])
+        llm = ResilientLLMServer(inner, base_delay=0.001)
+        self.assertEqual(llm.generate("hello")["code"], 1)
+
+        inner = _FlakyLLMServer([ValueError("bug")])
+        with self.assertRaises(ValueError):
+            ResilientLLMServer(inner, base_delay=0.001).generate("hello")
+
+    def test_deadline(self):
+        inner = _FlakyLLMServer([503] * 100)
+        llm = ResilientLLMServer(inner, base_delay=0.05, max_retries=100, seed=0)
+
+        start = time.monotonic()
+        resp = llm.generate("hello", deadline=0.2)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(resp["code"], 0)
+        self.assertGreater(inner.calls, 1)
+
+    def test_deadline_bounds_request(self):
+        inner = _FlakyLLMServer(["slow"] * 10)
+        llm = ResilientLLMServer(inner, base_delay=0.01, max_retries=10, seed=0)
+
+        start = time.monotonic()
+        resp = llm.generate("hello", deadline=0.3)
+        self.assertLess(time.monotonic() - start, 0.6)
+        self.assertEqual(resp["code"], 0)
+        self.assertTrue(all(0 < timeout <= 0.3 for timeout in inner.timeouts))
+
+        # 调用方设置的 timeout 更短时保留
+        inner = _FlakyLLMServer()
+        ResilientLLMServer(inner).generate("hello", deadline=10, timeout=1)
+        self.assertEqual(inner.timeouts, [1])
+
+    def test_stream_holds_slot(self):
+        llm = ResilientLLMServer(_FlakyLLMServer(), initial_concurrency=1, max_concurrency=1)
+
+        first = llm.generate("a b c", stream=True)
+        self.assertEqual(llm.limiter.in_flight, 1)
+        # 第一个流没有读完时，第二个请求拿不到并发名额
+        resp = llm.generate("d e", stream=False, deadline=0.05)
+        self.assertEqual(resp["code"], 0)
+
+        self.assertEqual(list(first), ["a", "b", "c"])
+        self.assertEqual(llm.limiter.in_flight, 0)
+
+        second = llm.generate("d e", stream=True)
+        self.assertEqual(next(second), "d")
+        second.close()
+        self.assertEqual(llm.limiter.in_flight, 0)
+        with llm.generate("f g", stream=True) as third:
+            self.assertEqual(next(third), "f")
+        self.assertEqual(llm.limiter.in_flight, 0)
+
+    def test_throttled_http_endpoint(self):
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+        httpd.lock, httpd.requests, httpd.n_throttled = threading.Lock(), 0, 6
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{httpd.server_address[1]}/v1/chat/completions"
+        xinchen = XinchenLLMServer(url=url, pool_size=4)
+
+        try:
+            resp = xinchen.generate("direct")
+            self.assertEqual((resp["code"], resp["status"], resp["retryable"]), (0, 429, True))
+            with self.assertRaises(LLMServerError):
+                APOPromptOptimizer._APOPromptOptimizer__get_content(resp)
+
+            llm = ResilientLLMServer(xinchen, base_delay=0.001, initial_concurrency=4, seed=0)
+            resps = llm.generate_many([f"p{idx}" for idx in range(8)], max_concurrency=8)
+        finally:
+            xinchen.close()
+            httpd.shutdown()
+            httpd.server_close()
+
+        contents = [APOPromptOptimizer._APOPromptOptimizer__get_content(resp) for resp in resps]
+        self.assertEqual(contents, [f"p{idx}" for idx in range(8)])
+        self.assertGreaterEqual(llm.stats()["throttled"], 1)
+
+
+class TestRateControl(unittest.TestCase):
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        start = time.monotonic()
+        for _ in range(11):
+            self.assertTrue(bucket.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+        # 下一个令牌要 1 秒后才补充，截止时刻之前拿不到
+        slow = TokenBucket(rate=1, capacity=1)
+        self.assertTrue(slow.acquire())
+        self.assertFalse(slow.acquire(deadline=time.monotonic() + 0.1))
+
+    def test_aimd(self):
+        limiter = AIMDLimiter(initial=8, min_limit=1, max_limit=16)
+        generations = [limiter.acquire() for _ in range(4)]
+        # 同一批在途请求都被限流时只下调一次
+        for generation in generations:
+            limiter.release(generation, congested=True)
+        self.assertEqual(limiter.limit, 4)
+
+        for _ in range(40):
+            limiter.release(limiter.acquire(), congested=False)
+        self.assertGreater(limiter.limit, 8)
+
+        limiter = AIMDLimiter(initial=4, latency_target=0.1)
+        limiter.release(limiter.acquire(), congested=False, latency=1.0)
+        self.assertEqual(limiter.limit, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
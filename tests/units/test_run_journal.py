@@ -0,0 +1,104 @@
+import tempfile
+import unittest
+
+from tests.helpers.stub_llm import StubLLMServer, make_apo_responder
+from prompt_helper.optim.apo.journal import RunJournal
+from prompt_helper.optim.apo.main import APOPromptOptimizer
+from prompt_helper.optim.stop_criterion import MaxStepStopCriterion
+
+
+class _ScriptedLLMServer(StubLLMServer):
+    """新 prompt 带上调用序号，调用次数超过 fail_after 时抛出异常"""
+
+    def __init__(self, fail_after: int = None):
+        super().__init__(
+            make_apo_responder(
+                classify=lambda prompt: [{"label": "Like", "entity": ""}],
+                gradient="gradient",
+                new_prompt=lambda: f"prompt-{len(self.prompts)} {{{{input_content}}}}",
+            )
+        )
+        self.fail_after = fail_after
+
+    def generate(self, prompt: str, stream: bool = False, **kwargs) -> dict:
+        if self.fail_after is not None and len(self.prompts) >= self.fail_after:
+            raise ConnectionError("network is down")
+        return super().generate(prompt, stream=stream, **kwargs)
+
+
+test_dataset = [
+    {"input": f"input-{idx}", "output": [], "expect": [{"label": "None", "entity": ""}]}
+    for idx in range(5)
+]
+
+
+class TestRunJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_ignore_truncated_line(self):
+        journal = RunJournal(self.tmp_dir.name)
+        journal.append({"step": 1, "phase": "eval"})
+        with open(journal.path, "a", encoding="utf-8") as file:
+            file.write('{"step": 2, "pha')
+
+        self.assertEqual(journal.load(), [{"step": 1, "phase": "eval"}])
+
+    def test_resume_after_crash(self):
+        kwargs = dict(model="m", prompt="p {{input_content}}", test_dataset=test_dataset)
+
+        # 每个 epoch 调用 7 次：梯度、新 prompt、5 条评测数据；在第 2 个 epoch 的评测中失败
+        crashed_llm = _ScriptedLLMServer(fail_after=10)
+        with self.assertRaises(ConnectionError):
+            APOPromptOptimizer(llm_server=crashed_llm).run(
+                stop_criterions=[MaxStepStopCriterion(max_step=3)],
+                run_dir=self.tmp_dir.name,
+                **kwargs,
+            )
+
+        resumed_llm = _ScriptedLLMServer()
+        result = APOPromptOptimizer(llm_server=resumed_llm).run(
+            stop_criterions=[MaxStepStopCriterion(max_step=3)], run_dir=self.tmp_dir.name, **kwargs
+        )
+
+        self.assertEqual(result["step"], 3)
+        self.assertEqual(result["stop_reason"], "max step")
+        # 第 2 个 epoch 只需重新评测，第 3 个 epoch 完整执行
+        self.assertEqual(len(resumed_llm.prompts), 5 + 7)
+
+        # 已经结束的运行再次启动时直接返回结果
+        finished_llm = _ScriptedLLMServer()
+        again = APOPromptOptimizer(llm_server=finished_llm).run(
+            stop_criterions=[MaxStepStopCriterion(max_step=3)], run_dir=self.tmp_dir.name, **kwargs
+        )
+        self.assertEqual(again, result)
+        self.assertEqual(finished_llm.prompts, [])
+
+    def test_refuse_foreign_journal(self):
+        kwargs = dict(model="m", prompt="p {{input_content}}", test_dataset=test_dataset)
+        APOPromptOptimizer(llm_server=_ScriptedLLMServer()).run(
+            stop_criterions=[MaxStepStopCriterion(max_step=1)], run_dir=self.tmp_dir.name, **kwargs
+        )
+        self.assertEqual(RunJournal(self.tmp_dir.name).load()[0]["phase"], "header")
+
+        for name, value in [
+            ("model", "other"),
+            ("prompt", "q {{input_content}}"),
+            ("test_dataset", test_dataset[:-1]),
+        ]:
+            with self.subTest(name=name):
+                llm_server = _ScriptedLLMServer()
+                with self.assertRaises(ValueError):
+                    APOPromptOptimizer(llm_server=llm_server).run(
+                        stop_criterions=[MaxStepStopCriterion(max_step=2)],
+                        run_dir=self.tmp_dir.name,
+                        **{**kwargs, name: value},
+                    )
+                self.assertEqual(llm_server.prompts, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
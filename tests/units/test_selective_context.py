@@ -0,0 +1,233 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import spacy
+import torch
+
+from tests.helpers.tiny_lm import build_tiny_causal_lm, make_corpus
+from prompt_helper.select.selective_context.main import SelectiveContext
+from prompt_helper.utils.metrics import MetricsRegistry
+
+tmp_dir: tempfile.TemporaryDirectory = None
+model_path: str = ""
+
+
+def setUpModule():
+    global tmp_dir, model_path
+    tmp_dir = tempfile.TemporaryDirectory()
+    model_path = build_tiny_causal_lm(tmp_dir.name)
+
+
+def tearDownModule():
+    tmp_dir.cleanup()
+
+
+def _selective_context(**kwargs) -> SelectiveContext:
+    return SelectiveContext(model_path, device="cpu", metrics=MetricsRegistry(), **kwargs)
+
+
+def _blank_nlp():
+    """使用 spacy.blank 代替需要下载的 en_core_web_sm，每个 token 就是一个短语"""
+    return mock.patch.object(
+        SelectiveContext,
+        "_SelectiveContext__load_nlp",
+        staticmethod(lambda lang: spacy.blank(lang)),
+    )
+
+
+def _self_information(selective_context: SelectiveContext, sentences):
+    return selective_context._SelectiveContext__get_self_information_batch(sentences)
+
+
+def _reference_self_information(selective_context: SelectiveContext, sentence: str) -> dict:
+    """逐句前向计算并对整个词表做 softmax 的原始实现，作为参照"""
+    tokenizer, model = selective_context.tokenizer, selective_context.model
+    input_ids = tokenizer(sentence, add_special_tokens=False, return_tensors="pt")["input_ids"]
+    with torch.no_grad():
+        self_info = -torch.log(torch.softmax(model(input_ids=input_ids).logits, dim=-1))
+
+    return {
+        "tokens": [tokenizer.decode(token_) for token_ in input_ids[0].tolist()[1:]],
+        "self_infos": self_info[0, :-1].gather(-1, input_ids[0, 1:, None]).squeeze(-1).tolist(),
+    }
+
+
+class TestSelfInformation(unittest.TestCase):
+    def setUp(self):
+        self.sentences = [
+            sentence + "." for doc in make_corpus(4, seed=1) for sentence in doc.split(". ")
+        ]
+
+    def test_batch_matches_per_sentence(self):
+        # 每批最多 3 个句子，长度不同的句子放在同一批时需要 padding
+        selective_context = _selective_context(max_batch_size=3)
+        infos = _self_information(selective_context, self.sentences)
+
+        self.assertEqual(len(infos), len(self.sentences))
+        for sentence, info in zip(self.sentences, infos):
+            expected = _reference_self_information(selective_context, sentence)
+            self.assertEqual(info["tokens"], expected["tokens"])
+            np.testing.assert_allclose(info["self_infos"], expected["self_infos"], atol=1e-5)
+
+    def test_chunked_logits(self):
+        # 分块只对隐状态逐块调用输出层，结果应与一次计算整个序列一致
+        expected = _self_information(_selective_context(), self.sentences)
+        for chunk_size in [1, 3, 64]:
+            with self.subTest(chunk_size=chunk_size):
+                infos = _self_information(
+                    _selective_context(self_info_chunk_size=chunk_size), self.sentences
+                )
+                for info, expected_info in zip(infos, expected):
+                    self.assertEqual(info["tokens"], expected_info["tokens"])
+                    np.testing.assert_allclose(
+                        info["self_infos"], expected_info["self_infos"], atol=1e-5
+                    )
+
+    def test_chunked_logits_fallback(self):
+        # 模型在输出层之后还会缩放 logits 时，分块计算会得到不同的结果，需要退回完整的前向计算
+        def scale_logits(selective_context: SelectiveContext) -> SelectiveContext:
+            model = selective_context.model
+            forward = model.forward
+
+            def scaled_forward(*args, **kwargs):
+                outputs = forward(*args, **kwargs)
+                outputs.logits = outputs.logits * 0.5
+                return outputs
+
+            model.forward = scaled_forward
+            return selective_context
+
+        expected = _self_information(scale_logits(_selective_context()), self.sentences)
+        infos = _self_information(
+            scale_logits(_selective_context(self_info_chunk_size=3)), self.sentences
+        )
+        for info, expected_info in zip(infos, expected):
+            np.testing.assert_allclose(info["self_infos"], expected_info["self_infos"], atol=1e-5)
+
+        plain = _self_information(_selective_context(), self.sentences[:1])[0]
+        self.assertFalse(np.allclose(plain["self_infos"], expected[0]["self_infos"]))
+
+    def test_empty_input(self):
+        selective_context = _selective_context()
+
+        self.assertEqual(_self_information(selective_context, []), [])
+        self.assertEqual(selective_context("", reduce_level="token"), ("", ""))
+        # 没有句子时不需要加载 spaCy 流水线
+        self.assertEqual(selective_context(""), ("", ""))
+        results = selective_context.compress_batch(
+            ["", "  ", self.sentences[0]], reduce_level="token"
+        )
+        self.assertEqual(results[:2], [("", ""), (" ", "")])
+        self.assertTrue(results[2][1])
+
+
+class TestPhraseChunking(unittest.TestCase):
+    def setUp(self):
+        self.contexts = make_corpus(3, seed=5)
+
+    def test_n_process(self):
+        results = []
+        for n_process in [1, 2]:
+            with _blank_nlp():
+                selective_context = _selective_context(
+                    spacy_n_process=n_process, spacy_batch_size=4
+                )
+                results.append(selective_context.compress_batch(self.contexts))
+
+        self.assertEqual(results[0], results[1])
+        for context, masked in results[0]:
+            self.assertTrue(masked)
+            self.assertLess(len(masked), len(context))
+
+    def test_pipe_matches_per_sentence(self):
+        with _blank_nlp():
+            selective_context = _selective_context(spacy_batch_size=4)
+            sentences = [sentence + "." for sentence in self.contexts[0].split(". ")]
+            infos = _self_information(selective_context, sentences)
+            docs = selective_context._SelectiveContext__parse_sentences(
+                ["".join(info["tokens"]) for info in infos]
+            )
+
+            for info, doc in zip(infos, docs):
+                tokens, self_infos = info["tokens"], info["self_infos"]
+                self.assertEqual(
+                    selective_context._calculate_lexical_unit(tokens, self_infos, doc=doc),
+                    selective_context._calculate_lexical_unit(tokens, self_infos),
+                )
+
+
+class TestCompressBatch(unittest.TestCase):
+    def test_matches_call(self):
+        contexts = make_corpus(3, seed=6) + ["Short one.", ""]
+        with _blank_nlp():
+            selective_context = _selective_context(max_batch_size=4)
+            for reduce_level in ["sentence", "token", "phrase"]:
+                with self.subTest(reduce_level=reduce_level):
+                    self.assertEqual(
+                        selective_context.compress_batch(contexts, reduce_level=reduce_level),
+                        [
+                            selective_context(context, reduce_level=reduce_level)
+                            for context in contexts
+                        ],
+                    )
+
+    def test_invalid_reduce_level(self):
+        with self.assertRaises(ValueError):
+            _selective_context().compress_batch(["text"], reduce_level="word")
+
+
+class TestStream(unittest.TestCase):
+    def setUp(self):
+        self.selective_context = _selective_context()
+
+    def test_over_max_positions(self):
+        # 约 2000 个单词，其中一个 600 个单词的句子超过 tiny_lm 的 256 个位置
+        long_sentence = " ".join(make_corpus(1, n_sentences=60, seed=2)[0].split()[:600])
+        context = " ".join(make_corpus(15, seed=3)) + " " + long_sentence.replace(".", "") + "."
+        self.assertGreater(len(context.split()), 1800)
+
+        segments = list(
+            self.selective_context.stream(
+                context, reduce_level="token", context_tokens=128, segment_sentences=8
+            )
+        )
+
+        self.assertEqual(len(segments), 16)
+        self.assertEqual(" ".join(segment for segment, _ in segments), context)
+        for segment, masked in segments:
+            self.assertTrue(masked)
+            self.assertLess(len(masked), len(segment))
+
+    def test_without_context_matches_compress_batch(self):
+        context = make_corpus(1, n_sentences=6, seed=4)[0]
+        segments = list(
+            self.selective_context.stream(
+                context, reduce_level="token", context_tokens=0, segment_sentences=100
+            )
+        )
+
+        self.assertEqual(
+            segments, self.selective_context.compress_batch([context], reduce_level="token")
+        )
+
+    def test_make_windows(self):
+        make_windows = self.selective_context._SelectiveContext__make_windows
+        ids = list(range(10, 20))
+
+        # 没有位置数限制时不切块，也不截短前文
+        self.assertEqual(make_windows([1, 2, 3], ids, 8, None), ([([1, 2, 3], 0, 10)], ids))
+        # 前文最多占窗口的一半，句子按剩余的位置切块
+        prefixes, _ = make_windows([1, 2, 3, 4, 5, 6], ids, 8, 8)
+        self.assertEqual(
+            prefixes,
+            [([3, 4, 5, 6], 0, 4), ([10, 11, 12, 13], 4, 8), ([14, 15, 16, 17], 8, 10)],
+        )
+        # 只有一个位置时既放不下前文也无法推进片段
+        with self.assertRaises(ValueError):
+            make_windows([1, 2, 3], ids, 8, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import random
+import unittest
+
+import numpy as np
+
+from prompt_helper.select.selective_context.alignment import (
+    align_unit_self_information,
+    token_texts_from_offsets,
+)
+
+
+def _reference_unit_info(tokens, self_info, units):
+    """逐 token 累加长度的对齐实现，作为向量化实现的参照"""
+    current_unit_idx = 0
+    current_position = 0
+    unit_self_info = [[] for _ in range(len(units))]
+
+    for token, info in zip(tokens, self_info):
+        current_position += len(token)
+        if current_position == len(units[current_unit_idx]):
+            unit_self_info[current_unit_idx].append(info)
+            current_position = current_position - len(units[current_unit_idx])
+            current_unit_idx += 1
+        elif current_position > len(units[current_unit_idx]):
+            counter_ = 1
+            current_position = current_position - len(units[current_unit_idx])
+            current_unit_idx += 1
+            while current_position >= len(units[current_unit_idx]):
+                counter_ += 1
+                current_position = current_position - len(units[current_unit_idx])
+                current_unit_idx += 1
+                if current_unit_idx >= len(units):
+                    break
+            partial_info = info / counter_
+            for _ in range(counter_):
+                unit_self_info[(current_unit_idx - 1) - _].append(partial_info)
+        else:
+            if token == " ":
+                continue
+            unit_self_info[current_unit_idx].append(info)
+
+    return [np.mean(info) if info else np.nan for info in unit_self_info]
+
+
+def _split(text, rng, max_len):
+    pieces, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + rng.randint(1, max_len))
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+class TestAlignment(unittest.TestCase):
+    def test_matches_reference(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            text = "".join(rng.choice("ab  c") for _ in range(rng.randint(5, 60)))
+            units = _split(text, rng, 6)
+            # 末尾追加一个长单元，避免参照实现在最后一个 token 跨越边界时越界
+            units[-1] += "z" * 10
+            tokens = _split("".join(units), rng, 4)
+            infos = [rng.random() for _ in tokens]
+
+            expected = _reference_unit_info(tokens, infos, units)
+            actual = align_unit_self_information(
+                [len(token) for token in tokens],
+                infos,
+                [len(unit) for unit in units],
+                whitespace_tokens=[token == " " for token in tokens],
+            )
+            np.testing.assert_allclose(actual, expected, equal_nan=True)
+
+    def test_token_texts_from_offsets(self):
+        text = "Hello world."
+        offsets = [(0, 5), (6, 11), (11, 12)]
+
+        self.assertEqual(token_texts_from_offsets(text, offsets), ["Hello", " world", "."])
+        self.assertEqual(token_texts_from_offsets(text, []), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
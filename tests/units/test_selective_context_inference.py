@@ -0,0 +1,64 @@
+import unittest
+
+import torch
+from transformers.pytorch_utils import Conv1D
+
+from prompt_helper.select.selective_context.inference import (
+    conv1d_to_linear,
+    prepare_model,
+    resolve_device,
+    self_information_drift,
+)
+
+
+class TestSelfInformationDrift(unittest.TestCase):
+    def test_identical(self):
+        infos = [[1.0, 2.0, 3.0], [4.0]]
+        report = self_information_drift(infos, infos)
+        self.assertEqual(report["n_tokens"], 4)
+        self.assertEqual(report["max_abs_diff"], 0.0)
+        self.assertEqual(report["mask_agreement"], 1.0)
+
+    def test_drift(self):
+        report = self_information_drift([[1.0, 2.0, 3.0, 4.0]], [[1.5, 2.0, 3.0, 0.5]], 0.25)
+        self.assertAlmostEqual(report["max_abs_diff"], 3.5)
+        self.assertAlmostEqual(report["mean_abs_diff"], 1.0)
+        # 基准删除第 1 个 token，待比较配置删除第 4 个 token
+        self.assertAlmostEqual(report["mask_agreement"], 0.5)
+
+    def test_length_mismatch(self):
+        with self.assertRaises(AssertionError):
+            self_information_drift([[1.0, 2.0]], [[1.0]])
+
+
+class TestPrepareModel(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = torch.nn.Sequential(Conv1D(8, 4), torch.nn.ReLU(), Conv1D(3, 8))
+        self.inputs = torch.randn(2, 5, 4)
+
+    def test_conv1d_to_linear(self):
+        expected = self.model(self.inputs)
+        model = conv1d_to_linear(self.model)
+        self.assertIsInstance(model[0], torch.nn.Linear)
+        self.assertTrue(torch.allclose(model(self.inputs), expected, atol=1e-6))
+
+    def test_int8(self):
+        expected = self.model(self.inputs)
+        model = prepare_model(self.model, device="cpu", dtype="int8")
+        self.assertNotIsInstance(model[0], torch.nn.Linear)
+        self.assertTrue(torch.allclose(model(self.inputs), expected, atol=0.1))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            prepare_model(self.model, device="cpu", dtype="fp16")
+        with self.assertRaises(ValueError):
+            prepare_model(self.model, device="cuda", dtype="int8")
+
+    def test_resolve_device(self):
+        self.assertEqual(resolve_device("cpu"), "cpu")
+        self.assertIn(resolve_device("auto"), ["cpu", "cuda"])
+
+
+if __name__ == "__main__":
+    unittest.main()
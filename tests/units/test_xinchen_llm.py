@@ -1,8 +1,68 @@
+import json
+import time
+import asyncio
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
+from prompt_helper.utils.llms.server import LLMServerError
+from prompt_helper.utils.llms.server.response import LLMResponse
+from prompt_helper.utils.llms.server.streaming import iter_sse_deltas
 from prompt_helper.utils.llms.server.xinchen import XinchenLLMServer
 
 
+class _StubChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.connections.add(self.client_address)
+        result = {
+            "code": 0,
+            "data": {"choices": [{"message": {"content": body["messages"][0]["content"]}}]},
+        }
+        payload = json.dumps(result).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubSSEHandler(BaseHTTPRequestHandler):
+    """把 prompt 按空格切分后逐个以 SSE 事件返回，每个事件之间间隔 delay 秒"""
+
+    protocol_version = "HTTP/1.1"
+    delay = 0.02
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.bodies.append(body)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        self.wfile.write(b": keep-alive\n\n")
+        for word in body["messages"][0]["content"].split(" "):
+            time.sleep(self.delay)
+            event = {"code": 0, "data": {"choices": [{"delta": {"content": word + " "}}]}}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.write(b'data: {"unreachable": true}\n\n')
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
 class TestXinchenLLMServer(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -18,5 +78,126 @@ class TestXinchenLLMServer(unittest.TestCase):
             print(chunk, end="", flush=True)
 
 
+class TestXinchenLLMServerPooling(unittest.TestCase):
+    def setUp(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubChatHandler)
+        self.httpd.connections = set()
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/chat/completions"
+        self.llm = XinchenLLMServer(url=url, pool_size=4)
+
+    def tearDown(self):
+        self.llm.close()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @staticmethod
+    def _content(resp: dict) -> str:
+        return json.loads(resp["data"])["data"]["choices"][0]["message"]["content"]
+
+    def test_generate_many_keeps_order_and_reuses_connections(self):
+        prompts = [f"prompt-{idx}" for idx in range(40)]
+        resps = self.llm.generate_many(prompts)
+
+        self.assertEqual([self._content(resp) for resp in resps], prompts)
+        self.assertLessEqual(len(self.httpd.connections), 4)
+
+    def test_generate_response(self):
+        resp = self.llm.generate("hello")
+        self.assertIsInstance(resp, LLMResponse)
+        self.assertEqual((resp.content, resp.status), ("hello", 200))
+        self.assertGreater(resp.latency, 0)
+
+    def test_agenerate(self):
+        async def main():
+            return await asyncio.gather(*[self.llm.agenerate(f"p{idx}") for idx in range(10)])
+
+        resps = asyncio.run(main())
+        self.assertEqual([self._content(resp) for resp in resps], [f"p{idx}" for idx in range(10)])
+        self.assertLessEqual(len(self.httpd.connections), 4)
+
+
+class TestXinchenLLMServerStreaming(unittest.TestCase):
+    def setUp(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubSSEHandler)
+        self.httpd.bodies = []
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/chat/completions"
+        self.llm = XinchenLLMServer(url=url, pool_size=2)
+
+    def tearDown(self):
+        self.llm.close()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def test_stream(self):
+        stream = self.llm.generate(
+            "one two three four", stream=True, model="my-model", temperature=0, max_tokens=7
+        )
+        chunks = list(stream)
+
+        self.assertEqual(chunks, ["one ", "two ", "three ", "four "])
+        self.assertEqual(stream.text, "one two three four ")
+
+        body = self.httpd.bodies[0]
+        self.assertTrue(body["stream"])
+        self.assertEqual(
+            (body["model"], body["temperature"], body["max_tokens"]), ("my-model", 0, 7)
+        )
+
+        stats = stream.stats.to_dict()
+        self.assertEqual(stats["n_chunks"], 4)
+        self.assertGreater(stats["ttft"], 0)
+        self.assertEqual(len(stream.stats.inter_token_latencies), 3)
+        self.assertGreaterEqual(min(stream.stats.inter_token_latencies), 0.01)
+
+        summary = self.llm.stream_stats()
+        self.assertEqual(summary["n_streams"], 1)
+        self.assertIsNotNone(summary["p95_itl"])
+
+    def test_first_delta_before_stream_ends(self):
+        with self.llm.generate(" ".join(["word"] * 20), stream=True) as stream:
+            next(stream)
+            # 首个增量在服务端发送完所有事件之前就已经到达
+            self.assertLess(stream.stats.ttft, _StubSSEHandler.delay * 5)
+        self.assertEqual(self.llm.stream_stats()["n_streams"], 1)
+
+
+class TestSSEParsing(unittest.TestCase):
+    def test_iter_sse_deltas(self):
+        lines = [
+            b": comment",
+            b"event: message",
+            b'data: {"choices": [{"delta": {"content": "a"}}]}',
+            b"",
+            b'data: {"choices": [{"delta": {}}]}',
+            b"",
+            b'data: {"choices":',
+            b'data: [{"delta": {"content": "b"}}]}',
+            b"",
+            b"data: [DONE]",
+            b"",
+            b'data: {"choices": [{"delta": {"content": "c"}}]}',
+        ]
+        self.assertEqual(list(iter_sse_deltas(lines)), ["a", "b"])
+
+    def test_error_event(self):
+        lines = ['data: {"code": 1, "msg": "overloaded", "status": 503}', ""]
+        with self.assertRaises(LLMServerError) as context:
+            list(iter_sse_deltas(lines))
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertTrue(context.exception.retryable)
+
+        lines = ['data: {"code": 1, "msg": "bad prompt", "status": 400}', ""]
+        with self.assertRaises(LLMServerError) as context:
+            list(iter_sse_deltas(lines))
+        self.assertFalse(context.exception.retryable)
+
+        # 没有状态码的错误事件视为可以重试
+        with self.assertRaises(LLMServerError) as context:
+            list(iter_sse_deltas(['data: {"code": 1, "msg": "overloaded"}', ""]))
+        self.assertTrue(context.exception.retryable)
+
+
 if __name__ == "__main__":
     unittest.main()